@@ -451,6 +451,92 @@ else:
     attention_function_single_head_spatial = normal_attention_single_head_spatial
 
 
+def attention_masked(q, k, v, heads, mask):
+    """attention_function with a (batch, 1, queries, keys) additive mask; xformers only takes 3D masks here, so PyTorch attention is used instead."""
+
+    if attention_function is attention_xformers:
+        return attention_pytorch(q, k, v, heads, mask)
+
+    return attention_function(q, k, v, heads, mask)
+
+
+def layer_size(height, width, length):
+    """(h, w) of a UNet feature map with `length` positions for a (height, width) latent, or None."""
+
+    for factor in (1, 2, 4, 8, 16, 32, 64):
+        h, w = -(-height // factor), -(-width // factor)
+        if h * w == length:
+            return h, w
+
+    return None
+
+
+class RegionalAttention:
+    """
+    Cross-attention masks for regional conditioning, so that several area/mask conds run as one full-frame forward.
+
+    `weights` (batch, regions, H, W) is the latent-resolution weight of each region and `token_regions` the region of
+    every context token (the region contexts are concatenated). For a layer with L queries the weights are resized to
+    that layer's resolution and become an additive bias log(weight) for each (query, token); queries that no region
+    covers attend to all tokens. Biases are computed once per (L, dtype, device) and cached.
+    """
+
+    def __init__(self, weights, token_regions):
+        self.weights = weights
+        self.token_regions = token_regions
+        self.biases = {}
+
+    def bias(self, length, dtype, device):
+        key = (length, dtype, device)
+        bias = self.biases.get(key, None)
+        if bias is not None:
+            return bias
+
+        batch, regions, height, width = self.weights.shape
+        size = layer_size(height, width, length)
+        if size is None:
+            return None
+
+        weights = self.weights.to(device=device, dtype=torch.float32)
+        if size != (height, width):
+            weights = torch.nn.functional.interpolate(weights, size=size, mode="area")
+
+        weights = weights.reshape(batch, regions, length)
+        bias = torch.where(weights > 0, weights.clamp_min(1e-12).log(), torch.finfo(dtype).min)
+        bias = torch.where(weights.sum(dim=1, keepdim=True) > 0, bias, 0.0)
+
+        bias = bias[:, self.token_regions.to(device)].transpose(1, 2).to(dtype).contiguous()
+        self.biases[key] = bias
+        return bias
+
+
+def regional_attention_mask(transformer_options, x, context):
+    """
+    Additive cross-attention mask (batch, 1, queries, tokens) for the chunks of the batch that carry a RegionalAttention
+    in transformer_options["regional_attention"] (one entry per cond/uncond chunk, None for plain chunks), or None.
+    """
+
+    regions = transformer_options.get("regional_attention", None)
+    if regions is None or context is None:
+        return None
+
+    length, tokens = x.shape[1], context.shape[1]
+    chunk = x.shape[0] // len(regions)
+
+    masks = []
+    for region in regions:
+        bias = None if region is None else region.bias(length, x.dtype, x.device)
+
+        if bias is None or tokens % bias.shape[2] != 0 or bias.shape[0] != chunk:
+            if region is not None:
+                return None
+            masks.append(torch.zeros((chunk, length, tokens), dtype=x.dtype, device=x.device))
+        else:
+            masks.append(bias.repeat(1, 1, tokens // bias.shape[2]))
+
+    return torch.cat(masks).unsqueeze(1)
+
+
 class AttentionProcessorForge:
     def __call__(self, attn, hidden_states, encoder_hidden_states, attention_mask=None, temb=None, *args, **kwargs):
         residual = hidden_states
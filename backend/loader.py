@@ -14,7 +14,7 @@ from transformers import modeling_utils
 
 from backend import memory_management
 from backend.args import args
-from backend.utils import read_arbitrary_config, load_torch_file, beautiful_print_gguf_state_dict_statics, KeyPrefixView, CastOnGetView
+from backend.utils import read_arbitrary_config, load_torch_file, beautiful_print_gguf_state_dict_statics, KeyPrefixView, CastOnGetView, LazySafetensorsDict, SafetensorsHeaderDict
 from backend.state_dict import try_filter_state_dict, load_state_dict
 from backend.operations import using_forge_operations
 from backend.nn.vae import IntegratedAutoencoderKL
@@ -570,6 +570,21 @@ def preprocess_state_dict(sd):
     return sd
 
 
+def guess_with_header(func, header, sd):
+    """
+    func(header) when `header` (a SafetensorsHeaderDict view of `sd`) is available and func only needs key names,
+    shapes and dtypes; otherwise, or when func reads tensor values (meta tensors raise), func(sd).
+    """
+
+    if header is not None:
+        try:
+            return func(header)
+        except Exception:
+            _trace.event("guess_header_fallback", func=getattr(func, "__name__", str(func)))
+
+    return func(sd)
+
+
 def split_state_dict(sd, additional_state_dicts: list = None):
     try:
         _trace.event("load_torch_file_start", path=str(sd))
@@ -581,13 +596,18 @@ def split_state_dict(sd, additional_state_dicts: list = None):
     except Exception:
         pass
 
+    # key names, shapes and dtypes straight from the safetensors header, so guessing does not read tensors
+    header = SafetensorsHeaderDict(sd.filepath) if isinstance(sd, LazySafetensorsDict) else None
+
     _trace.event("preprocess_start")
     sd = preprocess_state_dict(sd)
+    if header is not None:
+        header = preprocess_state_dict(header)
     _trace.event("preprocess_done")
 
     _trace.event("guess_start")
-    guess = huggingface_guess.guess(sd)
-    _trace.event("guess_done")
+    guess = guess_with_header(huggingface_guess.guess, header, sd)
+    _trace.event("guess_done", from_header=header is not None)
 
     if isinstance(additional_state_dicts, list):
         _trace.event("replace_additional_start", count=len(additional_state_dicts))
@@ -598,8 +618,12 @@ def split_state_dict(sd, additional_state_dicts: list = None):
         _trace.event("replace_additional_done")
 
     _trace.event("guess_targets_start")
-    guess.clip_target = guess.clip_target(sd)
-    guess.model_type = guess.model_type(sd)
+    if additional_state_dicts:
+        # separate VAE/text encoder files replaced parts of the state dict, so the header no longer describes it
+        header = None
+
+    guess.clip_target = guess_with_header(guess.clip_target, header, sd)
+    guess.model_type = guess_with_header(guess.model_type, header, sd)
     guess.ztsnr = 'ztsnr' in sd
     _trace.event("guess_targets_done")
 
@@ -658,6 +682,33 @@ if not chroma_is_in_huggingface_guess:
             'guidance_n_layers': 5
         }
         unet_remove_config = ['guidance_embed']
+
+
+def describe_checkpoint(filename):
+    """
+    Architecture of a .safetensors checkpoint from its header alone, without reading any tensor data:
+    {"architecture", "repo", "parameters"}, or None when the model type cannot be guessed from key names and shapes.
+    """
+
+    header = SafetensorsHeaderDict(filename)
+
+    try:
+        guess = huggingface_guess.guess(preprocess_state_dict(header))
+    except Exception:
+        return None
+
+    if guess is None:
+        return None
+
+    architecture = type(guess).__name__
+    repo = guess.huggingface_repo
+
+    if not chroma_is_in_huggingface_guess and repo == "black-forest-labs/FLUX.1-schnell" and any(k.endswith("distilled_guidance_layer.layers.0.in_layer.bias") for k in header):
+        architecture = repo = GuessChroma.huggingface_repo
+
+    return {"architecture": architecture, "repo": repo, "parameters": header.parameters()}
+
+
 @torch.inference_mode()
 def forge_loader(sd, additional_state_dicts=None):
     try:
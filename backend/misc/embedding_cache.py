@@ -0,0 +1,165 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+
+def hash_tensor(tensor) -> str:
+    """Content hash of a tensor or numpy array (dtype, shape and data)."""
+
+    if isinstance(tensor, torch.Tensor):
+        tensor = tensor.detach().cpu()
+        if tensor.dtype == torch.bfloat16:
+            tensor = tensor.float()
+        tensor = tensor.numpy()
+
+    tensor = np.ascontiguousarray(tensor)
+
+    h = hashlib.blake2b(digest_size=16)
+    h.update(f"{tensor.dtype.str}{tensor.shape}".encode())
+    h.update(memoryview(tensor).cast("B"))
+    return h.hexdigest()
+
+
+def value_nbytes(value) -> int:
+    if isinstance(value, torch.Tensor):
+        return value.numel() * value.element_size()
+
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+
+    if isinstance(value, dict):
+        return sum(value_nbytes(v) for v in value.values())
+
+    if isinstance(value, (list, tuple)):
+        return sum(value_nbytes(v) for v in value)
+
+    return 0
+
+
+def value_to_cpu(value):
+    if isinstance(value, torch.Tensor):
+        return value.detach().to("cpu", copy=True)
+
+    if isinstance(value, dict):
+        return {k: value_to_cpu(v) for k, v in value.items()}
+
+    if isinstance(value, (list, tuple)):
+        return type(value)(value_to_cpu(v) for v in value)
+
+    return value
+
+
+class EmbeddingCache:
+    """
+    LRU cache of image embeddings and other derived values (CPU tensors/arrays, or dicts and lists of them) with a
+    byte budget.
+
+    The budget in MB and disk persistence are read from the options named by `budget_option` and `disk_option`, so
+    they can change at runtime. With disk persistence, entries are also written to the `subsection` disk cache
+    (modules.cache) and survive restarts; with `spill_evicted`, only entries evicted from RAM are written there.
+    """
+
+    def __init__(self, subsection, budget_option, disk_option, default_budget_mb=256, spill_evicted=False):
+        self.subsection = subsection
+        self.budget_option = budget_option
+        self.disk_option = disk_option
+        self.default_budget_mb = default_budget_mb
+        self.spill_evicted = spill_evicted
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def budget(self) -> int:
+        from modules.shared import opts
+        return int(opts.data.get(self.budget_option, self.default_budget_mb)) * 1024 * 1024
+
+    def disk(self):
+        from modules.shared import opts
+        if not opts.data.get(self.disk_option, False):
+            return None
+
+        from modules import cache
+        return cache.cache(self.subsection)
+
+    def get(self, key):
+        if self.budget() <= 0:
+            return None
+
+        with self.lock:
+            value = self.entries.get(key, None)
+            if value is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        disk = self.disk()
+        if disk is not None:
+            value = disk.get(key, None)
+            if value is not None:
+                self.put(key, value, persist=False)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+
+        return value
+
+    def put(self, key, value, persist=True):
+        budget = self.budget()
+        if budget <= 0:
+            return value
+
+        value = value_to_cpu(value)
+        nbytes = value_nbytes(value)
+        if nbytes > budget:
+            return value
+
+        evicted = []
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= value_nbytes(old)
+
+            self.entries[key] = value
+            self.size += nbytes
+
+            while self.size > budget:
+                old_key, old = self.entries.popitem(last=False)
+                self.size -= value_nbytes(old)
+                evicted.append((old_key, old))
+
+        if self.spill_evicted:
+            to_disk = evicted
+        else:
+            to_disk = [(key, value)] if persist else []
+
+        if to_disk:
+            disk = self.disk()
+            if disk is not None:
+                for k, v in to_disk:
+                    disk.set(k, v)
+
+        return value
+
+    def get_or_compute(self, key, compute):
+        value = self.get(key)
+        if value is None:
+            value = self.put(key, compute())
+
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+clip_vision_cache = EmbeddingCache('clip-vision-embeddings', 'image_embedding_cache_mb', 'image_embedding_cache_disk')
+face_embedding_cache = EmbeddingCache('face-embeddings', 'image_embedding_cache_mb', 'image_embedding_cache_disk')
@@ -0,0 +1,132 @@
+import logging
+
+from backend import memory_management, utils
+
+
+logger = logging.getLogger(__name__)
+
+admission_modes = ("Allow", "Reject if it cannot fit", "Reject if weights would be swapped")
+
+current_plan = None
+
+
+class InsufficientMemory(RuntimeError):
+    """Raised before sampling when a request cannot run within the VRAM budget; the API answers it with 503."""
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.status_code = 503  # api.handle_exception reads instance attributes only
+
+
+def opt(name, default):
+    from modules.shared import opts
+    return opts.data.get(name, default)
+
+
+def enabled():
+    return bool(opt("vram_planner", False))
+
+
+def budget(device):
+    """Memory the planner may use on `device`: total memory minus the reserve for the CUDA context, other processes and fragmentation."""
+
+    return memory_management.get_total_memory(device) - int(opt("vram_planner_reserve_mb", 768)) * 1024 * 1024
+
+
+def mb(x):
+    return x / (1024 * 1024)
+
+
+class SamplingPlan:
+    """
+    Peak memory of one sampling pass and the decisions derived from it.
+
+    `max_rows` is the number of latents (cond and uncond rows together) that one model forward may take;
+    `calc_cond_uncond_batch` splits to it instead of probing free memory every step. Splitting the batch is
+    preferred over swapping weights: `swap` is only set when even one cond entry does not fit next to the
+    fully loaded weights, and then `activation` (passed to `load_models_gpu` as the inference memory) is
+    the memory of one entry, so the model keeps as many weights on the GPU as that allows.
+    """
+
+    def __init__(self, device, budget, weights, extra, per_row, rows, entry_rows):
+        self.device = device
+        self.budget = budget
+        self.weights = weights
+        self.extra = extra
+        self.per_row = per_row
+        self.rows = rows
+
+        available = budget - weights - extra
+        fitting_rows = int(available // per_row) if per_row > 0 else rows
+
+        self.swap = fitting_rows < entry_rows
+        self.max_rows = max(entry_rows, min(rows, fitting_rows // entry_rows * entry_rows))
+        self.activation = self.max_rows * per_row
+        self.minimum = extra + entry_rows * per_row
+        self.fits = self.minimum <= budget
+        self.peak = budget if self.swap else weights + extra + self.activation
+
+    def summary(self):
+        decision = f"weights swapped, {self.max_rows} latents per forward" if self.swap else f"{self.max_rows} of {self.rows} latents per forward"
+        return f"peak {mb(self.peak):.0f} MB of {mb(self.budget):.0f} MB (weights {mb(self.weights):.0f} MB, extra {mb(self.extra):.0f} MB, activations {mb(self.activation):.0f} MB): {decision}"
+
+
+def unet_memory(unet):
+    """Weights and non-activation inference memory of a UNet/DiT patcher with its ControlNets and online LoRAs."""
+
+    patchers = [unet, *unet.extra_model_patchers_during_sampling]
+    extra = unet.extra_preserved_memory_during_sampling
+
+    if unet.controlnet_linked_list is not None:
+        extra += unet.controlnet_linked_list.inference_memory_requirements(unet.model_dtype())
+        patchers += unet.controlnet_linked_list.get_models()
+
+    weights = sum(x.model_size() for x in {id(x): x for x in patchers}.values())
+
+    if unet.has_online_lora():
+        extra += utils.nested_compute_size(unet.lora_patches, element_size=utils.dtype_to_element_size(unet.model.computation_dtype))
+
+    return weights, extra
+
+
+def plan_sampling(unet, shape, conds=2):
+    """Plan for sampling a latent of `shape` (B, C, H, W) with `conds` cond entries per step (cond and uncond: 2)."""
+
+    B, C, H, W = shape
+    device = unet.load_device
+
+    estimate = unet.model_options.get('memory_peak_estimation_modifier', unet.memory_required)
+    per_row = estimate([B, C, H, W]) / B
+    weights, extra = unet_memory(unet)
+
+    return SamplingPlan(device, budget(device), weights, extra, per_row, B * conds, B)
+
+
+def plan_request(unet, vae, batch_size, sizes):
+    """Sampling plans for each (name, (width, height)) pass of a request, e.g. the first pass and the hires pass."""
+
+    return [(name, plan_sampling(unet, (batch_size, vae.latent_channels, height // vae.downscale_ratio, width // vae.downscale_ratio))) for name, (width, height) in sizes]
+
+
+def vae_decode_batch(vae, shape):
+    """Images per VAE decode call that fit next to the VAE weights, or 0 when a single image does not and the decode should be tiled."""
+
+    per_image = vae.memory_used_decode(shape, vae.vae_dtype)
+    available = budget(vae.device) - vae.patcher.model_size()
+
+    return max(0, int(available // per_image))
+
+
+def admit(plans, label="request"):
+    """Rejects a request whose plans do not fit according to `vram_planner_admission`; logs the plans otherwise."""
+
+    mode = opt("vram_planner_admission", admission_modes[1])
+
+    for name, plan in plans:
+        logger.info("VRAM plan for %s (%s): %s", label, name, plan.summary())
+
+        if mode == admission_modes[1] and not plan.fits:
+            raise InsufficientMemory(f"{name} needs at least {mb(plan.minimum):.0f} MB of VRAM for one forward, more than the {mb(plan.budget):.0f} MB budget; lower the resolution or batch size")
+
+        if mode == admission_modes[2] and (plan.swap or not plan.fits):
+            raise InsufficientMemory(f"{name} would swap model weights to system memory ({plan.summary()}); lower the resolution or batch size")
@@ -1,7 +1,7 @@
 import torch
 import math
 
-from typing import Tuple, Callable
+from typing import Tuple, Callable, List
 
 
 def do_nothing(x: torch.Tensor, mode: str = None):
@@ -21,7 +21,7 @@ def mps_gather_workaround(input, dim, index):
 
 def bipartite_soft_matching_random2d(metric: torch.Tensor,
                                      w: int, h: int, sx: int, sy: int, r: int,
-                                     no_rand: bool = False) -> Tuple[Callable, Callable]:
+                                     no_rand: bool = False, return_index: bool = False):
     """
     Partitions the tokens into src and dst and merges r tokens from src to dst.
     Dst tokens are partitioned by choosing one randomy in each (sx, sy) region.
@@ -33,10 +33,13 @@ def bipartite_soft_matching_random2d(metric: torch.Tensor,
      - sy: stride in the y dimension for dst, must divide h
      - r: number of tokens to remove (by merging)
      - no_rand: if true, disable randomness (use top left corner only)
+     - return_index: if true, also return the original token index [B, N - r, 1] of every merged token
     """
     B, N, _ = metric.shape
 
     if r <= 0 or w == 1 or h == 1:
+        if return_index:
+            return do_nothing, do_nothing, None
         return do_nothing, do_nothing
 
     gather = mps_gather_workaround if metric.device.type == "mps" else torch.gather
@@ -121,6 +124,12 @@ def bipartite_soft_matching_random2d(metric: torch.Tensor,
 
         return out
 
+    if return_index:
+        # merge() outputs [unm | dst], so these are the source positions of the merged sequence
+        unm_pos = gather(a_idx.expand(B, a_idx.shape[1], 1), dim=1, index=unm_idx)
+        kept_idx = torch.cat([unm_pos, b_idx.expand(B, num_dst, 1)], dim=1)
+        return merge, unmerge, kept_idx
+
     return merge, unmerge
 
 
@@ -160,3 +169,98 @@ class TomePatcher:
         m.set_model_attn1_patch(tomesd_m)
         m.set_model_attn1_output_patch(tomesd_u)
         return m
+
+
+def parse_block_schedule(schedule: str, ratio: float, num_blocks: int) -> List[float]:
+    """
+    Expands a block schedule into one merge ratio per transformer block.
+    The schedule is a comma-separated list of `start-end[:ratio]` entries (both ends inclusive, either may be
+    omitted), e.g. `0-18, 19-:0.3`. Blocks not listed are not merged. An empty schedule merges every block
+    except the first and the last one, which are the most sensitive to merging.
+    """
+    ratios = [0.0] * num_blocks
+
+    if not schedule or not schedule.strip():
+        for i in range(1, num_blocks - 1):
+            ratios[i] = ratio
+        return ratios
+
+    for entry in schedule.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+
+        span, _, entry_ratio = entry.partition(':')
+        entry_ratio = float(entry_ratio) if entry_ratio.strip() else ratio
+
+        start, sep, end = span.partition('-')
+        start = int(start) if start.strip() else 0
+        end = (int(end) if end.strip() else num_blocks - 1) if sep else start
+
+        for i in range(max(start, 0), min(end, num_blocks - 1) + 1):
+            ratios[i] = entry_ratio
+
+    return ratios
+
+
+class DiTMergedTokens:
+    """
+    Image tokens of one DiT block after merging.
+    The block runs on `img`, and `unmerge` adds the block update back onto the original tokens, so src tokens
+    receive the update of the dst token they were merged into instead of being overwritten by it.
+    """
+
+    def __init__(self, source, merge, unmerge, index):
+        self.source = source
+        self.img = merge(source)
+        self.index = index
+        self._unmerge = unmerge
+
+    def gather(self, x):
+        # Picks per-token data (e.g. position ids) for the merged sequence
+        gather = mps_gather_workaround if x.device.type == "mps" else torch.gather
+        return gather(x, dim=1, index=self.index.expand(x.shape[0], self.index.shape[1], x.shape[-1]))
+
+    def unmerge(self, out):
+        return self.source + self._unmerge(out - self.img)
+
+
+class DiTTokenMerging:
+    """
+    Token merging for joint text-image attention models (Flux, Chroma, SD3 MMDiT).
+    Only image tokens are merged; text tokens are passed through untouched. Merging is applied per block
+    according to the block schedule and undone after every merged block, so the final layer always sees the
+    full token grid.
+    """
+
+    def __init__(self, ratio, schedule, w, h, num_blocks):
+        self.w = w
+        self.h = h
+        self.ratios = parse_block_schedule(schedule, ratio, num_blocks)
+
+    @staticmethod
+    def from_transformer_options(transformer_options, w, h, num_blocks):
+        options = transformer_options.get('tome_dit', None)
+        if options is None or options['ratio'] <= 0:
+            return None
+        return DiTTokenMerging(options['ratio'], options.get('schedule', ''), w, h, num_blocks)
+
+    def merge(self, block_index, img):
+        ratio = self.ratios[block_index] if block_index < len(self.ratios) else 0.0
+        if ratio <= 0:
+            return None
+
+        r = int(img.shape[1] * ratio)
+        m, u, index = bipartite_soft_matching_random2d(img, self.w, self.h, 2, 2, r, return_index=True)
+
+        if index is None:
+            return None
+
+        return DiTMergedTokens(img, m, u, index)
+
+
+class TomeDiTPatcher:
+    def patch(self, model, ratio, schedule=''):
+        m = model.clone()
+        m.set_transformer_option('tome_dit', dict(ratio=ratio, schedule=schedule))
+        return m
@@ -0,0 +1,137 @@
+import logging
+import os
+import threading
+
+import torch
+
+
+logger = logging.getLogger(__name__)
+
+compile_targets = ("UNet/DiT", "VAE")
+compile_modes = ("default", "reduce-overhead", "max-autotune")
+
+disk_cache_ready = False
+
+
+def opt(name, default):
+    from modules.shared import opts
+    return opts.data.get(name, default)
+
+
+def setup_disk_cache():
+    """Points the inductor FX graph cache and AOTAutograd cache at `<cache dir>/torch-compile`, so warm restarts reuse compiled kernels."""
+
+    global disk_cache_ready
+
+    if disk_cache_ready:
+        return
+
+    from modules import cache
+
+    directory = os.path.join(cache.cache_dir, "torch-compile")
+    os.makedirs(directory, exist_ok=True)
+
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", directory)
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    os.environ.setdefault("TORCHINDUCTOR_AUTOGRAD_CACHE", "1")
+
+    try:
+        import torch._inductor.config as inductor_config
+        inductor_config.fx_graph_cache = True
+    except ImportError:
+        pass
+
+    try:
+        import torch._functorch.config as functorch_config
+        if hasattr(functorch_config, "enable_autograd_cache"):
+            functorch_config.enable_autograd_cache = True
+    except ImportError:
+        pass
+
+    disk_cache_ready = True
+
+
+def shape_key(*tensors):
+    return tuple((tuple(t.shape), t.dtype, t.device.type) if isinstance(t, torch.Tensor) else None for t in tensors)
+
+
+def has_online_loras(module: torch.nn.Module) -> bool:
+    return any(hasattr(m, "forge_online_loras") for m in module.modules())
+
+
+class CompiledFunction:
+    """
+    Opt-in torch.compile wrapper for a module or a bound method (UNet/DiT forward, VAE decode/encode).
+
+    Enabled per target by `torch_compile` + `torch_compile_targets`. Graphs are specialized (dynamic=False) per key
+    of input shapes/dtypes; at most `torch_compile_max_shapes` keys are compiled, later keys run eagerly instead of
+    recompiling. Calls whose `patched` callback returns True (ControlNet residuals, transformer patches, online LoRA),
+    and keys whose compilation failed, also run eagerly.
+    """
+
+    def __init__(self, function, target):
+        self.function = function
+        self.target = target
+        self.compiled = None
+        self.compiled_with = None
+        self.keys = set()
+        self.failed = set()
+        self.lock = threading.Lock()
+
+    def enabled(self) -> bool:
+        return opt("torch_compile", False) and self.target in opt("torch_compile_targets", list(compile_targets))
+
+    def get_compiled(self):
+        settings = (opt("torch_compile_mode", "default"), opt("torch_compile_backend", "inductor"))
+
+        with self.lock:
+            if self.compiled is None or self.compiled_with != settings:
+                setup_disk_cache()
+
+                import torch._dynamo
+                max_shapes = int(opt("torch_compile_max_shapes", 8))
+                torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, max_shapes)
+
+                mode, backend = settings
+                self.compiled = torch.compile(self.function, mode=None if mode == "default" else mode, backend=backend, dynamic=False)
+                self.compiled_with = settings
+                self.keys.clear()
+                self.failed.clear()
+
+            return self.compiled
+
+    def __call__(self, key, *args, patched=None, **kwargs):
+        if not self.enabled() or key in self.failed or (patched is not None and patched()):
+            return self.function(*args, **kwargs)
+
+        compiled = self.get_compiled()
+
+        if key not in self.keys:
+            if len(self.keys) >= int(opt("torch_compile_max_shapes", 8)):
+                return self.function(*args, **kwargs)
+
+            self.keys.add(key)
+            logger.info("torch.compile: compiling %s for %s", self.target, key)
+
+        import torch._dynamo
+
+        try:
+            return compiled(*args, **kwargs)
+        except torch._dynamo.exc.TorchDynamoException as e:
+            self.keys.discard(key)
+            self.failed.add(key)
+            logger.warning("torch.compile failed for %s %s, running eagerly: %s", self.target, key, e)
+            return self.function(*args, **kwargs)
+
+
+def compiled_function(owner, name, target) -> CompiledFunction:
+    """CompiledFunction for `owner` itself (name=None) or its method `name`, created once and stored on `owner`."""
+
+    attr = f"forge_compiled_{name or 'forward'}"
+    function = owner.__dict__.get(attr, None)
+
+    if function is None:
+        function = CompiledFunction(owner if name is None else getattr(owner, name), target)
+        object.__setattr__(owner, attr, function)
+
+    return function
@@ -1,6 +1,7 @@
 import torch
 
 from backend import memory_management, attention
+from backend.misc import torch_compile
 from backend.modules.k_prediction import k_prediction_from_diffusers_scheduler
 
 
@@ -42,7 +43,12 @@ class KModel(torch.nn.Module):
                     extra = extra.to(dtype)
             extra_conds[o] = extra
 
-        model_output = self.diffusion_model(xc, t, context=context, control=control, transformer_options=transformer_options, **extra_conds).float()
+        def graph_patched():
+            return control is not None or bool(transformer_options.get("patches")) or bool(transformer_options.get("patches_replace")) or transformer_options.get("regional_attention") is not None or torch_compile.has_online_loras(self.diffusion_model)
+
+        forward = torch_compile.compiled_function(self.diffusion_model, None, "UNet/DiT")
+        key = torch_compile.shape_key(xc, context, *extra_conds.values())
+        model_output = forward(key, xc, t, context=context, control=control, transformer_options=transformer_options, patched=graph_patched, **extra_conds).float()
         return self.predictor.calculate_denoised(sigma, model_output, x)
 
     def memory_required(self, input_shape):
@@ -10,6 +10,7 @@ from einops import rearrange, repeat
 from backend.attention import attention_function
 from backend.utils import fp16_fix, tensor2parameter
 from backend.nn.flux import attention, rope, timestep_embedding, EmbedND, MLPEmbedder, RMSNorm, QKNorm, SelfAttention
+from backend.misc.tomesd import DiTTokenMerging
 
 class Approximator(nn.Module):
     def __init__(self, in_dim: int, out_dim: int, hidden_dim: int, n_layers = 4):
@@ -243,7 +244,7 @@ class IntegratedChromaTransformer2DModel(nn.Module):
                 idx += 2  # Advance by 2 vectors
         return block_dict
         
-    def inner_forward(self, img, img_ids, txt, txt_ids, timesteps):
+    def inner_forward(self, img, img_ids, txt, txt_ids, timesteps, tome=None):
         if img.ndim != 3 or txt.ndim != 3:
             raise ValueError("Input img and txt tensors must have 3 dimensions.")
         img = self.img_in(img)
@@ -264,20 +265,40 @@ class IntegratedChromaTransformer2DModel(nn.Module):
         
         txt = self.txt_in(txt)
         ids = torch.cat((txt_ids, img_ids), dim=1)
-        del txt_ids, img_ids
         pe = self.pe_embedder(ids)
         del ids
         for i, block in enumerate(self.double_blocks):
             img_mod = mod_vectors_dict[f"double_blocks.{i}.img_mod.lin"]
             txt_mod = mod_vectors_dict[f"double_blocks.{i}.txt_mod.lin"]
             double_mod = [img_mod, txt_mod]
-            img, txt = block(img=img, txt=txt, mod=double_mod, pe=pe)
-        img = torch.cat((txt, img), 1)
-        for i, block in enumerate(self.single_blocks):
-            single_mod = mod_vectors_dict[f"single_blocks.{i}.modulation.lin"]
-            img = block(img, mod=single_mod, pe=pe)
-        del pe
-        img = img[:, txt.shape[1]:, ...]
+            merged = tome.merge(i, img) if tome is not None else None
+            if merged is None:
+                img, txt = block(img=img, txt=txt, mod=double_mod, pe=pe)
+            else:
+                merged_pe = self.pe_embedder(torch.cat((txt_ids, merged.gather(img_ids)), dim=1))
+                img_m, txt = block(img=merged.img, txt=txt, mod=double_mod, pe=merged_pe)
+                img = merged.unmerge(img_m)
+                del merged, merged_pe, img_m
+        if tome is None:
+            img = torch.cat((txt, img), 1)
+            for i, block in enumerate(self.single_blocks):
+                single_mod = mod_vectors_dict[f"single_blocks.{i}.modulation.lin"]
+                img = block(img, mod=single_mod, pe=pe)
+            img = img[:, txt.shape[1]:, ...]
+        else:
+            txt_len = txt.shape[1]
+            for i, block in enumerate(self.single_blocks):
+                single_mod = mod_vectors_dict[f"single_blocks.{i}.modulation.lin"]
+                merged = tome.merge(nb_double_block + i, img)
+                if merged is None:
+                    x = block(torch.cat((txt, img), 1), mod=single_mod, pe=pe)
+                    txt, img = x[:, :txt_len], x[:, txt_len:]
+                    continue
+                merged_pe = self.pe_embedder(torch.cat((txt_ids, merged.gather(img_ids)), dim=1))
+                x = block(torch.cat((txt, merged.img), 1), mod=single_mod, pe=merged_pe)
+                txt, img = x[:, :txt_len], merged.unmerge(x[:, txt_len:])
+                del merged, merged_pe, x
+        del pe, txt_ids, img_ids
         final_mod = mod_vectors_dict["final_layer.adaLN_modulation.1"]
         img = self.final_layer(img, final_mod)
         return img
@@ -300,7 +321,8 @@ class IntegratedChromaTransformer2DModel(nn.Module):
         img_ids = repeat(img_ids, "h w c -> b (h w) c", b=bs)
         txt_ids = torch.zeros((bs, context.shape[1], 3), device=input_device, dtype=input_dtype)
         del input_device, input_dtype
-        out = self.inner_forward(img, img_ids, context, txt_ids, timestep)
+        tome = DiTTokenMerging.from_transformer_options(kwargs.get('transformer_options', {}), w_len, h_len, len(self.double_blocks) + len(self.single_blocks))
+        out = self.inner_forward(img, img_ids, context, txt_ids, timestep, tome=tome)
         del img, img_ids, txt_ids, timestep, context
         out = rearrange(out, "b (h w) (c ph pw) -> b c (h ph) (w pw)", h=h_len, w=w_len, ph=2, pw=2)[:, :, :h, :w]
         del h_len, w_len, bs
@@ -10,6 +10,7 @@ from torch import nn
 from einops import rearrange, repeat
 from backend.attention import attention_function
 from backend.utils import fp16_fix, tensor2parameter
+from backend.misc.tomesd import DiTTokenMerging
 
 
 def attention(q, k, v, pe):
@@ -369,7 +370,7 @@ class IntegratedFluxTransformer2DModel(nn.Module):
 
         self.final_layer = LastLayer(self.hidden_size, 1, self.out_channels)
 
-    def inner_forward(self, img, img_ids, txt, txt_ids, timesteps, y, guidance=None):
+    def inner_forward(self, img, img_ids, txt, txt_ids, timesteps, y, guidance=None, tome=None):
         if img.ndim != 3 or txt.ndim != 3:
             raise ValueError("Input img and txt tensors must have 3 dimensions.")
         img = self.img_in(img)
@@ -382,17 +383,35 @@ class IntegratedFluxTransformer2DModel(nn.Module):
         txt = self.txt_in(txt)
         del y, guidance
         ids = torch.cat((txt_ids, img_ids), dim=1)
-        del txt_ids, img_ids
         pe = self.pe_embedder(ids)
         del ids
-        for block in self.double_blocks:
-            img, txt = block(img=img, txt=txt, vec=vec, pe=pe)
-        img = torch.cat((txt, img), 1)
-        for block in self.single_blocks:
-            img = block(img, vec=vec, pe=pe)
-        del pe
-        img = img[:, txt.shape[1]:, ...]
-        del txt
+        for i, block in enumerate(self.double_blocks):
+            merged = tome.merge(i, img) if tome is not None else None
+            if merged is None:
+                img, txt = block(img=img, txt=txt, vec=vec, pe=pe)
+            else:
+                merged_pe = self.pe_embedder(torch.cat((txt_ids, merged.gather(img_ids)), dim=1))
+                img_m, txt = block(img=merged.img, txt=txt, vec=vec, pe=merged_pe)
+                img = merged.unmerge(img_m)
+                del merged, merged_pe, img_m
+        if tome is None:
+            img = torch.cat((txt, img), 1)
+            for block in self.single_blocks:
+                img = block(img, vec=vec, pe=pe)
+            img = img[:, txt.shape[1]:, ...]
+        else:
+            txt_len = txt.shape[1]
+            for i, block in enumerate(self.single_blocks):
+                merged = tome.merge(len(self.double_blocks) + i, img)
+                if merged is None:
+                    x = block(torch.cat((txt, img), 1), vec=vec, pe=pe)
+                    txt, img = x[:, :txt_len], x[:, txt_len:]
+                    continue
+                merged_pe = self.pe_embedder(torch.cat((txt_ids, merged.gather(img_ids)), dim=1))
+                x = block(torch.cat((txt, merged.img), 1), vec=vec, pe=merged_pe)
+                txt, img = x[:, :txt_len], merged.unmerge(x[:, txt_len:])
+                del merged, merged_pe, x
+        del pe, txt, txt_ids, img_ids
         img = self.final_layer(img, vec)
         del vec
         return img
@@ -415,7 +434,8 @@ class IntegratedFluxTransformer2DModel(nn.Module):
         img_ids = repeat(img_ids, "h w c -> b (h w) c", b=bs)
         txt_ids = torch.zeros((bs, context.shape[1], 3), device=input_device, dtype=input_dtype)
         del input_device, input_dtype
-        out = self.inner_forward(img, img_ids, context, txt_ids, timestep, y, guidance)
+        tome = DiTTokenMerging.from_transformer_options(kwargs.get('transformer_options', {}), w_len, h_len, len(self.double_blocks) + len(self.single_blocks))
+        out = self.inner_forward(img, img_ids, context, txt_ids, timestep, y, guidance, tome=tome)
         del img, img_ids, txt_ids, timestep, context
         out = rearrange(out, "b (h w) (c ph pw) -> b c (h ph) (w pw)", h=h_len, w=w_len, ph=2, pw=2)[:, :, :h, :w]
         del h_len, w_len, bs
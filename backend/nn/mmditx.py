@@ -14,6 +14,8 @@ import torch
 import torch.nn as nn
 from einops import rearrange, repeat
 
+from backend.misc.tomesd import DiTTokenMerging
+
 def attention(q, k, v, heads, mask=None):
     """Convenience wrapper around a basic attention operation"""
     b, _, dim_head = q.shape
@@ -912,6 +914,7 @@ class MMDiTX(nn.Module):
         context: Optional[torch.Tensor] = None,
         skip_layers: Optional[List] = [],
         controlnet_hidden_states: Optional[torch.Tensor] = None,
+        tome: Optional[DiTTokenMerging] = None,
     ) -> torch.Tensor:
         if self.register_length > 0:
             context = torch.cat(
@@ -927,7 +930,13 @@ class MMDiTX(nn.Module):
         for i, block in enumerate(self.joint_blocks):
             if i in skip_layers:
                 continue
-            context, x = block(context, x, c=c_mod)
+            merged = tome.merge(i, x) if tome is not None else None
+            if merged is None:
+                context, x = block(context, x, c=c_mod)
+            else:
+                context, x_m = block(context, merged.img, c=c_mod)
+                x = merged.unmerge(x_m)
+                del merged, x_m
             if controlnet_hidden_states is not None:
                 controlnet_block_interval = len(self.joint_blocks) // len(
                     controlnet_hidden_states
@@ -965,7 +974,10 @@ class MMDiTX(nn.Module):
 
         context = self.context_embedder(context)
 
-        x = self.forward_core_with_concat(x, c, context, skip_layers, control)
+        h_tokens = (hw[0] + self.patch_size - 1) // self.patch_size
+        tome = DiTTokenMerging.from_transformer_options(transformer_options, x.shape[1] // h_tokens, h_tokens, len(self.joint_blocks))
+
+        x = self.forward_core_with_concat(x, c, context, skip_layers, control, tome)
 
         x = self.unpatchify(x, hw=hw)  # (N, out_channels, H, W)
         return x
\ No newline at end of file
@@ -2,7 +2,7 @@ import math
 import torch
 from torch import nn
 from einops import rearrange, repeat
-from backend.attention import attention_function
+from backend.attention import attention_function, attention_masked, regional_attention_mask
 from diffusers.configuration_utils import ConfigMixin, register_to_config
 
 
@@ -151,7 +151,7 @@ class CrossAttention(nn.Module):
             del value
         else:
             v = self.to_v(context)
-        out = attention_function(q, k, v, self.heads, mask)
+        out = attention_function(q, k, v, self.heads, mask) if mask is None else attention_masked(q, k, v, self.heads, mask)
         return self.to_out(out)
 
 
@@ -264,7 +264,7 @@ class BasicTransformerBlock(nn.Module):
                 n = attn2_replace_patch[block_attn2](n, context_attn2, value_attn2, extra_options)
                 n = self.attn2.to_out(n)
             else:
-                n = self.attn2(n, context=context_attn2, value=value_attn2, transformer_options=extra_options)
+                n = self.attn2(n, context=context_attn2, value=value_attn2, mask=regional_attention_mask(extra_options, n, context_attn2), transformer_options=extra_options)
         if "attn2_output_patch" in transformer_patches:
             patch = transformer_patches["attn2_output_patch"]
             for p in patch:
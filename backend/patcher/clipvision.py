@@ -1,5 +1,7 @@
+import os
 import torch
 
+from backend.misc.embedding_cache import clip_vision_cache, hash_tensor
 from backend.utils import load_torch_file
 from backend.state_dict import transformers_convert, state_dict_prefix_replace
 from backend import operations, memory_management
@@ -105,6 +107,8 @@ class ClipVisionModel:
                 self.model = CLIPVisionModelWithProjection(config)
 
         self.model.to(self.dtype)
+        self.filename = None
+        self.file_hash = None
         self.patcher = ModelPatcher(
             self.model,
             load_device=self.load_device,
@@ -117,7 +121,38 @@ class ClipVisionModel:
     def get_sd(self):
         return self.model.state_dict()
 
+    def model_hash(self):
+        """Identifies the weights for the embedding cache: sha256 of the checkpoint file; None if not loaded from a file."""
+
+        if self.filename is None:
+            return None
+
+        if self.file_hash is None:
+            from modules import hashes
+            sha256 = hashes.sha256(self.filename, f"clip_vision/{os.path.basename(self.filename)}")
+            self.file_hash = sha256 or f"{self.filename}-{os.path.getmtime(self.filename)}"
+
+        return f"{self.file_hash}/{self.dtype}"
+
+    def cached_outputs(self, key, compute):
+        """Returns compute() as an Output, reusing the result for the same model and key from the embedding cache."""
+
+        model_hash = self.model_hash()
+        if model_hash is None:
+            return compute()
+
+        outputs = clip_vision_cache.get_or_compute(f"{model_hash}/{key}", lambda: dict(vars(compute())))
+
+        o = Output()
+        for k, v in outputs.items():
+            o[k] = v.to(memory_management.intermediate_device())
+
+        return o
+
     def encode_image(self, image):
+        return self.cached_outputs(hash_tensor(image), lambda: self.encode_image_uncached(image))
+
+    def encode_image_uncached(self, image):
         memory_management.load_model_gpu(self.patcher)
         pixel_values = clip_preprocess(image.to(self.load_device))
         outputs = self.model(pixel_values=pixel_values, output_hidden_states=True)
@@ -185,6 +220,11 @@ def load_clipvision_from_sd(sd, prefix="", convert_keys=False):
 def load(ckpt_path):
     sd = load_torch_file(ckpt_path)
     if "visual.transformer.resblocks.0.attn.in_proj_weight" in sd:
-        return load_clipvision_from_sd(sd, prefix="visual.", convert_keys=True)
+        clip = load_clipvision_from_sd(sd, prefix="visual.", convert_keys=True)
     else:
-        return load_clipvision_from_sd(sd)
+        clip = load_clipvision_from_sd(sd)
+
+    if clip is not None:
+        clip.filename = ckpt_path
+
+    return clip
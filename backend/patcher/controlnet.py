@@ -19,7 +19,8 @@ def apply_controlnet_advanced(
         negative_advanced_weighting=None,
         advanced_frame_weighting=None,
         advanced_sigma_weighting=None,
-        advanced_mask_weighting=None
+        advanced_mask_weighting=None,
+        control_cache_options=None
 ):
     """
 
@@ -63,6 +64,16 @@ def apply_controlnet_advanced(
     This should be a tensor with shape B 1 H W where the H and W can be arbitrary.
     This mask will be resized automatically to match the shape of all injection layers.
 
+    # control_cache_options
+
+    Optional dict that enables reuse of control residuals across sampling steps (ControlNet models only):
+
+        control_cache_options = {
+            'interval': 3,           # run the control model every 3 steps, reuse its residuals in between
+            'sigma_threshold': 1.0,  # once sigma drops below 1.0, keep reusing the last residuals
+            'broadcast': True,       # compute once and repeat when cond/uncond share the same hint and context
+        }
+
     """
 
     cnet = controlnet.copy().set_cond_hint(image_bchw, strength, (start_percent, end_percent))
@@ -78,6 +89,9 @@ def apply_controlnet_advanced(
 
     cnet.advanced_mask_weighting = advanced_mask_weighting
 
+    if control_cache_options is not None:
+        cnet.set_control_cache(**control_cache_options)
+
     m = unet.clone()
     m.add_patched_controlnet(cnet)
     return m
@@ -182,6 +196,13 @@ class ControlBase:
         self.timestep_range = None
         self.transformer_options = {}
 
+        self.cache_interval = 1
+        self.cache_sigma_threshold = 0.0
+        self.cache_broadcast = False
+        self.control_cache = {}
+        self.control_cache_step = -1
+        self.control_cache_sigma = None
+
         if device is None:
             device = memory_management.get_torch_device()
         self.device = device
@@ -198,6 +219,15 @@ class ControlBase:
         if self.previous_controlnet is not None:
             self.previous_controlnet.pre_run(model, percent_to_timestep_function)
 
+    def set_control_cache(self, interval=1, sigma_threshold=0.0, broadcast=False):
+        self.cache_interval = max(1, int(interval))
+        self.cache_sigma_threshold = float(sigma_threshold)
+        self.cache_broadcast = bool(broadcast)
+        return self
+
+    def control_cache_enabled(self):
+        return self.cache_interval > 1 or self.cache_sigma_threshold > 0
+
     def set_previous_controlnet(self, controlnet):
         self.previous_controlnet = controlnet
         return self
@@ -209,6 +239,9 @@ class ControlBase:
             del self.cond_hint
             self.cond_hint = None
         self.timestep_range = None
+        self.control_cache = {}
+        self.control_cache_step = -1
+        self.control_cache_sigma = None
 
     def get_models(self):
         out = []
@@ -221,6 +254,9 @@ class ControlBase:
         c.strength = self.strength
         c.timestep_percent_range = self.timestep_percent_range
         c.global_average_pooling = self.global_average_pooling
+        c.cache_interval = self.cache_interval
+        c.cache_sigma_threshold = self.cache_sigma_threshold
+        c.cache_broadcast = self.cache_broadcast
 
     def inference_memory_requirements(self, dtype):
         if self.previous_controlnet is not None:
@@ -335,9 +371,57 @@ class ControlNet(ControlBase):
             wrapper_args['inner_model'] = self.control_model
             control = controlnet_model_function_wrapper(**wrapper_args)
         else:
-            control = self.control_model(x=x_noisy.to(dtype), hint=self.cond_hint.to(self.device), timesteps=timestep.float(), context=context.to(dtype), y=y)
+            control = self.cached_control_model(t, batched_number, x=x_noisy.to(dtype), hint=self.cond_hint.to(self.device), timesteps=timestep.float(), context=context.to(dtype), y=y)
         return self.control_merge(None, control, control_prev, output_dtype)
 
+    def cached_control_model(self, t, batched_number, **kwargs):
+        """
+        Runs the control model, or returns residuals computed at an earlier step when the control cache allows it.
+        Entries are kept per batch layout (shape and cond/uncond order), since a step may call get_control several
+        times. control_merge modifies the residuals in place, so the cache keeps its own copy.
+        """
+
+        if not self.control_cache_enabled():
+            return self.broadcast_control_model(batched_number, **kwargs)
+
+        sigma = float(t[0])
+        if sigma != self.control_cache_sigma:
+            self.control_cache_sigma = sigma
+            self.control_cache_step += 1
+
+        key = (tuple(kwargs['x'].shape), tuple(self.transformer_options.get('cond_or_uncond', [])))
+        cached = self.control_cache.get(key, None)
+
+        if cached is not None:
+            computed_step, control = cached
+            reuse = self.control_cache_step - computed_step < self.cache_interval
+            reuse = reuse or sigma < self.cache_sigma_threshold
+
+            if reuse:
+                return [None if x is None else x.clone() for x in control]
+
+        control = self.broadcast_control_model(batched_number, **kwargs)
+        self.control_cache[key] = (self.control_cache_step, [None if x is None else x.clone() for x in control])
+        return control
+
+    def broadcast_control_model(self, batched_number, x, hint, timesteps, context, y=None):
+        """Computes the control for one chunk and repeats it when all cond/uncond chunks have identical inputs."""
+
+        batch_size = x.shape[0]
+
+        if self.cache_broadcast and batched_number > 1 and batch_size % batched_number == 0:
+            n = batch_size // batched_number
+            inputs = [a for a in (x, hint, timesteps, context, y) if a is not None and a.shape[0] == batch_size]
+
+            if all(torch.equal(a[:n], a[i * n:(i + 1) * n]) for a in inputs for i in range(1, batched_number)):
+                def first_chunk(a):
+                    return a[:n] if a is not None and a.shape[0] == batch_size else a
+
+                control = self.control_model(x=first_chunk(x), hint=first_chunk(hint), timesteps=first_chunk(timesteps), context=first_chunk(context), y=first_chunk(y))
+                return [None if c is None else torch.cat([c] * batched_number) for c in control]
+
+        return self.control_model(x=x, hint=hint, timesteps=timesteps, context=context, y=y)
+
     def copy(self):
         c = ControlNet(self.control_model, global_average_pooling=self.global_average_pooling, load_device=self.load_device, manual_cast_dtype=self.manual_cast_dtype)
         self.copy_to(c)
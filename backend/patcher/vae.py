@@ -5,6 +5,7 @@ import itertools
 from tqdm import trange
 from backend import memory_management
 from backend.patcher.base import ModelPatcher
+from backend.misc import memory_planner, torch_compile
 
 
 @torch.inference_mode()
@@ -129,17 +130,29 @@ class VAE:
         if memory_management.VAE_ALWAYS_TILED:
             return self.decode_tiled(samples_in).to(self.output_device)
 
+        planned_batch = memory_planner.vae_decode_batch(self, samples_in.shape) if memory_planner.enabled() else None
+        if planned_batch == 0:
+            print("VRAM plan: a single image does not fit for regular VAE decoding, using tiled VAE decoding.")
+            return self.decode_tiled(samples_in).to(self.output_device)
+
         try:
             memory_used = self.memory_used_decode(samples_in.shape, self.vae_dtype)
-            memory_management.load_models_gpu([self.patcher], memory_required=memory_used)
-            free_memory = memory_management.get_free_memory(self.device)
-            batch_number = int(free_memory / memory_used)
-            batch_number = max(1, batch_number)
+
+            if planned_batch is not None:
+                batch_number = min(planned_batch, samples_in.shape[0])
+                memory_management.load_models_gpu([self.patcher], memory_required=memory_used * batch_number)
+            else:
+                memory_management.load_models_gpu([self.patcher], memory_required=memory_used)
+                free_memory = memory_management.get_free_memory(self.device)
+                batch_number = int(free_memory / memory_used)
+                batch_number = max(1, batch_number)
+
+            decode = torch_compile.compiled_function(self.first_stage_model, "decode", "VAE")
 
             pixel_samples = torch.empty((samples_in.shape[0], 3, round(samples_in.shape[2] * self.downscale_ratio), round(samples_in.shape[3] * self.downscale_ratio)), device=self.output_device)
             for x in range(0, samples_in.shape[0], batch_number):
                 samples = samples_in[x:x + batch_number].to(self.vae_dtype).to(self.device)
-                pixel_samples[x:x + batch_number] = torch.clamp((self.first_stage_model.decode(samples).to(self.output_device).float() + 1.0) / 2.0, min=0.0, max=1.0)
+                pixel_samples[x:x + batch_number] = torch.clamp((decode(torch_compile.shape_key(samples), samples).to(self.output_device).float() + 1.0) / 2.0, min=0.0, max=1.0)
         except memory_management.OOM_EXCEPTION as e:
             print("Warning: Ran out of memory when regular VAE decoding, retrying with tiled VAE decoding.")
             pixel_samples = self.decode_tiled_(samples_in)
@@ -172,10 +185,12 @@ class VAE:
             free_memory = memory_management.get_free_memory(self.device)
             batch_number = int(free_memory / memory_used)
             batch_number = max(1, batch_number)
+            encode = torch_compile.compiled_function(self.first_stage_model, "encode", "VAE")
+
             samples = torch.empty((pixel_samples.shape[0], self.latent_channels, round(pixel_samples.shape[2] // self.downscale_ratio), round(pixel_samples.shape[3] // self.downscale_ratio)), device=self.output_device)
             for x in range(0, pixel_samples.shape[0], batch_number):
                 pixels_in = (2. * pixel_samples[x:x + batch_number] - 1.).to(self.vae_dtype).to(self.device)
-                samples[x:x + batch_number] = self.first_stage_model.encode(pixels_in, regulation).to(self.output_device).float()
+                samples[x:x + batch_number] = encode(torch_compile.shape_key(pixels_in), pixels_in, regulation, patched=lambda: regulation is not None).to(self.output_device).float()
 
         except memory_management.OOM_EXCEPTION as e:
             print("Warning: Ran out of memory when regular VAE encoding, retrying with tiled VAE encoding.")
@@ -7,11 +7,13 @@ import torch
 import math
 import collections
 
-from backend import memory_management
+from backend import memory_management, attention
 from backend.sampling.condition import Condition, compile_conditions, compile_weighted_conditions
 from backend.operations import cleanup_cache
 from backend.args import dynamic_args, args
 from backend import utils
+from backend.misc import memory_planner
+from backend.nn.unet import IntegratedUNet2DConditionModel
 
 
 def get_area_and_mult(conds, x_in, timestep_in):
@@ -69,10 +71,79 @@ def get_area_and_mult(conds, x_in, timestep_in):
     control = conds.get('control', None)
 
     patches = None
-    cond_obj = collections.namedtuple('cond_obj', ['input_x', 'mult', 'conditioning', 'area', 'control', 'patches'])
     return cond_obj(input_x, mult, conditioning, area, control, patches)
 
 
+cond_obj = collections.namedtuple('cond_obj', ['input_x', 'mult', 'conditioning', 'area', 'control', 'patches', 'regions'], defaults=(None,))
+
+regional_attention_cache = collections.OrderedDict()
+
+
+def regional_attention_enabled(model, model_options):
+    from modules.shared import opts
+
+    if not opts.data.get("regional_attention", False):
+        return False
+
+    if not isinstance(getattr(model, "diffusion_model", None), IntegratedUNet2DConditionModel):
+        return False
+
+    transformer_options = model_options.get("transformer_options", {})
+    patches = transformer_options.get("patches", {})
+    return not any(k in patches for k in ("attn2_patch", "attn2_output_patch")) and not transformer_options.get("patches_replace", {}).get("attn2")
+
+
+def can_merge_regions(parts):
+    if len(parts) < 2 or all(p.input_x.shape == parts[0].input_x.shape for p in parts):
+        return False
+
+    if any(p.control is not None or p.patches is not None for p in parts):
+        return False
+
+    contexts = [p.conditioning.get('c_crossattn', None) for p in parts]
+    if any(c is None for c in contexts):
+        return False
+
+    return all(c.cond.shape[0] == contexts[0].cond.shape[0] and c.cond.shape[2] == contexts[0].cond.shape[2] for c in contexts)
+
+
+def merge_regions(conds, parts, x_in):
+    """
+    Area/mask conds of different sizes as one full-frame cond: their cross-attention contexts are concatenated and each
+    region's tokens are masked to its area (weighted by its mult) in backend.attention.RegionalAttention, so all regions
+    take one UNet forward per step instead of one per crop size. Other model conds come from the largest region.
+    """
+
+    full = (x_in.shape[2], x_in.shape[3], 0, 0)
+    base = max(range(len(parts)), key=lambda i: parts[i].area[0] * parts[i].area[1])
+
+    conditioning = {}
+    for k, c in conds[base]['model_conds'].items():
+        conditioning[k] = c.process_cond(batch_size=x_in.shape[0], device=x_in.device, area=full)
+
+    contexts = [p.conditioning['c_crossattn'].cond for p in parts]
+    conditioning['c_crossattn'] = conditioning['c_crossattn']._copy_with(torch.cat(contexts, dim=1))
+
+    key = (tuple(id(c) for c in conds), tuple(x_in.shape), x_in.device)
+    entry = regional_attention_cache.get(key, None)
+
+    if entry is None or any(a is not b for a, b in zip(entry[0], conds)):
+        weights = torch.zeros((x_in.shape[0], len(parts), x_in.shape[2], x_in.shape[3]), device=x_in.device)
+        for i, p in enumerate(parts):
+            weights[:, i, p.area[2]:p.area[0] + p.area[2], p.area[3]:p.area[1] + p.area[3]] = p.mult[:, 0]
+
+        token_regions = torch.cat([torch.full((c.shape[1],), i, dtype=torch.long) for i, c in enumerate(contexts)])
+        entry = (list(conds), attention.RegionalAttention(weights, token_regions))
+        regional_attention_cache[key] = entry
+
+        while len(regional_attention_cache) > 8:
+            regional_attention_cache.popitem(last=False)
+
+    regional_attention_cache.move_to_end(key)
+
+    return cond_obj(x_in, torch.ones_like(x_in), conditioning, full, None, None, entry[1])
+
+
 def cond_equal_size(c1, c2):
     if c1 is c2:
         return True
@@ -102,6 +173,9 @@ def can_concat_cond(c1, c2):
     if not objects_concatable(c1.patches, c2.patches):
         return False
 
+    if c1.regions is not None and c2.regions is not None and c1.regions is not c2.regions:
+        return False
+
     return cond_equal_size(c1.conditioning, c2.conditioning)
 
 
@@ -162,12 +236,18 @@ def calc_cond_uncond_batch(model, cond, uncond, x_in, timestep, model_options):
     UNCOND = 1
 
     to_run = []
+    active = []
     for x in cond:
         p = get_area_and_mult(x, x_in, timestep)
         if p is None:
             continue
 
         to_run += [(p, COND)]
+        active.append(x)
+
+    if len(to_run) > 1 and regional_attention_enabled(model, model_options) and can_merge_regions([p for p, _ in to_run]):
+        to_run = [(merge_regions(active, [p for p, _ in to_run], x_in), COND)]
+
     if uncond is not None:
         for x in uncond:
             p = get_area_and_mult(x, x_in, timestep)
@@ -190,33 +270,39 @@ def calc_cond_uncond_batch(model, cond, uncond, x_in, timestep, model_options):
         if memory_management.signal_empty_cache:
             memory_management.soft_empty_cache()
 
-        free_memory = memory_management.get_free_memory(x_in.device)
-
-        if (not args.disable_gpu_warning) and x_in.device.type == 'cuda':
-            free_memory_mb = free_memory / (1024.0 * 1024.0)
-            safe_memory_mb = 1536.0
-            if free_memory_mb < safe_memory_mb:
-                print(f"\n\n----------------------")
-                print(f"[Low GPU VRAM Warning] Your current GPU free memory is {free_memory_mb:.2f} MB for this diffusion iteration.")
-                print(f"[Low GPU VRAM Warning] This number is lower than the safe value of {safe_memory_mb:.2f} MB.")
-                print(f"[Low GPU VRAM Warning] If you continue, you may cause NVIDIA GPU performance degradation for this diffusion process, and the speed may be extremely slow (about 10x slower).")
-                print(f"[Low GPU VRAM Warning] To solve the problem, you can set the 'GPU Weights' (on the top of page) to a lower value.")
-                print(f"[Low GPU VRAM Warning] If you cannot find 'GPU Weights', you can click the 'all' option in the 'UI' area on the left-top corner of the webpage.")
-                print(f"[Low GPU VRAM Warning] If you want to take the risk of NVIDIA GPU fallback and test the 10x slower speed, you can (but are highly not recommended to) add '--disable-gpu-warning' to CMD flags to remove this warning.")
-                print(f"----------------------\n\n")
-
-        for i in range(1, len(to_batch_temp) + 1):
-            batch_amount = to_batch_temp[:len(to_batch_temp) // i]
-            input_shape = [len(batch_amount) * first_shape[0]] + list(first_shape)[1:]
-            if model.memory_required(input_shape) < free_memory:
-                to_batch = batch_amount
-                break
+        plan = memory_planner.current_plan if memory_planner.enabled() else None
+        if plan is not None:
+            # split as planned in sampling_prepare, without probing free memory (a device sync) every step
+            to_batch = to_batch_temp[:max(1, plan.max_rows // first_shape[0])]
+        else:
+            free_memory = memory_management.get_free_memory(x_in.device)
+
+            if (not args.disable_gpu_warning) and x_in.device.type == 'cuda':
+                free_memory_mb = free_memory / (1024.0 * 1024.0)
+                safe_memory_mb = 1536.0
+                if free_memory_mb < safe_memory_mb:
+                    print(f"\n\n----------------------")
+                    print(f"[Low GPU VRAM Warning] Your current GPU free memory is {free_memory_mb:.2f} MB for this diffusion iteration.")
+                    print(f"[Low GPU VRAM Warning] This number is lower than the safe value of {safe_memory_mb:.2f} MB.")
+                    print(f"[Low GPU VRAM Warning] If you continue, you may cause NVIDIA GPU performance degradation for this diffusion process, and the speed may be extremely slow (about 10x slower).")
+                    print(f"[Low GPU VRAM Warning] To solve the problem, you can set the 'GPU Weights' (on the top of page) to a lower value.")
+                    print(f"[Low GPU VRAM Warning] If you cannot find 'GPU Weights', you can click the 'all' option in the 'UI' area on the left-top corner of the webpage.")
+                    print(f"[Low GPU VRAM Warning] If you want to take the risk of NVIDIA GPU fallback and test the 10x slower speed, you can (but are highly not recommended to) add '--disable-gpu-warning' to CMD flags to remove this warning.")
+                    print(f"----------------------\n\n")
+
+            for i in range(1, len(to_batch_temp) + 1):
+                batch_amount = to_batch_temp[:len(to_batch_temp) // i]
+                input_shape = [len(batch_amount) * first_shape[0]] + list(first_shape)[1:]
+                if model.memory_required(input_shape) < free_memory:
+                    to_batch = batch_amount
+                    break
 
         input_x = []
         mult = []
         c = []
         cond_or_uncond = []
         area = []
+        regions = []
         control = None
         patches = None
         for x in to_batch:
@@ -226,6 +312,7 @@ def calc_cond_uncond_batch(model, cond, uncond, x_in, timestep, model_options):
             mult.append(p.mult)
             c.append(p.conditioning)
             area.append(p.area)
+            regions.append(p.regions)
             cond_or_uncond.append(o[1])
             control = p.control
             patches = p.patches
@@ -256,6 +343,9 @@ def calc_cond_uncond_batch(model, cond, uncond, x_in, timestep, model_options):
         transformer_options["cond_mark"] = compute_cond_mark(cond_or_uncond=cond_or_uncond, sigmas=timestep)
         transformer_options["cond_indices"], transformer_options["uncond_indices"] = compute_cond_indices(cond_or_uncond=cond_or_uncond, sigmas=timestep)
 
+        if any(r is not None for r in regions):
+            transformer_options["regional_attention"] = regions
+
         c['transformer_options'] = transformer_options
 
         if control is not None:
@@ -369,6 +459,16 @@ def sampling_prepare(unet, x):
     memory_estimation_function = unet.model_options.get('memory_peak_estimation_modifier', unet.memory_required)
 
     unet_inference_memory = memory_estimation_function([B * 2, C, H, W])
+
+    # a pass that raised before sampling_cleanup must not leave its plan to the next one
+    memory_planner.current_plan = None
+
+    plan = None
+    if memory_planner.enabled():
+        plan = memory_planner.plan_sampling(unet, x.shape)
+        memory_planner.admit([("sampling", plan)], label=f"latent {W}x{H} x{B}")
+        memory_planner.current_plan = plan
+
     additional_inference_memory = unet.extra_preserved_memory_during_sampling
     additional_model_patchers = unet.extra_model_patchers_during_sampling
 
@@ -380,6 +480,11 @@ def sampling_prepare(unet, x):
         lora_memory = utils.nested_compute_size(unet.lora_patches, element_size=utils.dtype_to_element_size(unet.model.computation_dtype))
         additional_inference_memory += lora_memory
 
+    if plan is not None:
+        # reserve the planned activations when choosing how many weights to swap, not only when freeing memory
+        unet_inference_memory = 0
+        additional_inference_memory += plan.activation
+
     memory_management.load_models_gpu(
         models=[unet] + additional_model_patchers,
         memory_required=unet_inference_memory,
@@ -400,6 +505,8 @@ def sampling_prepare(unet, x):
 
 
 def sampling_cleanup(unet):
+    memory_planner.current_plan = None
+    regional_attention_cache.clear()  # holds the pass's conds and device tensors
     if unet.has_online_lora():
         utils.nested_move_to_device(unet.lora_patches, device=unet.offload_device)
     for cnet in unet.list_controlnets():
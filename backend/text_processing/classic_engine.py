@@ -121,12 +121,22 @@ class ClassicTextProcessingEngine:
 
         return tokenized
 
+    def prepare_embeddings(self, target_device):
+        embeddings = self.text_encoder.transformer.text_model.embeddings
+
+        if embeddings.position_ids.device != target_device:
+            embeddings.position_ids = embeddings.position_ids.to(device=target_device)
+
+        if embeddings.position_embedding.weight.dtype != torch.float32:
+            embeddings.position_embedding = embeddings.position_embedding.to(dtype=torch.float32)
+
+        if embeddings.token_embedding.wrapped.weight.dtype != torch.float32:
+            embeddings.token_embedding = embeddings.token_embedding.to(dtype=torch.float32)
+
     def encode_with_transformers(self, tokens):
         target_device = memory_management.text_encoder_device()
 
-        self.text_encoder.transformer.text_model.embeddings.position_ids = self.text_encoder.transformer.text_model.embeddings.position_ids.to(device=target_device)
-        self.text_encoder.transformer.text_model.embeddings.position_embedding = self.text_encoder.transformer.text_model.embeddings.position_embedding.to(dtype=torch.float32)
-        self.text_encoder.transformer.text_model.embeddings.token_embedding = self.text_encoder.transformer.text_model.embeddings.token_embedding.to(dtype=torch.float32)
+        self.prepare_embeddings(target_device)
 
         tokens = tokens.to(target_device)
 
@@ -257,20 +267,24 @@ class ClassicTextProcessingEngine:
         used_embeddings = {}
         chunk_count = max([len(x) for x in batch_chunks])
 
-        zs = []
-        for i in range(chunk_count):
-            batch_chunk = [chunks[i] if i < len(chunks) else self.empty_chunk() for chunks in batch_chunks]
-
-            tokens = [x.tokens for x in batch_chunk]
-            multipliers = [x.multipliers for x in batch_chunk]
-            self.embeddings.fixes = [x.fixes for x in batch_chunk]
+        batch_chunk_groups = [[chunks[i] if i < len(chunks) else self.empty_chunk() for chunks in batch_chunks] for i in range(chunk_count)]
 
-            for fixes in self.embeddings.fixes:
-                for _position, embedding in fixes:
+        for batch_chunk in batch_chunk_groups:
+            for x in batch_chunk:
+                for _position, embedding in x.fixes:
                     used_embeddings[embedding.name] = embedding
 
-            z = self.process_tokens(tokens, multipliers)
-            zs.append(z)
+        if chunk_count > 1 and opts.batch_prompt_chunks:
+            zs = self.process_chunk_groups(batch_chunk_groups)
+        else:
+            zs = []
+            for batch_chunk in batch_chunk_groups:
+                tokens = [x.tokens for x in batch_chunk]
+                multipliers = [x.multipliers for x in batch_chunk]
+                self.embeddings.fixes = [x.fixes for x in batch_chunk]
+
+                z = self.process_tokens(tokens, multipliers)
+                zs.append(z)
 
         global last_extra_generation_params
 
@@ -294,7 +308,33 @@ class ClassicTextProcessingEngine:
         else:
             return torch.hstack(zs)
 
-    def process_tokens(self, remade_batch_tokens, batch_multipliers):
+    def process_chunk_groups(self, batch_chunk_groups):
+        """
+        Same result as calling process_tokens for every group of chunks (i-th chunk of every prompt), but with a single
+        text encoder forward over all groups stacked along the batch dimension. Emphasis is applied per group on
+        contiguous slices of the output, so its normalization sees exactly the values it would see per group.
+        """
+
+        batch_size = len(batch_chunk_groups[0])
+
+        tokens = [x.tokens for batch_chunk in batch_chunk_groups for x in batch_chunk]
+        self.embeddings.fixes = [x.fixes for batch_chunk in batch_chunk_groups for x in batch_chunk]
+
+        z_all = self.encode_with_transformers(self.pad_tokens(tokens))
+        pooled = getattr(z_all, 'pooled', None)
+
+        zs = []
+        for i, batch_chunk in enumerate(batch_chunk_groups):
+            z = self.apply_emphasis(z_all[i * batch_size:(i + 1) * batch_size], [x.tokens for x in batch_chunk], [x.multipliers for x in batch_chunk])
+
+            if pooled is not None:
+                z.pooled = pooled[i * batch_size:(i + 1) * batch_size]
+
+            zs.append(z)
+
+        return zs
+
+    def pad_tokens(self, remade_batch_tokens):
         tokens = torch.asarray(remade_batch_tokens)
 
         if self.id_end != self.id_pad:
@@ -302,15 +342,21 @@ class ClassicTextProcessingEngine:
                 index = remade_batch_tokens[batch_pos].index(self.id_end)
                 tokens[batch_pos, index + 1:tokens.shape[1]] = self.id_pad
 
-        z = self.encode_with_transformers(tokens)
-
-        pooled = getattr(z, 'pooled', None)
+        return tokens
 
+    def apply_emphasis(self, z, remade_batch_tokens, batch_multipliers):
         self.emphasis.tokens = remade_batch_tokens
         self.emphasis.multipliers = torch.asarray(batch_multipliers).to(z)
         self.emphasis.z = z
         self.emphasis.after_transformers()
-        z = self.emphasis.z
+        return self.emphasis.z
+
+    def process_tokens(self, remade_batch_tokens, batch_multipliers):
+        z = self.encode_with_transformers(self.pad_tokens(remade_batch_tokens))
+
+        pooled = getattr(z, 'pooled', None)
+
+        z = self.apply_emphasis(z, remade_batch_tokens, batch_multipliers)
 
         if pooled is not None:
             z.pooled = pooled
@@ -1,4 +1,5 @@
 import re
+import functools
 
 
 re_attention = re.compile(r"""
@@ -20,7 +21,9 @@ re_attention = re.compile(r"""
 re_break = re.compile(r"\s*\bBREAK\b\s*", re.S)
 
 
+@functools.lru_cache(maxsize=1024)
 def parse_prompt_attention(text, emphasis):
+    # memoized: text engines re-parse the same prompts on every request, result is a tuple shared between callers
     res = []
     round_brackets = []
     square_brackets = []
@@ -76,4 +79,4 @@ def parse_prompt_attention(text, emphasis):
             else:
                 i += 1
 
-    return res
+    return tuple((part, weight) for part, weight in res)
@@ -128,31 +128,43 @@ class T5TextProcessingEngine:
                     max_tokens = max (len(chunk.tokens), max_tokens)
 
                 for chunk in chunks:
-                    tokens = chunk.tokens
-                    multipliers = chunk.multipliers
-                    
-                    remaining_count = max_tokens - len(tokens)
+                    remaining_count = max_tokens - len(chunk.tokens)
                     if remaining_count > 0:
-                        tokens += [self.id_pad] * remaining_count
-                        multipliers += [1.0] * remaining_count
-
-                    z = self.process_tokens([tokens], [multipliers])[0]
-                    line_z_values.append(z)
+                        chunk.tokens += [self.id_pad] * remaining_count
+                        chunk.multipliers += [1.0] * remaining_count
+
+                if len(chunks) > 1 and opts.batch_prompt_chunks:
+                    line_z_values = self.process_chunks(chunks)
+                else:
+                    for chunk in chunks:
+                        z = self.process_tokens([chunk.tokens], [chunk.multipliers])[0]
+                        line_z_values.append(z)
                 cache[line] = line_z_values
 
             zs.extend(line_z_values)
 
         return torch.stack(zs)
 
-    def process_tokens(self, batch_tokens, batch_multipliers):
-        tokens = torch.asarray(batch_tokens)
+    def process_chunks(self, chunks):
+        """
+        Same result as calling process_tokens for every chunk separately, but with a single encoder forward for all
+        chunks of the line; emphasis is still applied per chunk, so its normalization is unchanged.
+        """
 
-        z = self.encode_with_transformers(tokens)
+        z_all = self.encode_with_transformers(torch.asarray([chunk.tokens for chunk in chunks]))
+
+        return [self.apply_emphasis(z_all[i:i + 1], [chunk.tokens], [chunk.multipliers])[0] for i, chunk in enumerate(chunks)]
 
+    def apply_emphasis(self, z, batch_tokens, batch_multipliers):
         self.emphasis.tokens = batch_tokens
         self.emphasis.multipliers = torch.asarray(batch_multipliers).to(z)
         self.emphasis.z = z
         self.emphasis.after_transformers()
-        z = self.emphasis.z
+        return self.emphasis.z
 
-        return z
+    def process_tokens(self, batch_tokens, batch_multipliers):
+        tokens = torch.asarray(batch_tokens)
+
+        z = self.encode_with_transformers(tokens)
+
+        return self.apply_emphasis(z, batch_tokens, batch_multipliers)
@@ -1,13 +1,17 @@
 import os
 import torch
 import base64
+import functools
 import json
+import threading
 import zlib
 import numpy as np
 import safetensors.torch
 
 from PIL import Image
 
+from modules import cache
+
 
 class EmbeddingEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -88,6 +92,167 @@ class Embedding:
         self.sd_checkpoint_name = None
 
 
+class LazyEmbedding(Embedding):
+    """
+    Embedding built from index metadata; the tensors are read from the file the first time `vec` is accessed,
+    i.e. when a prompt actually uses the embedding.
+    """
+
+    def __init__(self, name, filename, mtime, shape, vectors, step=None, sd_checkpoint=None, sd_checkpoint_name=None):
+        self._vec = None
+        super().__init__(None, name, step)
+        self.filename = filename
+        self.mtime = mtime
+        self.shape = shape
+        self.vectors = vectors
+        self.sd_checkpoint = sd_checkpoint
+        self.sd_checkpoint_name = sd_checkpoint_name
+
+    @property
+    def vec(self):
+        if self._vec is not None:
+            return self._vec
+
+        return load_embedding_vec(self.filename, self.mtime)
+
+    @vec.setter
+    def vec(self, value):
+        self._vec = value
+
+
+@functools.lru_cache(maxsize=256)
+def load_embedding_vec(filename, mtime):
+    """Loads embedding tensors once for all text engines; `mtime` is part of the key so edited files are re-read."""
+
+    data, name = read_embedding_file(filename, os.path.basename(filename))
+    return create_embedding_from_data(data, name, filename=filename).vec
+
+
+def read_embedding_file(path, filename):
+    """Returns (data, name) for an embedding file, or (None, None) for files that are not embeddings."""
+
+    name, ext = os.path.splitext(filename)
+    ext = ext.upper()
+
+    if ext in ['.PNG', '.WEBP', '.JXL', '.AVIF']:
+        _, second_ext = os.path.splitext(name)
+        if second_ext.upper() == '.PREVIEW':
+            return None, None
+
+        embed_image = Image.open(path)
+        if hasattr(embed_image, 'text') and 'sd-ti-embedding' in embed_image.text:
+            data = embedding_from_b64(embed_image.text['sd-ti-embedding'])
+            name = data.get('name', name)
+        else:
+            data = extract_image_data_embed(embed_image)
+            if data:
+                name = data.get('name', name)
+            else:
+                return None, None
+    elif ext in ['.BIN', '.PT']:
+        data = torch.load(path, map_location="cpu")
+    elif ext in ['.SAFETENSORS']:
+        data = safetensors.torch.load_file(path, device="cpu")
+    else:
+        return None, None
+
+    return data, name
+
+
+class EmbeddingIndex:
+    """
+    Metadata index of embedding files shared by all EmbeddingDatabase instances.
+
+    Per-file metadata (name, shape, vectors, step, checkpoint) is kept in the `textual-inversion-index` disk cache and
+    invalidated by file mtime, so files are only opened when they are new or changed. Token ids of embedding names are
+    kept per tokenizer in the `textual-inversion-tokens` disk cache.
+    """
+
+    extensions = {'.PNG', '.WEBP', '.JXL', '.AVIF', '.BIN', '.PT', '.SAFETENSORS'}
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.token_ids = {}
+
+    @staticmethod
+    def read_metadata(path, filename):
+        data, name = read_embedding_file(path, filename)
+        if data is None:
+            return {'name': None}
+
+        embedding = create_embedding_from_data(data, name, filename=filename, filepath=path)
+        return {
+            'name': embedding.name,
+            'shape': embedding.shape,
+            'vectors': embedding.vectors,
+            'step': embedding.step,
+            'sd_checkpoint': embedding.sd_checkpoint,
+            'sd_checkpoint_name': embedding.sd_checkpoint_name,
+        }
+
+    def metadata(self, path, filename):
+        return cache.cached_data_for_file('textual-inversion-index', path, path, lambda: self.read_metadata(path, filename))
+
+    def scan(self, dirpath):
+        """Yields LazyEmbedding objects for all embedding files under dirpath."""
+
+        for root, _, fns in os.walk(dirpath, followlinks=True):
+            for fn in fns:
+                if os.path.splitext(fn)[1].upper() not in self.extensions:
+                    continue
+
+                fullfn = os.path.join(root, fn)
+
+                try:
+                    stat = os.stat(fullfn)
+                    if stat.st_size == 0:
+                        continue
+
+                    meta = self.metadata(fullfn, fn)
+                except Exception:
+                    print(f"Error loading embedding {fn}")
+                    continue
+
+                if meta is None or meta['name'] is None:
+                    continue
+
+                yield LazyEmbedding(
+                    meta['name'], fullfn, stat.st_mtime, meta['shape'], meta['vectors'],
+                    step=meta['step'], sd_checkpoint=meta['sd_checkpoint'], sd_checkpoint_name=meta['sd_checkpoint_name']
+                )
+
+    def tokenize(self, tokenizer, names):
+        """Returns token ids for names, tokenizing only names that were not seen before with this tokenizer."""
+
+        tokenizer_key = f"{type(tokenizer).__name__}/{getattr(tokenizer, 'name_or_path', '')}/{len(tokenizer)}"
+        disk = cache.cache('textual-inversion-tokens')
+
+        with self.lock:
+            known = self.token_ids.setdefault(tokenizer_key, {})
+
+            missing = []
+            for name in names:
+                if name in known:
+                    continue
+
+                ids = disk.get(f"{tokenizer_key}/{name}")
+                if ids is None:
+                    missing.append(name)
+                else:
+                    known[name] = ids
+
+            if missing:
+                tokenized = tokenizer(missing, truncation=False, add_special_tokens=False)["input_ids"]
+                for name, ids in zip(missing, tokenized):
+                    known[name] = list(ids)
+                    disk.set(f"{tokenizer_key}/{name}", known[name])
+
+            return [known[name] for name in names]
+
+
+embedding_index = EmbeddingIndex()
+
+
 class DirWithTextualInversionEmbeddings:
     def __init__(self, path):
         self.path = path
@@ -127,8 +292,9 @@ class EmbeddingDatabase:
     def register_embedding(self, embedding):
         return self.register_embedding_by_name(embedding, embedding.name)
 
-    def register_embedding_by_name(self, embedding, name):
-        ids = self.tokenizer([name], truncation=False, add_special_tokens=False)["input_ids"][0]
+    def register_embedding_by_name(self, embedding, name, ids=None):
+        if ids is None:
+            ids = self.tokenizer([name], truncation=False, add_special_tokens=False)["input_ids"][0]
         first_id = ids[0]
         if first_id not in self.ids_lookup:
             self.ids_lookup[first_id] = []
@@ -149,29 +315,8 @@ class EmbeddingDatabase:
         return embedding
 
     def load_from_file(self, path, filename):
-        name, ext = os.path.splitext(filename)
-        ext = ext.upper()
-
-        if ext in ['.PNG', '.WEBP', '.JXL', '.AVIF']:
-            _, second_ext = os.path.splitext(name)
-            if second_ext.upper() == '.PREVIEW':
-                return
-
-            embed_image = Image.open(path)
-            if hasattr(embed_image, 'text') and 'sd-ti-embedding' in embed_image.text:
-                data = embedding_from_b64(embed_image.text['sd-ti-embedding'])
-                name = data.get('name', name)
-            else:
-                data = extract_image_data_embed(embed_image)
-                if data:
-                    name = data.get('name', name)
-                else:
-                    return
-        elif ext in ['.BIN', '.PT']:
-            data = torch.load(path, map_location="cpu")
-        elif ext in ['.SAFETENSORS']:
-            data = safetensors.torch.load_file(path, device="cpu")
-        else:
+        data, name = read_embedding_file(path, filename)
+        if name is None:
             return
 
         if data is not None:
@@ -188,18 +333,16 @@ class EmbeddingDatabase:
         if not os.path.isdir(embdir.path):
             return
 
-        for root, _, fns in os.walk(embdir.path, followlinks=True):
-            for fn in fns:
-                try:
-                    fullfn = os.path.join(root, fn)
-
-                    if os.stat(fullfn).st_size == 0:
-                        continue
+        embeddings = []
+        for embedding in embedding_index.scan(embdir.path):
+            if self.expected_shape == -1 or self.expected_shape == embedding.shape:
+                embeddings.append(embedding)
+            else:
+                self.skipped_embeddings[embedding.name] = embedding
 
-                    self.load_from_file(fullfn, fn)
-                except Exception:
-                    print(f"Error loading embedding {fn}")
-                    continue
+        all_ids = embedding_index.tokenize(self.tokenizer, [embedding.name for embedding in embeddings])
+        for embedding, ids in zip(embeddings, all_ids):
+            self.register_embedding_by_name(embedding, embedding.name, ids)
 
     def load_textual_inversion_embeddings(self):
         self.ids_lookup.clear()
@@ -1,10 +1,11 @@
 import json
+import math
 import os
 
 import gguf
 import safetensors.torch
 from safetensors.torch import safe_open
-from collections.abc import MutableMapping
+from collections.abc import Mapping, MutableMapping
 import torch
 
 import backend.misc.checkpoint_pickle
@@ -256,6 +257,62 @@ class LazySafetensorsDict(MutableMapping):
 
 
 
+safetensors_dtypes = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8, "U8": torch.uint8, "BOOL": torch.bool,
+}
+
+if hasattr(torch, "float8_e4m3fn"):
+    safetensors_dtypes["F8_E4M3"] = torch.float8_e4m3fn
+    safetensors_dtypes["F8_E5M2"] = torch.float8_e5m2
+
+safetensors_dtype_names = {v: k for k, v in safetensors_dtypes.items()}
+
+
+def read_safetensors_header(filepath):
+    """The JSON header of a .safetensors file: ({key: {"dtype", "shape", "data_offsets"}}, __metadata__), without reading tensor data."""
+
+    with open(filepath, "rb") as f:
+        header_len = int.from_bytes(f.read(8), "little")
+        json_start = f.read(2)
+        if header_len <= 2 or json_start not in (b'{"', b"{'"):
+            raise ValueError(f"{filepath} is not a safetensors file")
+
+        header = json.loads(json_start + f.read(header_len - 2))
+
+    metadata = header.pop("__metadata__", None) or {}
+    return header, metadata
+
+
+class SafetensorsHeaderDict(Mapping):
+    """Read-only mapping of a .safetensors file built from its header alone.
+
+    - Values are meta tensors: shape and dtype work, reading values raises, and nothing is loaded from disk.
+    - Used to guess the model type from key names and shapes; a guess that needs tensor values fails instead of
+      silently seeing zeros, so callers can fall back to the real state dict.
+    """
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.header, self.metadata = read_safetensors_header(filepath)
+
+    def __getitem__(self, key):
+        entry = self.header[key]
+        return torch.empty(entry["shape"], dtype=safetensors_dtypes.get(entry["dtype"], torch.uint8), device="meta")
+
+    def __iter__(self):
+        return iter(self.header)
+
+    def __len__(self):
+        return len(self.header)
+
+    def __contains__(self, key):
+        return key in self.header
+
+    def parameters(self):
+        return sum(math.prod(x["shape"]) for x in self.header.values())
+
+
 def _load_pickled_checkpoint(path, device, safe_load):
     if safe_load and not _torch_supports_weights_only():
         print("Warning torch.load doesn't support weights_only on this pytorch version, loading unsafely.")
@@ -5,12 +5,10 @@ import numpy as np
 import yaml
 import einops
 
-from omegaconf import OmegaConf
 from modules_forge.supported_preprocessor import Preprocessor, PreprocessorParameter
 from modules_forge.utils import numpy_to_pytorch, resize_image_with_pad
 from modules_forge.shared import preprocessor_dir, add_supported_preprocessor
 from modules.modelloader import load_file_from_url
-from annotator.lama.saicinpainting.training.trainers import load_checkpoint
 
 
 class PreprocessorInpaint(Preprocessor):
@@ -101,6 +99,10 @@ class PreprocessorInpaintLama(PreprocessorInpaintOnly):
         self.name = 'inpaint_only+lama'
 
     def load_model(self):
+        # imported on first use: the LaMa stack (omegaconf, kornia, ...) is slow to import at startup
+        from omegaconf import OmegaConf
+        from annotator.lama.saicinpainting.training.trainers import load_checkpoint
+
         remote_model_path = "https://huggingface.co/lllyasviel/Annotators/resolve/main/ControlNetLama.pth"
         model_path = load_file_from_url(remote_model_path, model_dir=preprocessor_dir)
         config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lama_config.yaml')
@@ -7,9 +7,6 @@ import os
 import torch
 import numpy as np
 
-from marigold.model.marigold_pipeline import MarigoldPipeline
-from huggingface_hub import snapshot_download
-from modules_forge.diffusers_patcher import DiffusersModelPatcher
 from modules_forge.utils import numpy_to_pytorch, HWC3
 
 
@@ -33,6 +30,10 @@ class PreprocessorMarigold(Preprocessor):
         if self.model_patcher is not None:
             return
 
+        # imported on first use: the diffusers pipeline stack is slow to import at startup
+        from marigold.model.marigold_pipeline import MarigoldPipeline
+        from modules_forge.diffusers_patcher import DiffusersModelPatcher
+
         self.diffusers_patcher = DiffusersModelPatcher(
             pipeline_class=MarigoldPipeline,
             pretrained_path="Bingxin/Marigold",
@@ -8,9 +8,6 @@ import torch
 import numpy as np
 
 from einops import rearrange
-from annotator.normalbae.models.NNET import NNET
-from annotator.normalbae import load_checkpoint
-from torchvision import transforms
 
 
 class PreprocessorNormalBae(Preprocessor):
@@ -32,6 +29,11 @@ class PreprocessorNormalBae(Preprocessor):
         if self.model_patcher is not None:
             return
 
+        # imported on first use: NNET pulls in geffnet/torchvision at import time
+        from annotator.normalbae.models.NNET import NNET
+        from annotator.normalbae import load_checkpoint
+        from torchvision import transforms
+
         model_path = load_file_from_url(
             "https://huggingface.co/lllyasviel/Annotators/resolve/main/scannet.pt",
             model_dir=preprocessor_dir)
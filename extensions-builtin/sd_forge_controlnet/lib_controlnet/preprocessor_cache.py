@@ -0,0 +1,57 @@
+from typing import Optional
+
+import numpy as np
+
+from backend.misc.embedding_cache import EmbeddingCache, hash_tensor
+from lib_controlnet.logging import logger
+from lib_controlnet.utils import judge_image_type
+
+
+# preprocessors whose output depends on the numpy seed (set_numpy_seed) and not only on the input
+seed_dependent_modules = ("shuffle",)
+
+
+def hash_array(x: Optional[np.ndarray]) -> str:
+    return "none" if x is None else hash_tensor(x)
+
+
+class PreprocessorCache(EmbeddingCache):
+    """
+    LRU cache of preprocessor outputs keyed by input image/mask content, module name, resolution and slider values.
+
+    Only image outputs (HWC numpy arrays) are cached. Entries are kept in RAM up to `control_net_preprocessor_cache_mb`;
+    when `control_net_preprocessor_cache_disk` is enabled, entries evicted from RAM are spilled to the
+    `controlnet-preprocessor` disk cache (modules.cache) and promoted back to RAM on a hit.
+    """
+
+    def __init__(self):
+        super().__init__("controlnet-preprocessor", "control_net_preprocessor_cache_mb", "control_net_preprocessor_cache_disk", default_budget_mb=512, spill_evicted=True)
+
+    @staticmethod
+    def make_key(module, input_image, input_mask, resolution, slider_1, slider_2, seed=None) -> str:
+        key = f"{module}/{hash_array(input_image)}/{hash_array(input_mask)}/{resolution}/{slider_1}/{slider_2}"
+        if any(name in module for name in seed_dependent_modules):
+            key += f"/{seed}"
+        return key
+
+    def __call__(self, preprocessor, module, seed=None, **kwargs):
+        """Runs `preprocessor(**kwargs)` unless an output for the same inputs is cached."""
+
+        if module == "None":
+            return preprocessor(**kwargs)
+
+        key = self.make_key(module, kwargs.get("input_image"), kwargs.get("input_mask"), kwargs.get("resolution"), kwargs.get("slider_1"), kwargs.get("slider_2"), seed)
+
+        output = self.get(key)
+        if output is not None:
+            logger.info(f"Preprocessor output loaded from cache: {module} (hits={self.hits}, misses={self.misses})")
+            return output.copy()
+
+        output = preprocessor(**kwargs)
+        if judge_image_type(output):
+            self.put(key, output.copy())
+
+        return output
+
+
+preprocessor_cache = PreprocessorCache()
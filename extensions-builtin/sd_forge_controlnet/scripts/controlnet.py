@@ -20,6 +20,7 @@ from lib_controlnet.logging import logger
 from modules.processing import StableDiffusionProcessingImg2Img, StableDiffusionProcessingTxt2Img, \
     StableDiffusionProcessing
 from lib_controlnet.infotext import Infotext
+from lib_controlnet.preprocessor_cache import preprocessor_cache
 from modules_forge.utils import HWC3, numpy_to_pytorch
 from lib_controlnet.enums import HiResFixOption
 from lib_controlnet.api import controlnet_api
@@ -344,7 +345,10 @@ class ControlNetForForgeOfficial(scripts.Script):
             logger.info(f"Using preprocessor: {unit.module}")
             logger.info(f'preprocessor resolution = {unit.processor_res}')
 
-            preprocessor_output = preprocessor(
+            preprocessor_output = preprocessor_cache(
+                preprocessor,
+                unit.module,
+                seed=seed,
                 input_image=input_image,
                 input_mask=input_mask,
                 resolution=unit.processor_res,
@@ -488,6 +492,11 @@ class ControlNetForForgeOfficial(scripts.Script):
         params.model.negative_advanced_weighting = None
         params.model.advanced_frame_weighting = None
         params.model.advanced_sigma_weighting = None
+        params.model.control_cache_options = dict(
+            interval=shared.opts.data.get("control_net_cache_interval", 1),
+            sigma_threshold=shared.opts.data.get("control_net_cache_sigma_threshold", 0.0),
+            broadcast=shared.opts.data.get("control_net_cache_broadcast", False),
+        )
 
         soft_weighting = {
             'input': [0.09941396206337118, 0.12050177219802567, 0.14606275417942507, 0.17704576264172736,
@@ -606,6 +615,17 @@ def on_ui_settings():
         {"minimum": 1, "maximum": 10, "step": 1}, section=section))
     shared.opts.add_option("control_net_model_cache_size", shared.OptionInfo(
         5, "Model cache size (requires restart)", gr.Slider, {"minimum": 1, "maximum": 10, "step": 1}, section=section))
+    shared.opts.add_option("control_net_preprocessor_cache_mb", shared.OptionInfo(
+        512, "Preprocessor output cache size in MB (0 = disable)", gr.Slider, {"minimum": 0, "maximum": 8192, "step": 64}, section=section
+    ).info("reuses detected maps when input image, preprocessor, resolution and thresholds are unchanged"))
+    shared.opts.add_option("control_net_preprocessor_cache_disk", shared.OptionInfo(
+        False, "Spill preprocessor outputs evicted from RAM to disk cache", gr.Checkbox, {"interactive": True}, section=section))
+    shared.opts.add_option("control_net_cache_interval", shared.OptionInfo(
+        1, "Run ControlNet model every N steps and reuse its residuals in between (1 = every step)", gr.Slider, {"minimum": 1, "maximum": 10, "step": 1}, section=section))
+    shared.opts.add_option("control_net_cache_sigma_threshold", shared.OptionInfo(
+        0.0, "Reuse last ControlNet residuals once sigma is below this value (0 = disable)", gr.Slider, {"minimum": 0.0, "maximum": 10.0, "step": 0.05}, section=section))
+    shared.opts.add_option("control_net_cache_broadcast", shared.OptionInfo(
+        False, "Compute ControlNet once for cond and uncond when their hint and context are identical", gr.Checkbox, {"interactive": True}, section=section))
     shared.opts.add_option("control_net_no_detectmap", shared.OptionInfo(
         False, "Do not append detectmap to output", gr.Checkbox, {"interactive": True}, section=section))
     shared.opts.add_option("control_net_detectmap_autosaving", shared.OptionInfo(
@@ -4,12 +4,14 @@
 
 import torch
 import contextlib
+import hashlib
 import os
 import math
 
 from backend import memory_management, attention, utils
+from backend.misc.embedding_cache import face_embedding_cache, hash_tensor
 from backend.misc.image_resize import adaptive_resize
-from backend.patcher.clipvision import clip_preprocess
+from backend.patcher.clipvision import clip_preprocess, Output
 from modules_forge.shared import controlnet_dir, models_path
 
 from torch import nn
@@ -188,12 +190,45 @@ def image_add_noise(image, noise):
 
 
 def zeroed_hidden_states(clip_vision, batch_size):
-    image = torch.zeros([batch_size, 224, 224, 3])
-    memory_management.load_model_gpu(clip_vision.patcher)
-    pixel_values = clip_preprocess(image.to(clip_vision.load_device)).float()
-    outputs = clip_vision.model(pixel_values=pixel_values, output_hidden_states=True)
-    outputs = outputs.hidden_states[-2].to(memory_management.intermediate_device())
-    return outputs
+    def compute():
+        image = torch.zeros([batch_size, 224, 224, 3])
+        memory_management.load_model_gpu(clip_vision.patcher)
+        pixel_values = clip_preprocess(image.to(clip_vision.load_device)).float()
+        outputs = clip_vision.model(pixel_values=pixel_values, output_hidden_states=True)
+
+        o = Output()
+        o["penultimate_hidden_states"] = outputs.hidden_states[-2].to(memory_management.intermediate_device())
+        return o
+
+    return clip_vision.cached_outputs(f"zeros/{batch_size}", compute).penultimate_hidden_states
+
+
+def detect_face(insightface, face_img):
+    """
+    Runs InsightFace on one image (HWC uint8 BGR), lowering the detection size until a face is found, and returns the
+    first face's embedding, normed_embedding and kps. Results are cached per InsightFace model and image content when
+    the model is a CachedInsightFace.
+    """
+
+    def compute():
+        for size in [(size, size) for size in range(640, 128, -64)]:
+            insightface.det_model.input_size = size  # TODO: hacky but seems to be working
+            face = insightface.get(face_img)
+            if face:
+                if 640 not in size:
+                    print(f"\033[33mINFO: InsightFace detection resolution lowered to {size}.\033[0m")
+
+                insightface.det_model.input_size = (640, 640)  # reset the detection size
+                return dict(embedding=face[0].embedding, normed_embedding=face[0].normed_embedding, kps=face[0].kps)
+
+        insightface.det_model.input_size = (640, 640)  # reset the detection size
+        raise Exception('InsightFace: No face detected.')
+
+    cache_name = getattr(insightface, 'cache_name', None)
+    if cache_name is None:
+        return compute()
+
+    return face_embedding_cache.get_or_compute(f"{cache_name}/{hash_tensor(face_img)}", compute)
 
 
 def min_(tensor_list):
@@ -545,9 +580,6 @@ class IPAdapterModelLoader:
         return (model,)
 
 
-insightface_face_align = None
-
-
 class InsightFaceLoader:
     @classmethod
     def INPUT_TYPES(s):
@@ -584,16 +616,52 @@ class InsightFaceLoader:
                 if not os.path.exists(local_path):
                     load_file_from_url(url, model_dir=model_root)
 
-        from insightface.utils import face_align
-        global insightface_face_align
-        insightface_face_align = face_align
-
         model = FaceAnalysis(name=name, root=INSIGHTFACE_DIR, providers=[provider + 'ExecutionProvider', ])
         model.prepare(ctx_id=0, det_size=(640, 640))
 
         return (model,)
 
 
+class CachedInsightFace:
+    """
+    Stands in for an InsightFace FaceAnalysis model: attribute access goes to `loader()`, so the model is only loaded
+    when a face actually has to be detected (embedding cache miss in detect_face).
+    """
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+
+    @property
+    def cache_name(self):
+        """Embedding cache key of the model: a hash of its ONNX files, or None (no caching) until they are downloaded."""
+
+        from modules import hashes
+
+        model_dir = os.path.join(INSIGHTFACE_DIR, 'models', self.name)
+        try:
+            files = sorted(x for x in os.listdir(model_dir) if x.endswith('.onnx'))
+        except OSError:
+            return None
+
+        if not files:
+            return None
+
+        h = hashlib.sha256()
+        for filename in files:
+            path = os.path.join(model_dir, filename)
+            digest = hashes.sha256(path, f"insightface/{self.name}/{filename}")
+            if digest is None:  # --no-hashing
+                stat = os.stat(path)
+                digest = f"{stat.st_size}/{stat.st_mtime_ns}"
+            h.update(f"{filename}:{digest}\n".encode())
+
+        return f"insightface/{self.name}/{h.hexdigest()[:16]}"
+
+    def __getattr__(self, item):
+        return getattr(self.loader(), item)
+
+
 class IPAdapterApply:
     def apply_ipadapter(self, ipadapter, model, weight, clip_vision=None, image=None, weight_type="original",
                         noise=None, embeds=None, attn_mask=None, start_at=0.0, end_at=1.0, unfold_batch=False,
@@ -625,44 +693,26 @@ class IPAdapterApply:
             clip_embed_zeroed = embeds[1].cpu()
         else:
             if self.is_instant_id:
-                insightface.det_model.input_size = (640, 640)  # reset the detection size
                 face_img = tensorToNP(image)
                 face_embed = []
 
                 for i in range(face_img.shape[0]):
-                    for size in [(size, size) for size in range(640, 128, -64)]:
-                        insightface.det_model.input_size = size  # TODO: hacky but seems to be working
-                        face = insightface.get(face_img[i])
-                        if face:
-                            face_embed.append(torch.from_numpy(face[0].embedding).unsqueeze(0))
-
-                            if 640 not in size:
-                                print(f"\033[33mINFO: InsightFace detection resolution lowered to {size}.\033[0m")
-                            break
-                    else:
-                        raise Exception('InsightFace: No face detected.')
+                    face = detect_face(insightface, face_img[i])
+                    face_embed.append(torch.from_numpy(face['embedding']).unsqueeze(0))
 
                 face_embed = torch.stack(face_embed, dim=0)
                 clip_embed = face_embed
             elif self.is_faceid:
-                insightface.det_model.input_size = (640, 640)  # reset the detection size
+                from insightface.utils import face_align
+
                 face_img = tensorToNP(image)
                 face_embed = []
                 face_clipvision = []
 
                 for i in range(face_img.shape[0]):
-                    for size in [(size, size) for size in range(640, 128, -64)]:
-                        insightface.det_model.input_size = size  # TODO: hacky but seems to be working
-                        face = insightface.get(face_img[i])
-                        if face:
-                            face_embed.append(torch.from_numpy(face[0].normed_embedding).unsqueeze(0))
-                            face_clipvision.append(NPToTensor(insightface_face_align.norm_crop(face_img[i], landmark=face[0].kps, image_size=224)))
-
-                            if 640 not in size:
-                                print(f"\033[33mINFO: InsightFace detection resolution lowered to {size}.\033[0m")
-                            break
-                    else:
-                        raise Exception('InsightFace: No face detected.')
+                    face = detect_face(insightface, face_img[i])
+                    face_embed.append(torch.from_numpy(face['normed_embedding']).unsqueeze(0))
+                    face_clipvision.append(NPToTensor(face_align.norm_crop(face_img[i], landmark=face['kps'], image_size=224)))
 
                 face_embed = torch.stack(face_embed, dim=0)
                 image = torch.stack(face_clipvision, dim=0)
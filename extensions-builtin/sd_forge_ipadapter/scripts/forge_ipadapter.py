@@ -3,7 +3,7 @@ from modules_forge.shared import add_supported_preprocessor
 from modules_forge.utils import numpy_to_pytorch
 from modules_forge.shared import add_supported_control_model
 from modules_forge.supported_controlnet import ControlModelPatcher
-from lib_ipadapter.IPAdapterPlus import IPAdapterApply, InsightFaceLoader
+from lib_ipadapter.IPAdapterPlus import IPAdapterApply, InsightFaceLoader, CachedInsightFace
 from pathlib import Path
 
 
@@ -43,7 +43,7 @@ class PreprocessorClipVisionWithInsightFaceForIPAdapter(PreprocessorClipVisionFo
     def __call__(self, input_image, resolution, slider_1=None, slider_2=None, slider_3=None, **kwargs):
         cond = dict(
             clip_vision=self.load_clipvision(),
-            insightface=self.load_insightface(),
+            insightface=CachedInsightFace('buffalo_l', self.load_insightface),
             image=numpy_to_pytorch(input_image),
             weight_type="original",
             noise=0.0,
@@ -74,7 +74,7 @@ class PreprocessorInsightFaceForInstantID(Preprocessor):
     def __call__(self, input_image, resolution, slider_1=None, slider_2=None, slider_3=None, **kwargs):
         cond = dict(
             clip_vision=None,
-            insightface=self.load_insightface(),
+            insightface=CachedInsightFace('antelopev2', self.load_insightface),
             image=numpy_to_pytorch(input_image),
             weight_type="original",
             noise=0.0,
@@ -8,6 +8,7 @@ import functools
 
 from backend.args import dynamic_args
 from modules import shared, sd_models, errors, scripts
+from modules.ui_extra_networks_index import IndexedFileLister
 from backend.utils import load_torch_file
 from backend.patcher.lora import model_lora_keys_clip, model_lora_keys_unet, load_lora
 
@@ -132,20 +133,29 @@ def load_networks(names, te_multipliers=None, unet_multipliers=None, dyn_dims=No
     return
 
 
-def process_network_files(names: list[str] | None = None):
-    candidates = list(shared.walk_files(shared.cmd_opts.lora_dir, allowed_extensions=[".pt", ".ckpt", ".safetensors"]))
+def process_network_files(names: list[str] | None = None, previous: dict[str, network.NetworkOnDisk] | None = None):
+    network_lister.reset()
+    candidates = list(network_lister.walk_files(shared.cmd_opts.lora_dir, allowed_extensions=[".pt", ".ckpt", ".safetensors"]))
     for filename in candidates:
-        if os.path.isdir(filename):
-            continue
         name = os.path.splitext(os.path.basename(filename))[0]
         # if names is provided, only load networks with names in the list
         if names and name not in names:
             continue
-        try:
-            entry = network.NetworkOnDisk(name, filename)
-        except OSError:  # should catch FileNotFoundError and PermissionError etc.
-            errors.report(f"Failed to load network {name} from {filename}", exc_info=True)
-            continue
+
+        # a file whose listed mtime is unchanged since the previous pass keeps its NetworkOnDisk
+        mtime = network_lister.find(filename)[1]
+        entry = (previous or {}).get(filename)
+        if entry is not None and entry.name == name and getattr(entry, 'listed_mtime', None) == mtime:
+            if entry.hash:
+                entry.set_hash(entry.hash)
+        else:
+            try:
+                entry = network.NetworkOnDisk(name, filename)
+            except OSError:  # should catch FileNotFoundError and PermissionError etc.
+                errors.report(f"Failed to load network {name} from {filename}", exc_info=True)
+                continue
+
+            entry.listed_mtime = mtime
 
         available_networks[name] = entry
 
@@ -161,6 +171,8 @@ def update_available_networks_by_names(names: list[str]):
 
 
 def list_available_networks():
+    previous = {x.filename: x for x in available_networks.values()}
+
     available_networks.clear()
     available_network_aliases.clear()
     forbidden_network_aliases.clear()
@@ -169,7 +181,7 @@ def list_available_networks():
 
     os.makedirs(shared.cmd_opts.lora_dir, exist_ok=True)
 
-    process_network_files()
+    process_network_files(previous=previous)
 
 
 re_network_name = re.compile(r"(.*)\s*\([0-9a-fA-F]+\)")
@@ -215,5 +227,6 @@ loaded_bundle_embeddings = {}
 networks_in_memory = {}
 available_network_hash_lookup = {}
 forbidden_network_aliases = {}
+network_lister = IndexedFileLister()
 
 list_available_networks()
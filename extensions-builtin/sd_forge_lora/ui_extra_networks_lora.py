@@ -32,6 +32,7 @@ class ExtraNetworksPageLora(ui_extra_networks.ExtraNetworksPage):
             "name": name,
             "filename": lora_on_disk.filename,
             "shorthash": lora_on_disk.shorthash,
+            "sha256": lora_on_disk.hash,
             "preview": self.find_preview(path) or self.find_embedded_preview(path, name, lora_on_disk.metadata),
             "description": self.find_description(path),
             "search_terms": search_terms,
@@ -68,7 +69,11 @@ class ExtraNetworksPageLora(ui_extra_networks.ExtraNetworksPage):
         # instantiate a list to protect against concurrent modification
         names = list(networks.available_networks)
         for index, name in enumerate(names):
-            item = self.create_item(name, index)
+            lora_on_disk = networks.available_networks.get(name)
+            if lora_on_disk is None:
+                continue
+
+            item = self.create_item_indexed(name, lora_on_disk.filename, index, extra=[lora_on_disk.get_alias(), lora_on_disk.hash])
             if item is not None:
                 yield item
 
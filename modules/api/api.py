@@ -162,6 +162,7 @@ class Api:
         self.add_api_route("/sdapi/v1/png-info", self.pnginfoapi, methods=["POST"], response_model=models.PNGInfoResponse)
         self.add_api_route("/sdapi/v1/progress", self.progressapi, methods=["GET"], response_model=models.ProgressResponse)
         self.add_api_route("/sdapi/v1/interrogate", self.interrogateapi, methods=["POST"])
+        self.add_api_route("/sdapi/v1/interrogate-batch", self.interrogatebatchapi, methods=["POST"], response_model=models.InterrogateBatchResponse)
         self.add_api_route("/sdapi/v1/interrupt", self.interruptapi, methods=["POST"])
         self.add_api_route("/sdapi/v1/skip", self.skip, methods=["POST"])
         self.add_api_route("/sdapi/v1/options", self.get_config, methods=["GET"], response_model=models.OptionsModel)
@@ -575,6 +576,22 @@ class Api:
 
         return models.InterrogateResponse(caption=processed)
 
+    def interrogatebatchapi(self, interrogatereq: models.InterrogateBatchRequest):
+        if not interrogatereq.images:
+            raise HTTPException(status_code=404, detail="Image not found")
+
+        images = [self.media.decode_image(image_b64).convert('RGB') for image_b64 in interrogatereq.images]
+
+        with self.queue_lock:
+            if interrogatereq.model == "clip":
+                processed = shared.interrogator.interrogate_batch(images)
+            elif interrogatereq.model == "deepdanbooru":
+                processed = [deepbooru.model.tag(img) for img in images]
+            else:
+                raise HTTPException(status_code=404, detail="Model not found")
+
+        return models.InterrogateBatchResponse(captions=processed)
+
     def interruptapi(self):
         shared.state.interrupt()
 
@@ -638,7 +655,7 @@ class Api:
 
     def get_sd_models(self):
         import modules.sd_models as sd_models
-        return [{"title": x.title, "model_name": x.model_name, "hash": x.shorthash, "sha256": x.sha256, "filename": x.filename, "config": getattr(x, 'config', None)} for x in sd_models.checkpoints_list.values()]
+        return [{"title": x.title, "model_name": x.model_name, "hash": x.shorthash, "sha256": x.sha256, "filename": x.filename, "config": getattr(x, 'config', None), "architecture": x.read_architecture().get("architecture"), "size": x.size} for x in sd_models.checkpoints_list.values()]
 
     def get_sd_vaes_and_text_encoders(self):
         from modules_forge.main_entry import module_list
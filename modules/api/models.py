@@ -198,6 +198,13 @@ class InterrogateRequest(BaseModel):
 class InterrogateResponse(BaseModel):
     caption: str | None = Field(default=None, title="Caption", description="The generated caption for the image.")
 
+class InterrogateBatchRequest(BaseModel):
+    images: list[str] = Field(default=[], title="Images", description="Images to work on, each must be a Base64 string containing the image's data.")
+    model: str = Field(default="clip", title="Model", description="The interrogate model used.")
+
+class InterrogateBatchResponse(BaseModel):
+    captions: list[str] = Field(default=[], title="Captions", description="The generated captions, in the same order as the input images.")
+
 class TrainResponse(BaseModel):
     info: str = Field(title="Train info", description="Response string from train embedding or hypernetwork task.")
 
@@ -263,6 +270,8 @@ class SDModelItem(BaseModel):
     sha256: Optional[str] = Field(title="sha256 hash")
     filename: str = Field(title="Filename")
     config: Optional[str] = Field(default=None, title="Config file")
+    architecture: Optional[str] = Field(default=None, title="Architecture", description="Model type guessed from the safetensors header")
+    size: Optional[int] = Field(default=None, title="File size in bytes")
 
 class SDModuleItem(BaseModel):
     class Config:
@@ -14,6 +14,7 @@ parser.add_argument("--reinstall-torch", action='store_true', help="launch.py ar
 parser.add_argument("--update-check", action='store_true', help="launch.py argument: check for updates at startup")
 parser.add_argument("--test-server", action='store_true', help="launch.py argument: configure server for testing")
 parser.add_argument("--log-startup", action='store_true', help="launch.py argument: print a detailed log of what's happening at startup")
+parser.add_argument("--profile-imports", action='store_true', help="launch.py argument: record the time spent importing each module at startup and print the slowest ones")
 parser.add_argument("--skip-prepare-environment", action='store_true', help="launch.py argument: skip all environment preparation")
 parser.add_argument("--skip-google-blockly", action='store_true', help="launch.py argument: do not initialize google blockly modules")
 parser.add_argument("--skip-install", action='store_true', help="launch.py argument: skip installation of packages")
@@ -106,6 +107,7 @@ parser.add_argument("--api-log", action='store_true', help="use api-log=True to
 parser.add_argument("--nowebui", action='store_true', help="use api=True to launch the API instead of the webui")
 parser.add_argument("--ui-debug-mode", action='store_true', help="Don't load model to quickly launch UI")
 parser.add_argument("--device-id", type=str, help="Select the default CUDA device to use (export CUDA_VISIBLE_DEVICES=0,1,etc might be needed before)", default=None)
+parser.add_argument("--worker-pool", type=str, help="comma-separated GPU ids, e.g. 0,1,2,3: run one API-only worker process per GPU and serve an API router on --port that sends each txt2img/img2img request to the worker that already has its checkpoint and LoRAs loaded", default=None)
 parser.add_argument("--administrator", action='store_true', help="Administrator rights", default=False)
 parser.add_argument("--cors-allow-origins", type=str, help="Allowed CORS origin(s) in the form of a comma-separated list (no spaces)", default=None)
 parser.add_argument("--cors-allow-origins-regex", type=str, help="Allowed CORS origin(s) in the form of a single regular expression", default=None)
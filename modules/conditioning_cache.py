@@ -0,0 +1,239 @@
+import hashlib
+import json
+import os
+import threading
+
+import torch
+from safetensors import safe_open
+from safetensors.torch import save_file
+
+from modules import cache, errors, shared
+from modules.shared import opts
+
+subsection = "text-encoder-conditioning"
+
+
+def file_identity(filename):
+    try:
+        stat = os.stat(filename)
+        return [os.path.basename(filename), stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        return [filename]
+
+
+def text_encoder_identity(model):
+    """Identity of the text encoder weights: checkpoint hash, separate VAE/TE files and LoRAs applied to the text encoder."""
+
+    checkpoint_info = getattr(model, "sd_checkpoint_info", None)
+    clip = getattr(getattr(model, "forge_objects", None), "clip", None)
+    lora_patches = getattr(getattr(clip, "patcher", None), "lora_patches", {})
+
+    return {
+        "checkpoint": getattr(checkpoint_info, "sha256", None) or file_identity(getattr(model, "filename", "")),
+        "modules": [file_identity(x) for x in opts.forge_additional_modules or []],
+        "loras": sorted([os.path.basename(str(filename)), strength_patch, strength_model, online_mode] for filename, strength_patch, strength_model, online_mode in lora_patches),
+        "fp8_storage": opts.fp8_storage,
+        "cache_fp16_weight": opts.cache_fp16_weight,
+    }
+
+
+def embeddings_identity(model, texts):
+    """Textual inversion embeddings the prompts can use: each loaded embedding whose name occurs in them, with its file."""
+
+    prompts = " ".join(str(x) for x in texts).lower()
+    res = []
+
+    for engine_name in ("text_processing_engine", "text_processing_engine_l", "text_processing_engine_g"):
+        embedding_db = getattr(getattr(model, engine_name, None), "embeddings", None)
+
+        for name, embedding in getattr(embedding_db, "word_embeddings", {}).items():
+            if name.lower() not in prompts:
+                continue
+
+            filename = getattr(embedding, "filename", None)
+            res.append([engine_name, name, file_identity(filename) if filename else None, embedding.shape, embedding.vectors])
+
+    return res
+
+
+def conditioning_key(model, texts) -> str:
+    from backend.args import dynamic_args
+
+    params = {
+        "text_encoder": text_encoder_identity(model),
+        "embeddings": embeddings_identity(model, texts),
+        "clip_skip": opts.CLIP_stop_at_last_layers,
+        "emphasis": dynamic_args.get("emphasis_name", opts.emphasis),
+        "texts": list(texts),
+        "negative": bool(getattr(texts, "is_negative_prompt", False)),
+    }
+
+    # SDXL adds the image size and crop to the pooled vector; Flux adds the distilled CFG scale as guidance
+    if hasattr(model, "embedder"):
+        params["size"] = [getattr(texts, "width", None) or 1024, getattr(texts, "height", None) or 1024, opts.sdxl_crop_left, opts.sdxl_crop_top]
+
+    if getattr(model, "use_distilled_cfg_scale", False):
+        params["distilled_cfg_scale"] = getattr(texts, "distilled_cfg_scale", None) or 3.5
+
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ConditioningStore:
+    """
+    On-disk cache of text encoder outputs (model.get_learned_conditioning) as one safetensors file per entry,
+    loaded memory-mapped. Entries are keyed by text encoder identity, the textual inversion embeddings used, clip skip,
+    emphasis mode, prompt texts and the size/guidance inputs some models add; the directory is kept under `text_encoder_cache_mb`, evicting the
+    least recently used files (hits touch the file's mtime, so recency survives restarts).
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.entries = None
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.safetensors")
+
+    def load_index(self):
+        if self.entries is not None:
+            return
+
+        self.entries = {}
+        os.makedirs(self.directory, exist_ok=True)
+
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".safetensors"):
+                stat = entry.stat()
+                self.entries[entry.name[:-len(".safetensors")]] = (stat.st_size, stat.st_mtime)
+
+        self.size = sum(size for size, _ in self.entries.values())
+
+    def contains(self, key):
+        with self.lock:
+            self.load_index()
+            return key in self.entries
+
+    def get(self, key, device):
+        if not self.contains(key):
+            return None
+
+        path = self.path(key)
+
+        try:
+            with safe_open(path, framework="pt") as file:
+                metadata = file.metadata() or {}
+                tensors = {k: file.get_tensor(k) for k in file.keys()}
+            os.utime(path)
+        except Exception:
+            with self.lock:
+                self.forget(key)
+            return None
+
+        on_cpu = set(json.loads(metadata.get("cpu", "[]")))
+        tensors = {k: v if k in on_cpu else v.to(device) for k, v in tensors.items()}
+
+        return tensors[""] if metadata.get("kind") == "tensor" else tensors
+
+    def put(self, key, conds):
+        tensors = {"": conds} if isinstance(conds, torch.Tensor) else dict(conds)
+        if not all(isinstance(v, torch.Tensor) for v in tensors.values()):
+            return
+
+        metadata = {
+            "kind": "tensor" if isinstance(conds, torch.Tensor) else "dict",
+            "cpu": json.dumps([k for k, v in tensors.items() if v.device.type == "cpu"]),
+        }
+
+        path = self.path(key)
+        temp_path = f"{path}.tmp"
+
+        with self.lock:
+            self.load_index()
+
+            try:
+                save_file({k: v.detach().cpu().contiguous() for k, v in tensors.items()}, temp_path, metadata=metadata)
+                os.replace(temp_path, path)
+            except Exception as e:
+                errors.display(e, f"saving text encoder cache entry {path}")
+                return
+
+            self.forget(key, remove=False)
+            size = os.path.getsize(path)
+            self.entries[key] = (size, os.path.getmtime(path))
+            self.size += size
+
+            self.evict(int(opts.text_encoder_cache_mb) * 1024 * 1024)
+
+    def forget(self, key, remove=True):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[0]
+
+        if remove:
+            try:
+                os.remove(self.path(key))
+            except OSError:
+                pass
+
+    def evict(self, budget):
+        if self.size <= budget:
+            return
+
+        for key, _ in sorted(self.entries.items(), key=lambda x: x[1][1]):
+            if self.size <= budget:
+                break
+
+            self.forget(key)
+
+
+store = ConditioningStore(os.path.join(cache.cache_dir, subsection))
+
+
+def get_learned_conditioning(model, texts):
+    """model.get_learned_conditioning(texts) through the on-disk store, when text_encoder_cache is enabled."""
+
+    if not opts.text_encoder_cache:
+        return model.get_learned_conditioning(texts)
+
+    key = conditioning_key(model, texts)
+    conds = store.get(key, shared.device)
+
+    if conds is None:
+        conds = model.get_learned_conditioning(texts)
+        store.put(key, conds)
+
+    return conds
+
+
+def prewarm_styles(model):
+    """Encodes the prompts and negative prompts of all styles that are not in the store yet, so requests using them skip the text encoder."""
+
+    if not opts.text_encoder_cache or not opts.text_encoder_cache_prewarm_styles or getattr(shared, "prompt_styles", None) is None:
+        return
+
+    from modules.prompt_parser import SdConditioning
+
+    model.set_clip_skip(int(opts.CLIP_stop_at_last_layers))
+
+    count = 0
+    for style in list(shared.prompt_styles.styles.values()):
+        for text, is_negative in ((style.prompt, False), (style.negative_prompt, True)):
+            if not text or "{prompt}" in text:
+                continue
+
+            texts = SdConditioning([text], is_negative_prompt=is_negative)
+            key = conditioning_key(model, texts)
+            if store.contains(key):
+                continue
+
+            try:
+                with torch.inference_mode():
+                    store.put(key, model.get_learned_conditioning(texts))
+                count += 1
+            except Exception as e:
+                errors.display(e, f"encoding style {style.name}")
+                return
+
+    if count:
+        print(f"Text encoder cache: encoded {count} style prompts.")
@@ -213,6 +213,10 @@ def get_user_metadata(filename, lister=None):
     basename, ext = os.path.splitext(filename)
     metadata_filename = basename + '.json'
 
+    read_json = getattr(lister, "read_json", None)
+    if read_json is not None:
+        return read_json(metadata_filename) or {}
+
     metadata = {}
     try:
         exists = lister.exists(metadata_filename) if lister else os.path.exists(metadata_filename)
@@ -7,7 +7,7 @@ import json
 import torch
 import tqdm
 
-from modules import shared, images, sd_models, sd_vae, sd_models_config, errors
+from modules import shared, images, sd_models, sd_vae, sd_models_config, errors, devices, model_merger
 from modules.ui_common import plaintext_to_html
 import gradio as gr
 import safetensors.torch
@@ -85,6 +85,66 @@ def read_metadata(primary_model_name, secondary_model_name, tertiary_model_name)
     return json.dumps(metadata, indent=4, ensure_ascii=False)
 
 
+def build_merge_metadata(primary_model_info, secondary_model_info, tertiary_model_info, interp_method, multiplier, save_as_half, custom_name, config_source, bake_in_vae, discard_weights, save_metadata, add_merge_recipe, copy_metadata_fields, metadata_json, result_is_inpainting_model, result_is_instruct_pix2pix_model):
+    metadata = {}
+
+    if save_metadata and copy_metadata_fields:
+        if primary_model_info:
+            metadata.update(primary_model_info.metadata)
+        if secondary_model_info:
+            metadata.update(secondary_model_info.metadata)
+        if tertiary_model_info:
+            metadata.update(tertiary_model_info.metadata)
+
+    if save_metadata:
+        try:
+            metadata.update(json.loads(metadata_json))
+        except Exception as e:
+            errors.display(e, "readin metadata from json")
+
+        metadata["format"] = "pt"
+
+    if save_metadata and add_merge_recipe:
+        merge_recipe = {
+            "type": "webui", # indicate this model was merged with webui's built-in merger
+            "primary_model_hash": primary_model_info.sha256,
+            "secondary_model_hash": secondary_model_info.sha256 if secondary_model_info else None,
+            "tertiary_model_hash": tertiary_model_info.sha256 if tertiary_model_info else None,
+            "interp_method": interp_method,
+            "multiplier": multiplier,
+            "save_as_half": save_as_half,
+            "custom_name": custom_name,
+            "config_source": config_source,
+            "bake_in_vae": bake_in_vae,
+            "discard_weights": discard_weights,
+            "is_inpainting": result_is_inpainting_model,
+            "is_instruct_pix2pix": result_is_instruct_pix2pix_model
+        }
+
+        sd_merge_models = {}
+
+        def add_model_metadata(checkpoint_info):
+            checkpoint_info.calculate_shorthash()
+            sd_merge_models[checkpoint_info.sha256] = {
+                "name": checkpoint_info.name,
+                "legacy_hash": checkpoint_info.hash,
+                "sd_merge_recipe": checkpoint_info.metadata.get("sd_merge_recipe", None)
+            }
+
+            sd_merge_models.update(checkpoint_info.metadata.get("sd_merge_models", {}))
+
+        add_model_metadata(primary_model_info)
+        if secondary_model_info:
+            add_model_metadata(secondary_model_info)
+        if tertiary_model_info:
+            add_model_metadata(tertiary_model_info)
+
+        metadata["sd_merge_recipe"] = json.dumps(merge_recipe)
+        metadata["sd_merge_models"] = json.dumps(sd_merge_models)
+
+    return metadata
+
+
 def run_modelmerger(id_task, primary_model_name, secondary_model_name, tertiary_model_name, interp_method, multiplier, save_as_half, custom_name, checkpoint_format, config_source, bake_in_vae, discard_weights, save_metadata, add_merge_recipe, copy_metadata_fields, metadata_json):
     shared.state.begin(job="model-merge")
 
@@ -147,6 +207,9 @@ def run_modelmerger(id_task, primary_model_name, secondary_model_name, tertiary_
     result_is_inpainting_model = False
     result_is_instruct_pix2pix_model = False
 
+    if checkpoint_format == "safetensors":
+        return run_modelmerger_streaming(primary_model_info, secondary_model_info, tertiary_model_info, filename_generator, interp_method, multiplier, save_as_half, custom_name, bake_in_vae, discard_weights, save_metadata, add_merge_recipe, copy_metadata_fields, metadata_json, config_source)
+
     if theta_func2:
         shared.state.textinfo = "Loading B"
         print(f"Loading {secondary_model_info.filename}...")
@@ -254,76 +317,81 @@ def run_modelmerger(id_task, primary_model_name, secondary_model_name, tertiary_
     shared.state.textinfo = "Saving"
     print(f"Saving to {output_modelname}...")
 
-    metadata = {}
+    metadata = build_merge_metadata(primary_model_info, secondary_model_info, tertiary_model_info, interp_method, multiplier, save_as_half, custom_name, config_source, bake_in_vae, discard_weights, save_metadata, add_merge_recipe, copy_metadata_fields, metadata_json, result_is_inpainting_model, result_is_instruct_pix2pix_model)
 
-    if save_metadata and copy_metadata_fields:
-        if primary_model_info:
-            metadata.update(primary_model_info.metadata)
-        if secondary_model_info:
-            metadata.update(secondary_model_info.metadata)
-        if tertiary_model_info:
-            metadata.update(tertiary_model_info.metadata)
+    _, extension = os.path.splitext(output_modelname)
+    if extension.lower() == ".safetensors":
+        safetensors.torch.save_file(theta_0, output_modelname, metadata=metadata if len(metadata)>0 else None)
+    else:
+        torch.save(theta_0, output_modelname)
 
-    if save_metadata:
-        try:
-            metadata.update(json.loads(metadata_json))
-        except Exception as e:
-            errors.display(e, "readin metadata from json")
+    sd_models.list_models()
+    created_model = next((ckpt for ckpt in sd_models.checkpoints_list.values() if ckpt.name == filename), None)
+    if created_model:
+        created_model.calculate_shorthash()
 
-        metadata["format"] = "pt"
+    # TODO inside create_config() sd_models_config.find_checkpoint_config_near_filename() is called which has been commented out
+    #create_config(output_modelname, config_source, primary_model_info, secondary_model_info, tertiary_model_info)
 
-    if save_metadata and add_merge_recipe:
-        merge_recipe = {
-            "type": "webui", # indicate this model was merged with webui's built-in merger
-            "primary_model_hash": primary_model_info.sha256,
-            "secondary_model_hash": secondary_model_info.sha256 if secondary_model_info else None,
-            "tertiary_model_hash": tertiary_model_info.sha256 if tertiary_model_info else None,
-            "interp_method": interp_method,
-            "multiplier": multiplier,
-            "save_as_half": save_as_half,
-            "custom_name": custom_name,
-            "config_source": config_source,
-            "bake_in_vae": bake_in_vae,
-            "discard_weights": discard_weights,
-            "is_inpainting": result_is_inpainting_model,
-            "is_instruct_pix2pix": result_is_instruct_pix2pix_model
-        }
+    print(f"Checkpoint saved to {output_modelname}.")
+    shared.state.textinfo = "Checkpoint saved"
+    shared.state.end()
 
-        sd_merge_models = {}
+    return [*[gr.Dropdown.update(choices=sd_models.checkpoint_tiles()) for _ in range(4)], "Checkpoint saved to " + output_modelname]
 
-        def add_model_metadata(checkpoint_info):
-            checkpoint_info.calculate_shorthash()
-            sd_merge_models[checkpoint_info.sha256] = {
-                "name": checkpoint_info.name,
-                "legacy_hash": checkpoint_info.hash,
-                "sd_merge_recipe": checkpoint_info.metadata.get("sd_merge_recipe", None)
-            }
 
-            sd_merge_models.update(checkpoint_info.metadata.get("sd_merge_models", {}))
+def run_modelmerger_streaming(primary_model_info, secondary_model_info, tertiary_model_info, filename_generator, interp_method, multiplier, save_as_half, custom_name, bake_in_vae, discard_weights, save_metadata, add_merge_recipe, copy_metadata_fields, metadata_json, config_source):
+    """Same as run_modelmerger for safetensors output, but streams tensors through model_merger.StreamingMerger instead of holding whole checkpoints in RAM."""
 
-        add_model_metadata(primary_model_info)
-        if secondary_model_info:
-            add_model_metadata(secondary_model_info)
-        if tertiary_model_info:
-            add_model_metadata(tertiary_model_info)
+    shared.state.job_count = 1
+    shared.state.textinfo = "Reading model headers"
 
-        metadata["sd_merge_recipe"] = json.dumps(merge_recipe)
-        metadata["sd_merge_models"] = json.dumps(sd_merge_models)
+    bake_in_vae_filename = sd_vae.vae_dict.get(bake_in_vae, None)
 
-    _, extension = os.path.splitext(output_modelname)
-    if extension.lower() == ".safetensors":
-        safetensors.torch.save_file(theta_0, output_modelname, metadata=metadata if len(metadata)>0 else None)
-    else:
-        torch.save(theta_0, output_modelname)
+    merger = model_merger.StreamingMerger(
+        primary=model_merger.open_source(primary_model_info.filename, sd_models.load_torch_file),
+        secondary=model_merger.open_source(secondary_model_info.filename, sd_models.load_torch_file) if secondary_model_info else None,
+        tertiary=model_merger.open_source(tertiary_model_info.filename, sd_models.load_torch_file) if tertiary_model_info else None,
+        vae=model_merger.open_source(bake_in_vae_filename, sd_vae.load_torch_file) if bake_in_vae_filename is not None else None,
+        interp_method=interp_method,
+        multiplier=multiplier,
+        save_as_half=save_as_half,
+        discard_weights=discard_weights,
+        skip_keys=checkpoint_dict_skip_on_merge,
+        device=devices.device if shared.opts.model_merger_device == "GPU" else devices.cpu,
+        threads=shared.opts.model_merger_threads,
+        chunk_bytes=shared.opts.model_merger_chunk_size_mb * 1024 * 1024,
+    )
+
+    ckpt_dir = shared.cmd_opts.ckpt_dir or sd_models.model_path
+
+    filename = filename_generator() if custom_name == '' else custom_name
+    filename += ".inpainting" if merger.is_inpainting else ""
+    filename += ".instruct-pix2pix" if merger.is_instruct_pix2pix else ""
+    filename += ".safetensors"
+
+    output_modelname = os.path.join(ckpt_dir, filename)
+
+    metadata = build_merge_metadata(primary_model_info, secondary_model_info, tertiary_model_info, interp_method, multiplier, save_as_half, custom_name, config_source, bake_in_vae, discard_weights, save_metadata, add_merge_recipe, copy_metadata_fields, metadata_json, merger.is_inpainting, merger.is_instruct_pix2pix)
+
+    print(f"Merging into {output_modelname} ({len(merger.entries)} tensors, {shared.opts.model_merger_threads} threads)...")
+    shared.state.textinfo = "Merging and saving"
+    shared.state.sampling_steps = len(merger.entries)
+
+    progress = tqdm.tqdm(total=len(merger.entries))
+
+    def on_entry_done(entry):
+        progress.update()
+        shared.state.sampling_step += 1
+
+    merger.save(output_modelname, metadata=metadata if len(metadata) > 0 else None, progress=on_entry_done)
+    progress.close()
 
     sd_models.list_models()
     created_model = next((ckpt for ckpt in sd_models.checkpoints_list.values() if ckpt.name == filename), None)
     if created_model:
         created_model.calculate_shorthash()
 
-    # TODO inside create_config() sd_models_config.find_checkpoint_config_near_filename() is called which has been commented out
-    #create_config(output_modelname, config_source, primary_model_info, secondary_model_info, tertiary_model_info)
-
     print(f"Checkpoint saved to {output_modelname}.")
     shared.state.textinfo = "Checkpoint saved"
     shared.state.end()
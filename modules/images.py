@@ -4,9 +4,13 @@ import datetime
 import functools
 import pytz
 import io
+import itertools
 import math
 import os
+import threading
+import time
 from collections import namedtuple
+from contextlib import contextmanager
 import re
 
 import numpy as np
@@ -574,6 +578,127 @@ def get_next_sequence_number(path, basename):
     return result + 1
 
 
+@contextmanager
+def exclusive_lock_file(filename, stale_after=10):
+    """
+    Cross-process lock: the lock file is created with O_CREAT | O_EXCL and removed on exit.
+    A lock file older than `stale_after` seconds is assumed to be left by a crashed process and is removed.
+    """
+    while True:
+        try:
+            fd = os.open(filename, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(filename) > stale_after:
+                    os.remove(filename)
+                    continue
+            except OSError:
+                pass
+
+            time.sleep(0.005)
+
+    try:
+        yield
+    finally:
+        os.close(fd)
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+
+class SequenceAllocator:
+    """
+    Hands out filename sequence numbers per (directory, basename) without listing the directory on every save.
+
+    The next free number for each basename is kept in `.sequence.json` in the directory, and is read and advanced
+    under `.sequence.lock`, so processes saving into the same directory never get the same number. The directory is
+    listed (get_next_sequence_number) only the first time a basename is used there. Numbers reserved for a batch with
+    `reserve` are handed out from memory without touching the disk.
+    """
+
+    state_filename = ".sequence.json"
+    lock_filename = ".sequence.lock"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reserved = {}
+
+    def read_state(self, state_path):
+        try:
+            with open(state_path, "r", encoding="utf8") as file:
+                state = json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+        return state if isinstance(state, dict) else {}
+
+    def claim(self, path, basename, count):
+        state_path = os.path.join(path, self.state_filename)
+
+        # the first use of a basename lists the directory; that is done before taking the lock, which is held only
+        # for the read-modify-write of the state file and so never gets old enough to be broken as stale
+        scanned = None
+        if not isinstance(self.read_state(state_path).get(basename, None), int):
+            scanned = get_next_sequence_number(path, basename)
+
+        with exclusive_lock_file(os.path.join(path, self.lock_filename)):
+            state = self.read_state(state_path)
+
+            start = state.get(basename, None)
+            if not isinstance(start, int):
+                start = scanned if scanned is not None else get_next_sequence_number(path, basename)
+            elif scanned is not None:
+                start = max(start, scanned)
+
+            state[basename] = start + count
+
+            temp_path = f"{state_path}.tmp"
+            with open(temp_path, "w", encoding="utf8") as file:
+                json.dump(state, file)
+            os.replace(temp_path, state_path)
+
+        return start
+
+    def allocate(self, path, basename, count=1):
+        """First of `count` consecutive unused sequence numbers for files named `<basename>-<number>...` in `path`."""
+
+        key = (os.path.abspath(path), basename)
+
+        with self.lock:
+            block = self.reserved.get(key, None)
+            if block is not None and block[1] - block[0] >= count:
+                start = block[0]
+                block[0] += count
+                if block[0] == block[1]:
+                    del self.reserved[key]
+
+                return start
+
+            return self.claim(key[0], basename, count)
+
+    def reserve(self, path, basename, count):
+        """Claims `count` numbers at once; the following `count` calls to allocate for the same path/basename use them."""
+
+        key = (os.path.abspath(path), basename)
+
+        with self.lock:
+            block = self.reserved.get(key, None)
+            remaining = 0 if block is None else block[1] - block[0]
+            if remaining >= count:
+                return
+
+            start = self.claim(key[0], basename, count - remaining)
+            if block is not None and block[1] == start:
+                block[1] = start + count - remaining
+            else:
+                self.reserved[key] = [start, start + count - remaining]
+
+
+sequence_allocator = SequenceAllocator()
+
+
 def save_image_with_geninfo(image, geninfo, filename, extension=None, existing_pnginfo=None, pnginfo_section_name='parameters'):
     """
     Saves image to filename, including geninfo as text information for generation info.
@@ -633,7 +758,7 @@ def save_image_with_geninfo(image, geninfo, filename, extension=None, existing_p
         image.save(filename, format=image_format, quality=opts.jpeg_quality)
 
 
-def save_image(image, path, basename, seed=None, prompt=None, extension='png', info=None, short_filename=False, no_prompt=False, grid=False, pnginfo_section_name='parameters', p=None, existing_info=None, forced_filename=None, suffix="", save_to_dirs=None):
+def save_image(image, path, basename, seed=None, prompt=None, extension='png', info=None, short_filename=False, no_prompt=False, grid=False, pnginfo_section_name='parameters', p=None, existing_info=None, forced_filename=None, suffix="", save_to_dirs=None, reserved_names=None, defer_write=None):
     """Save an image.
 
     Args:
@@ -659,6 +784,11 @@ def save_image(image, path, basename, seed=None, prompt=None, extension='png', i
             If specified, `basename` and filename pattern will be ignored.
         save_to_dirs (bool):
             If true, the image will be saved into a subdirectory of `path`.
+        reserved_names (`set`):
+            Numbered names (path without decoration and extension) taken by images that are not written yet; the chosen name is added.
+        defer_write (`callable`):
+            If specified, called with the function that encodes and writes the image and the `ImageSaveParams`, after the
+            `before_image_saved` callbacks; its result is returned, and the caller runs the `image_saved` callbacks once written.
 
     Returns: (fullfn, txt_fullfn)
         fullfn (`str`):
@@ -701,13 +831,22 @@ def save_image(image, path, basename, seed=None, prompt=None, extension='png', i
             file_decoration = f"-{file_decoration}"
 
         if add_number:
-            basecount = get_next_sequence_number(path, basename)
+            if opts.save_images_sequence_file:
+                numbers = iter(functools.partial(sequence_allocator.allocate, path, basename), None)
+            else:
+                numbers = itertools.count(get_next_sequence_number(path, basename))
+
             fullfn = None
-            for i in range(500):
-                fn = f"{basecount + i:05}" if basename == '' else f"{basename}-{basecount + i:04}"
+            for _, number in zip(range(500), numbers):
+                fn = f"{number:05}" if basename == '' else f"{basename}-{number:04}"
                 fullfn = os.path.join(path, f"{fn}{file_decoration}.{extension}")
+                if reserved_names is not None and os.path.join(path, fn) in reserved_names:
+                    continue
                 if not os.path.exists(fullfn):
                     break
+
+            if reserved_names is not None:
+                reserved_names.add(os.path.join(path, fn))
         else:
             fullfn = os.path.join(path, f"{file_decoration}.{extension}")
     else:
@@ -745,44 +884,52 @@ def save_image(image, path, basename, seed=None, prompt=None, extension='png', i
         os.replace(temp_file_path, filename)
         return without_extension
 
-    fullfn_without_extension, extension = os.path.splitext(params.filename)
-    if hasattr(os, 'statvfs'):
-        max_name_len = os.statvfs(path).f_namemax
-        fullfn_without_extension = fullfn_without_extension[:max_name_len - max(4, len(extension))]
-        params.filename = fullfn_without_extension + extension
-        fullfn = params.filename
-
-    fullfn_without_extension = _atomically_save_image(image, fullfn_without_extension, extension)
-    fullfn = fullfn_without_extension + extension
-    image.already_saved_as = fullfn
-
-    oversize = image.width > opts.target_side_length or image.height > opts.target_side_length
-    if opts.export_for_4chan and (oversize or os.stat(fullfn).st_size > opts.img_downscale_threshold * 1024 * 1024):
-        ratio = image.width / image.height
-        resize_to = None
-        if oversize and ratio > 1:
-            resize_to = round(opts.target_side_length), round(image.height * opts.target_side_length / image.width)
-        elif oversize:
-            resize_to = round(image.width * opts.target_side_length / image.height), round(opts.target_side_length)
-
-        if resize_to is not None:
+    def write():
+        fullfn_without_extension, extension = os.path.splitext(params.filename)
+        if hasattr(os, 'statvfs'):
+            max_name_len = os.statvfs(path).f_namemax
+            fullfn_without_extension = fullfn_without_extension[:max_name_len - max(4, len(extension))]
+            params.filename = fullfn_without_extension + extension
+            fullfn = params.filename
+
+        fullfn_without_extension = _atomically_save_image(image, fullfn_without_extension, extension)
+        fullfn = fullfn_without_extension + extension
+        image.already_saved_as = fullfn
+
+        oversize = image.width > opts.target_side_length or image.height > opts.target_side_length
+        if opts.export_for_4chan and (oversize or os.stat(fullfn).st_size > opts.img_downscale_threshold * 1024 * 1024):
+            ratio = image.width / image.height
+            resize_to = None
+            if oversize and ratio > 1:
+                resize_to = round(opts.target_side_length), round(image.height * opts.target_side_length / image.width)
+            elif oversize:
+                resize_to = round(image.width * opts.target_side_length / image.height), round(opts.target_side_length)
+
+            downscaled = image
+            if resize_to is not None:
+                try:
+                    # Resizing image with LANCZOS could throw an exception if e.g. image mode is I;16
+                    downscaled = image.resize(resize_to, LANCZOS)
+                except Exception:
+                    downscaled = image.resize(resize_to)
             try:
-                # Resizing image with LANCZOS could throw an exception if e.g. image mode is I;16
-                image = image.resize(resize_to, LANCZOS)
-            except Exception:
-                image = image.resize(resize_to)
-        try:
-            _ = _atomically_save_image(image, fullfn_without_extension, ".jpg")
-        except Exception as e:
-            errors.display(e, "saving image as downscaled JPG")
-
-    if opts.save_txt and info is not None:
-        txt_fullfn = f"{fullfn_without_extension}.txt"
-        with open(txt_fullfn, "w", encoding="utf8") as file:
-            file.write(f"{info}\n")
-    else:
-        txt_fullfn = None
+                _ = _atomically_save_image(downscaled, fullfn_without_extension, ".jpg")
+            except Exception as e:
+                errors.display(e, "saving image as downscaled JPG")
+
+        if opts.save_txt and info is not None:
+            txt_fullfn = f"{fullfn_without_extension}.txt"
+            with open(txt_fullfn, "w", encoding="utf8") as file:
+                file.write(f"{info}\n")
+        else:
+            txt_fullfn = None
+
+        return fullfn, txt_fullfn
+
+    if defer_write is not None:
+        return defer_write(write, params)
 
+    fullfn, txt_fullfn = write()
     script_callbacks.image_saved_callback(params)
 
     return fullfn, txt_fullfn
@@ -0,0 +1,92 @@
+import builtins
+import importlib
+import importlib.util
+import sys
+import threading
+import time
+
+
+class ImportProfiler:
+    """
+    Records how long every module takes to import the first time, by wrapping `builtins.__import__` and
+    `importlib.import_module`.
+
+    `cumulative` is the total time of an import including the modules it imported; `self_time` excludes them.
+    Enabled with --profile-imports; the report is printed with the startup time.
+    """
+
+    def __init__(self):
+        self.cumulative = {}
+        self.self_time = {}
+        self.local = threading.local()
+        self.original_import = None
+        self.original_import_module = None
+
+    def install(self):
+        self.original_import = builtins.__import__
+        self.original_import_module = importlib.import_module
+
+        builtins.__import__ = self.wrapped_import
+        importlib.import_module = self.wrapped_import_module
+
+    def uninstall(self):
+        if self.original_import is not None:
+            builtins.__import__ = self.original_import
+            importlib.import_module = self.original_import_module
+
+    def measure(self, name, func, *args):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+
+        frame = [0.0]
+        stack.append(frame)
+        start = time.perf_counter()
+
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+
+            if stack:
+                stack[-1][0] += elapsed
+
+            self.cumulative[name] = self.cumulative.get(name, 0.0) + elapsed
+            self.self_time[name] = self.self_time.get(name, 0.0) + elapsed - frame[0]
+
+    def wrapped_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level:
+            try:
+                name_resolved = importlib.util.resolve_name("." * level + name, (globals or {}).get("__package__"))
+            except (ImportError, ValueError):
+                name_resolved = name
+        else:
+            name_resolved = name
+
+        if name_resolved in sys.modules:
+            return self.original_import(name, globals, locals, fromlist, level)
+
+        return self.measure(name_resolved, self.original_import, name, globals, locals, fromlist, level)
+
+    def wrapped_import_module(self, name, package=None):
+        name_resolved = importlib.util.resolve_name(name, package) if name.startswith(".") else name
+
+        if name_resolved in sys.modules:
+            return self.original_import_module(name, package)
+
+        return self.measure(name_resolved, self.original_import_module, name, package)
+
+    def top(self, limit=30):
+        """Slowest imports by cumulative time: list of (module, cumulative seconds, self seconds)."""
+
+        items = sorted(self.cumulative.items(), key=lambda x: x[1], reverse=True)[:limit]
+        return [(name, cumulative, self.self_time.get(name, 0.0)) for name, cumulative in items]
+
+    def report(self, limit=30):
+        lines = [f"Slowest imports ({len(self.cumulative)} modules imported):", f"{'cumulative':>10} {'self':>8}  module"]
+        lines += [f"{cumulative:>9.3f}s {self_time:>7.3f}s  {name}" for name, cumulative, self_time in self.top(limit)]
+        return "\n".join(lines)
+
+    def dump(self, limit=100):
+        return [{"module": name, "cumulative": cumulative, "self": self_time} for name, cumulative, self_time in self.top(limit)]
@@ -10,7 +10,7 @@ import torch.hub
 from torchvision import transforms
 from torchvision.transforms.functional import InterpolationMode
 
-from modules import devices, paths, shared, modelloader, errors
+from modules import devices, paths, shared, modelloader, errors, cache
 from backend import memory_management
 from backend.patcher.base import ModelPatcher
 
@@ -18,7 +18,7 @@ from backend.patcher.base import ModelPatcher
 blip_image_eval_size = 384
 clip_model_name = 'ViT-L/14'
 
-Category = namedtuple("Category", ["name", "topn", "items"])
+Category = namedtuple("Category", ["name", "topn", "items", "filename"], defaults=(None,))
 
 re_topn = re.compile(r"\.top(\d+)$")
 
@@ -67,6 +67,9 @@ class InterrogateModels:
         self.blip_patcher = None
         self.clip_patcher = None
 
+        # normalized text embeddings per category file; see category_text_features()
+        self.text_features = {}
+
     def categories(self):
         if not os.path.exists(self.content_dir):
             download_default_clip_interrogate_categories(self.content_dir)
@@ -88,7 +91,7 @@ class InterrogateModels:
                 with open(filename, "r", encoding="utf8") as file:
                     lines = [x.strip() for x in file.readlines()]
 
-                self.loaded_categories.append(Category(name=filename.stem, topn=topn, items=lines))
+                self.loaded_categories.append(Category(name=filename.stem, topn=topn, items=lines, filename=str(filename)))
 
         return self.loaded_categories
 
@@ -149,38 +152,91 @@ class InterrogateModels:
     def unload(self):
         pass
 
-    def rank(self, image_features, text_array, top_count=1):
-        import clip
+    def dict_limit(self, text_array):
+        if shared.opts.interrogate_clip_dict_limit != 0:
+            return text_array[0:int(shared.opts.interrogate_clip_dict_limit)]
 
-        devices.torch_gc()
+        return text_array
 
-        if shared.opts.interrogate_clip_dict_limit != 0:
-            text_array = text_array[0:int(shared.opts.interrogate_clip_dict_limit)]
+    def encode_text(self, text_array):
+        import clip
 
-        top_count = min(top_count, len(text_array))
         text_tokens = clip.tokenize(list(text_array), truncate=True).to(self.load_device)
         text_features = self.clip_model.encode_text(text_tokens).type(self.dtype)
         text_features /= text_features.norm(dim=-1, keepdim=True)
+        return text_features
+
+    def category_text_features(self, cat):
+        """
+        Returns normalized CLIP text embeddings for a category, computed once per CLIP model and cached on disk.
+        The disk cache entry is invalidated when the category file's mtime changes.
+        """
+
+        text_array = self.dict_limit(cat.items)
+
+        if cat.filename is None:
+            return self.encode_text(text_array)
+
+        title = f"{clip_model_name}/{self.dtype}/{len(text_array)}/{cat.name}"
+        key = (title, os.path.getmtime(cat.filename))
+
+        text_features = self.text_features.get(key)
+        if text_features is None:
+            def encode():
+                with torch.no_grad(), devices.autocast():
+                    return self.encode_text(text_array).cpu()
 
-        similarity = torch.zeros((1, len(text_array))).to(self.load_device)
-        for i in range(image_features.shape[0]):
-            similarity += (100.0 * image_features[i].unsqueeze(0) @ text_features.T).softmax(dim=-1)
-        similarity /= image_features.shape[0]
+            text_features = cache.cached_data_for_file("interrogate-clip-text", title, cat.filename, encode)
+            text_features = text_features.to(device=self.load_device, dtype=self.dtype)
+
+            self.text_features = {k: v for k, v in self.text_features.items() if k[0] != title}
+            self.text_features[key] = text_features
+
+        return text_features
+
+    def rank(self, image_features, text_array, top_count=1, text_features=None):
+        devices.torch_gc()
+
+        text_array = self.dict_limit(text_array)
+
+        top_count = min(top_count, len(text_array))
+        if text_features is None:
+            text_features = self.encode_text(text_array)
+
+        similarity = (100.0 * image_features @ text_features.T).softmax(dim=-1).mean(dim=0, keepdim=True)
 
         top_probs, top_labels = similarity.cpu().topk(top_count, dim=-1)
         return [(text_array[top_labels[0][i].numpy()], (top_probs[0][i].numpy()*100)) for i in range(top_count)]
 
+    def rank_batch(self, image_features, text_array, top_count=1, text_features=None):
+        """Same as rank(), but for each row of image_features separately; returns one list of matches per image."""
+
+        text_array = self.dict_limit(text_array)
+
+        top_count = min(top_count, len(text_array))
+        if text_features is None:
+            text_features = self.encode_text(text_array)
+
+        similarity = (100.0 * image_features @ text_features.T).softmax(dim=-1)
+
+        top_probs, top_labels = similarity.cpu().topk(top_count, dim=-1)
+        return [[(text_array[top_labels[n][i].numpy()], (top_probs[n][i].numpy()*100)) for i in range(top_count)] for n in range(image_features.shape[0])]
+
     def generate_caption(self, pil_image):
-        gpu_image = transforms.Compose([
+        return self.generate_captions([pil_image])[0]
+
+    def generate_captions(self, pil_images):
+        transform = transforms.Compose([
             transforms.Resize((blip_image_eval_size, blip_image_eval_size), interpolation=InterpolationMode.BICUBIC),
             transforms.ToTensor(),
             transforms.Normalize((0.48145466, 0.4578275, 0.40821073), (0.26862954, 0.26130258, 0.27577711))
-        ])(pil_image).unsqueeze(0).type(self.dtype).to(self.load_device)
+        ])
+        gpu_image = torch.stack([transform(pil_image) for pil_image in pil_images]).type(self.dtype).to(self.load_device)
 
         with torch.no_grad():
             caption = self.blip_model.generate(gpu_image, sample=False, num_beams=int(shared.opts.interrogate_clip_num_beams), min_length=int(shared.opts.interrogate_clip_min_length), max_length=shared.opts.interrogate_clip_max_length)
 
-        return caption[0]
+        return caption
 
     def interrogate(self, pil_image):
         res = ""
@@ -202,7 +258,7 @@ class InterrogateModels:
                 image_features /= image_features.norm(dim=-1, keepdim=True)
 
                 for cat in self.categories():
-                    matches = self.rank(image_features, cat.items, top_count=cat.topn)
+                    matches = self.rank(image_features, cat.items, top_count=cat.topn, text_features=self.category_text_features(cat))
                     for match, score in matches:
                         if shared.opts.interrogate_return_ranks:
                             res += f", ({match}:{score/100:.3f})"
@@ -217,3 +273,48 @@ class InterrogateModels:
         shared.state.end()
 
         return res
+
+    def interrogate_batch(self, pil_images):
+        """
+        Interrogates many images at once: BLIP captions and CLIP image embeddings are computed in batches of
+        interrogate_clip_batch_size images per forward, category text embeddings come from the cache.
+        """
+
+        results = []
+        shared.state.begin(job="interrogate")
+        try:
+            self.load()
+
+            batch_size = max(1, int(shared.opts.interrogate_clip_batch_size))
+            for start in range(0, len(pil_images), batch_size):
+                batch = pil_images[start:start + batch_size]
+
+                captions = self.generate_captions(batch)
+                devices.torch_gc()
+
+                clip_images = torch.stack([self.clip_preprocess(pil_image) for pil_image in batch]).type(self.dtype).to(self.load_device)
+
+                with torch.no_grad(), devices.autocast():
+                    image_features = self.clip_model.encode_image(clip_images).type(self.dtype)
+                    image_features /= image_features.norm(dim=-1, keepdim=True)
+
+                    res = list(captions)
+                    for cat in self.categories():
+                        matches = self.rank_batch(image_features, cat.items, top_count=cat.topn, text_features=self.category_text_features(cat))
+                        for n, image_matches in enumerate(matches):
+                            for match, score in image_matches:
+                                if shared.opts.interrogate_return_ranks:
+                                    res[n] += f", ({match}:{score/100:.3f})"
+                                else:
+                                    res[n] += f", {match}"
+
+                results += res
+
+        except Exception:
+            errors.report("Error interrogating", exc_info=True)
+            results += ["<error>"] * (len(pil_images) - len(results))
+
+        self.unload()
+        shared.state.end()
+
+        return results
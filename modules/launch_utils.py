@@ -541,6 +541,12 @@ def configure_forge_reference_checkout(a1111_home: Path):
 
 
 def start():
+    if args.worker_pool:
+        print(f"Launching worker pool on devices {args.worker_pool} with arguments: {shlex.join(sys.argv[1:])}")
+        from modules import worker_pool
+        worker_pool.main()
+        return
+
     print(f"Launching {'API server' if '--nowebui' in sys.argv else 'Web UI'} with arguments: {shlex.join(sys.argv[1:])}")
     import webui
     if '--nowebui' in sys.argv:
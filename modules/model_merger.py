@@ -0,0 +1,320 @@
+import json
+import math
+import os
+import re
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import torch
+from safetensors import safe_open
+
+from backend.utils import read_safetensors_header, safetensors_dtype_names, safetensors_dtypes
+
+
+class SafetensorsSource:
+    """
+    Tensor source that reads from a .safetensors file on demand; shapes and dtypes come from the header only.
+    Every thread gets its own file handle, and tensors can be read in row ranges so that huge weights never have to
+    be materialized at once.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        header, _ = read_safetensors_header(filename)
+        self.entries = {key: (safetensors_dtypes[value["dtype"]], tuple(value["shape"])) for key, value in header.items()}
+        self.local = threading.local()
+
+    def keys(self):
+        return self.entries.keys()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def dtype(self, key):
+        return self.entries[key][0]
+
+    def shape(self, key):
+        return self.entries[key][1]
+
+    def read(self, key, start=None, end=None):
+        handle = getattr(self.local, "handle", None)
+        if handle is None:
+            handle = self.local.handle = safe_open(self.filename, framework="pt", device="cpu")
+
+        if start is None:
+            return handle.get_tensor(key)
+
+        return handle.get_slice(key)[start:end]
+
+
+class StateDictSource:
+    """Same interface as SafetensorsSource over an already loaded state dict (.ckpt inputs, baked-in VAE)."""
+
+    def __init__(self, state_dict):
+        self.state_dict = state_dict
+
+    def keys(self):
+        return self.state_dict.keys()
+
+    def __contains__(self, key):
+        return key in self.state_dict
+
+    def dtype(self, key):
+        return self.state_dict[key].dtype
+
+    def shape(self, key):
+        return tuple(self.state_dict[key].shape)
+
+    def read(self, key, start=None, end=None):
+        tensor = self.state_dict[key]
+        return tensor if start is None else tensor[start:end]
+
+
+def open_source(filename, load_torch_file):
+    """Opens a checkpoint lazily if it is a .safetensors file, otherwise loads it fully with `load_torch_file`."""
+
+    if os.path.splitext(filename)[1].lower() == ".safetensors":
+        return SafetensorsSource(filename)
+
+    return StateDictSource(load_torch_file(filename))
+
+
+def weighted_sum(theta0, theta1, alpha):
+    return ((1 - alpha) * theta0) + (alpha * theta1)
+
+
+def get_difference(theta1, theta2):
+    return theta1 - theta2
+
+
+def add_difference(theta0, theta1_2_diff, alpha):
+    return theta0 + (alpha * theta1_2_diff)
+
+
+def to_half_dtype(dtype, enable):
+    return torch.float16 if enable and dtype == torch.float else dtype
+
+
+@dataclass
+class MergeEntry:
+    key: str
+    kind: str  # "copy" (from A), "vae" (from baked-in VAE) or "merge"
+    source_key: str
+    shape: tuple
+    dtype: torch.dtype
+    partial_channels: bool = False  # only the first 4 input channels of A are merged (inpainting/ip2p A)
+    offset: int = 0
+
+    @property
+    def nbytes(self):
+        return math.prod(self.shape) * torch.empty((), dtype=self.dtype).element_size()
+
+
+class StreamingMerger:
+    """
+    Checkpoint merger with bounded memory.
+
+    The whole output layout is planned from the source headers, so the output .safetensors header can be written
+    first; tensors are then merged key by key (in row chunks for large weights) on a thread pool, and every worker
+    writes its result straight to its final offset in the file. Peak RAM is a few chunks per worker instead of up to
+    three full checkpoints.
+
+    Semantics match the in-memory merger in modules/extras.py: only keys containing 'model' that exist in B are
+    merged, for "Add difference" keys missing from C contribute a zero difference, and an inpainting/instruct-pix2pix
+    A only gets its first 4 input channels merged.
+    """
+
+    def __init__(self, primary, secondary=None, tertiary=None, vae=None, interp_method="Weighted sum", multiplier=0.3, save_as_half=False, discard_weights="", skip_keys=(), device="cpu", threads=4, chunk_bytes=256 * 1024 * 1024):
+        self.primary = primary
+        self.secondary = secondary
+        self.tertiary = tertiary
+        self.vae = vae
+        self.interp_method = interp_method
+        self.multiplier = multiplier
+        self.save_as_half = save_as_half
+        self.discard_weights = discard_weights
+        self.skip_keys = set(skip_keys)
+        self.device = torch.device(device)
+        self.threads = max(1, int(threads))
+        self.chunk_bytes = max(1, int(chunk_bytes))
+
+        self.is_inpainting = False
+        self.is_instruct_pix2pix = False
+
+        self.merge_func = {"Weighted sum": weighted_sum, "Add difference": add_difference}.get(interp_method, None)
+
+        if self.merge_func is not None and secondary is None:
+            raise ValueError(f"Interpolation method ({interp_method}) requires a secondary model.")
+
+        if interp_method == "Add difference" and tertiary is None:
+            raise ValueError(f"Interpolation method ({interp_method}) requires a tertiary model.")
+
+        self.entries = self.plan()
+
+    def merged_dtype(self, key):
+        def sample(source):
+            return torch.zeros(1, dtype=source.dtype(key))
+
+        b = sample(self.secondary)
+        if self.tertiary is not None:
+            b = get_difference(b, sample(self.tertiary)) if key in self.tertiary else torch.zeros_like(b)
+
+        return self.merge_func(sample(self.primary), b, self.multiplier).dtype
+
+    def plan(self):
+        discard = re.compile(self.discard_weights) if self.discard_weights else None
+        entries = []
+
+        for key in self.primary.keys():
+            if discard is not None and re.search(discard, key):
+                continue
+
+            shape = self.primary.shape(key)
+            vae_key = key[len("first_stage_model."):] if key.startswith("first_stage_model.") else None
+
+            if self.vae is not None and vae_key is not None and vae_key in self.vae:
+                dtype = to_half_dtype(self.vae.dtype(vae_key), self.save_as_half)
+                entries.append(MergeEntry(key, "vae", vae_key, self.vae.shape(vae_key), dtype))
+                continue
+
+            if self.merge_func is None or 'model' not in key or key not in self.secondary or key in self.skip_keys:
+                dtype = to_half_dtype(self.primary.dtype(key), self.save_as_half and self.merge_func is None)
+                entries.append(MergeEntry(key, "copy", key, shape, dtype))
+                continue
+
+            a, b = shape, self.secondary.shape(key)
+            partial_channels = False
+
+            # this enables merging an inpainting model (A) with another one (B);
+            # where normal model would have 4 channels, for latenst space, inpainting model would
+            # have another 4 channels for unmasked picture's latent space, plus one channel for mask, for a total of 9
+            if a != b and a[0:1] + a[2:] == b[0:1] + b[2:]:
+                if a[1] == 4 and b[1] == 9:
+                    raise RuntimeError("When merging inpainting model with a normal one, A must be the inpainting model.")
+                if a[1] == 4 and b[1] == 8:
+                    raise RuntimeError("When merging instruct-pix2pix model with a normal one, A must be the instruct-pix2pix model.")
+
+                if a[1] == 8 and b[1] == 4:
+                    self.is_instruct_pix2pix = True
+                else:
+                    assert a[1] == 9 and b[1] == 4, f"Bad dimensions for merged layer {key}: A={a}, B={b}"
+                    self.is_inpainting = True
+
+                partial_channels = True
+                dtype = self.primary.dtype(key)
+            else:
+                dtype = self.merged_dtype(key)
+
+            entries.append(MergeEntry(key, "merge", key, shape, to_half_dtype(dtype, self.save_as_half), partial_channels))
+
+        offset = 0
+        for entry in entries:
+            entry.offset = offset
+            offset += entry.nbytes
+
+        return entries
+
+    def row_chunks(self, entry):
+        if len(entry.shape) == 0 or entry.shape[0] == 0:
+            yield None, None
+            return
+
+        row_bytes = max(1, entry.nbytes // entry.shape[0])
+        rows = max(1, self.chunk_bytes // row_bytes)
+
+        if rows >= entry.shape[0]:
+            yield None, None
+            return
+
+        for start in range(0, entry.shape[0], rows):
+            yield start, min(start + rows, entry.shape[0])
+
+    def compute(self, entry, start, end):
+        if entry.kind == "vae":
+            return self.vae.read(entry.source_key, start, end)
+
+        if entry.kind == "copy":
+            return self.primary.read(entry.source_key, start, end)
+
+        a = self.primary.read(entry.key, start, end).to(self.device)
+        b = self.secondary.read(entry.key, start, end).to(self.device)
+
+        if self.tertiary is not None:
+            if entry.key in self.tertiary:
+                b = get_difference(b, self.tertiary.read(entry.key, start, end).to(self.device))
+            else:
+                b = torch.zeros_like(b)
+
+        if entry.partial_channels:
+            a = a.clone()
+            a[:, 0:4, ...] = self.merge_func(a[:, 0:4, ...], b, self.multiplier)
+            return a
+
+        return self.merge_func(a, b, self.multiplier)
+
+    def write_entry(self, entry, files, data_start):
+        file = files()
+        row_offset = 0
+
+        for start, end in self.row_chunks(entry):
+            tensor = self.compute(entry, start, end).to(device="cpu", dtype=entry.dtype).contiguous()
+            data = tensor.reshape(-1).view(torch.uint8).numpy()
+
+            file.seek(data_start + entry.offset + row_offset)
+            file.write(data)
+            row_offset += data.nbytes
+
+            del tensor, data
+
+        assert row_offset == entry.nbytes, f"Wrote {row_offset} bytes for {entry.key}, expected {entry.nbytes}"
+
+    def save(self, filename, metadata=None, progress: Optional[Callable[[MergeEntry], None]] = None):
+        header = {entry.key: {"dtype": safetensors_dtype_names[entry.dtype], "shape": list(entry.shape), "data_offsets": [entry.offset, entry.offset + entry.nbytes]} for entry in self.entries}
+        if metadata:
+            header["__metadata__"] = {str(k): v if isinstance(v, str) else json.dumps(v) for k, v in metadata.items()}
+
+        header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+        header_bytes += b" " * (-len(header_bytes) % 8)
+        data_start = 8 + len(header_bytes)
+        total = sum(entry.nbytes for entry in self.entries)
+
+        temp_filename = filename + ".tmp"
+
+        with open(temp_filename, "wb") as file:
+            file.write(struct.pack("<Q", len(header_bytes)))
+            file.write(header_bytes)
+            file.truncate(data_start + total)
+
+        local = threading.local()
+        opened = []
+        opened_lock = threading.Lock()
+
+        def files():
+            file = getattr(local, "file", None)
+            if file is None:
+                file = local.file = open(temp_filename, "r+b")
+                with opened_lock:
+                    opened.append(file)
+            return file
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="model-merger") as executor:
+                futures = {executor.submit(self.write_entry, entry, files, data_start): entry for entry in self.entries}
+
+                for future in as_completed(futures):
+                    future.result()
+                    if progress is not None:
+                        progress(futures[future])
+        except BaseException:
+            for file in opened:
+                file.close()
+            os.remove(temp_filename)
+            raise
+
+        for file in opened:
+            file.close()
+
+        os.replace(temp_filename, filename)
@@ -1,11 +1,139 @@
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 from PIL import Image
 
-from modules import shared, images, devices, scripts, scripts_postprocessing, ui_common, infotext_utils
+from modules import shared, images, devices, scripts, scripts_postprocessing, ui_common, infotext_utils, script_callbacks
 from modules.shared import opts
 
 
+def read_image(image_placeholder):
+    """Decodes a batch input (a path or an already opened image); returns the RGB/RGBA image and its existing pnginfo."""
+
+    if isinstance(image_placeholder, str):
+        image_data = images.read(image_placeholder)
+        image_data.load()
+    else:
+        image_data = image_placeholder
+
+    image_data = image_data if image_data.mode in ("RGBA", "RGB") else image_data.convert("RGB")
+
+    parameters, existing_pnginfo = images.read_info_from_image(image_data)
+    if parameters:
+        existing_pnginfo["parameters"] = parameters
+
+    return image_data, existing_pnginfo
+
+
+def prefetch(executor, items, depth):
+    """Yields (item, future of read_image(item[0])) in order, keeping at most `depth` reads in flight ahead of the consumer."""
+
+    pending = deque()
+    items = iter(items)
+
+    try:
+        while True:
+            while len(pending) < depth:
+                item = next(items, None)
+                if item is None:
+                    break
+
+                pending.append((item, executor.submit(read_image, item[0])))
+
+            if not pending:
+                return
+
+            yield pending.popleft()
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+
+def save_postprocessed_image(pp, outpath, basename, infotext, existing_pnginfo, forced_filename, suffix, reserved_names=None, defer_write=None):
+    if defer_write is not None:
+        def write_deferred(write, params):
+            def write_with_caption():
+                fullfn, _ = write()
+                save_caption(pp, fullfn)
+
+            return defer_write(write_with_caption, params)
+
+        return images.save_image(pp.image, path=outpath, basename=basename, extension=opts.samples_format, info=infotext, short_filename=True, no_prompt=True, grid=False, pnginfo_section_name="postprocessing", existing_info=existing_pnginfo, forced_filename=forced_filename, suffix=suffix, reserved_names=reserved_names, defer_write=write_deferred)
+
+    fullfn, _ = images.save_image(pp.image, path=outpath, basename=basename, extension=opts.samples_format, info=infotext, short_filename=True, no_prompt=True, grid=False, pnginfo_section_name="postprocessing", existing_info=existing_pnginfo, forced_filename=forced_filename, suffix=suffix)
+    save_caption(pp, fullfn)
+
+
+def save_caption(pp, fullfn):
+    if pp.caption:
+        caption_filename = os.path.splitext(fullfn)[0] + ".txt"
+        existing_caption = ""
+        try:
+            with open(caption_filename, encoding="utf8") as file:
+                existing_caption = file.read().strip()
+        except FileNotFoundError:
+            pass
+
+        action = shared.opts.postprocessing_existing_caption_action
+        if action == 'Prepend' and existing_caption:
+            caption = f"{existing_caption} {pp.caption}"
+        elif action == 'Append' and existing_caption:
+            caption = f"{pp.caption} {existing_caption}"
+        elif action == 'Keep' and existing_caption:
+            caption = existing_caption
+        else:
+            caption = pp.caption
+
+        caption = caption.strip()
+        if caption:
+            with open(caption_filename, "w", encoding="utf8") as file:
+                file.write(caption)
+
+
+class ImageWriter:
+    """
+    Encodes and writes postprocessed images (and their captions) on `threads` worker threads with at most
+    `2 * threads` writes queued; with 0 threads, saves run on the calling thread. The rest of `images.save_image` -
+    the filename, numbering and the `before_image_saved` callbacks - stays on the calling thread, and the
+    `image_saved` callbacks run there too, in input order, once each image is written.
+    """
+
+    def __init__(self, threads):
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="extras-writer") if threads > 0 else None
+        self.limit = 2 * threads
+        self.pending = deque()
+        self.reserved_names = set()
+
+    def submit(self, write, params):
+        self.pending.append((self.executor.submit(write), params))
+
+    def collect(self):
+        future, params = self.pending.popleft()
+        future.result()
+        script_callbacks.image_saved_callback(params)
+
+    def save(self, *args):
+        if self.executor is None:
+            save_postprocessed_image(*args)
+            return
+
+        save_postprocessed_image(*args, reserved_names=self.reserved_names, defer_write=self.submit)
+
+        while len(self.pending) > self.limit:
+            self.collect()
+
+    def finish(self):
+        if self.executor is None:
+            return
+
+        try:
+            while self.pending:
+                self.collect()
+        finally:
+            self.executor.shutdown(wait=True)
+
+
 def run_postprocessing(extras_mode, image, image_folder, input_dir, output_dir, show_extras_results, *args, save_output: bool = True):
     devices.torch_gc()
 
@@ -23,7 +151,7 @@ def run_postprocessing(extras_mode, image, image_folder, input_dir, output_dir,
                     image = images.fix_image(img)
                     fn = ''
                 else:
-                    image = images.read(os.path.abspath(img.name))
+                    image = os.path.abspath(img.name)
                     fn = os.path.splitext(img.name)[0]
                 yield image, fn
         elif extras_mode == 2:
@@ -47,84 +175,72 @@ def run_postprocessing(extras_mode, image, image_folder, input_dir, output_dir,
     data_to_process = list(get_images(extras_mode, image, image_folder, input_dir))
     shared.state.job_count = len(data_to_process)
 
-    for image_placeholder, name in data_to_process:
-        image_data: Image.Image
-
-        shared.state.nextjob()
-        shared.state.textinfo = name
-        shared.state.skipped = False
+    # batch modes overlap decoding the next images and saving the previous ones with running the scripts on this thread
+    batch = extras_mode in (1, 2) and len(data_to_process) > 1
+    read_threads = int(opts.postprocessing_batch_read_threads) if batch else 0
+    write_threads = int(opts.postprocessing_batch_write_threads) if batch and save_output else 0
 
-        if shared.state.interrupted or shared.state.stopping_generation:
-            break
+    reader = ThreadPoolExecutor(max_workers=read_threads, thread_name_prefix="extras-reader") if read_threads > 0 else None
+    writer = ImageWriter(write_threads)
 
-        if isinstance(image_placeholder, str):
-            try:
-                image_data = images.read(image_placeholder)
-            except Exception:
-                continue
-        else:
-            image_data = image_placeholder
-
-        image_data = image_data if image_data.mode in ("RGBA", "RGB") else image_data.convert("RGB")
+    if reader is not None:
+        inputs = prefetch(reader, data_to_process, 2 * read_threads)
+    else:
+        inputs = ((item, None) for item in data_to_process)
 
-        parameters, existing_pnginfo = images.read_info_from_image(image_data)
-        if parameters:
-            existing_pnginfo["parameters"] = parameters
+    try:
+        for (image_placeholder, name), future in inputs:
+            image_data: Image.Image
 
-        initial_pp = scripts_postprocessing.PostprocessedImage(image_data)
+            shared.state.nextjob()
+            shared.state.textinfo = name
+            shared.state.skipped = False
 
-        scripts.scripts_postproc.run(initial_pp, args)
+            if shared.state.interrupted or shared.state.stopping_generation:
+                break
 
-        if shared.state.skipped:
-            continue
+            try:
+                image_data, existing_pnginfo = future.result() if future is not None else read_image(image_placeholder)
+            except Exception:
+                if not isinstance(image_placeholder, str):
+                    raise
+                continue
 
-        used_suffixes = {}
-        for pp in [initial_pp, *initial_pp.extra_images]:
-            suffix = pp.get_suffix(used_suffixes)
+            initial_pp = scripts_postprocessing.PostprocessedImage(image_data)
 
-            if opts.use_original_name_batch and name is not None:
-                basename = os.path.splitext(os.path.basename(name))[0]
-                forced_filename = basename + suffix
-            else:
-                basename = ''
-                forced_filename = None
+            scripts.scripts_postproc.run(initial_pp, args)
 
-            infotext = ", ".join([k if k == v else f'{k}: {infotext_utils.quote(v)}' for k, v in pp.info.items() if v is not None])
+            if shared.state.skipped:
+                continue
 
-            if opts.enable_pnginfo:
-                pp.image.info = existing_pnginfo
+            used_suffixes = {}
+            for pp in [initial_pp, *initial_pp.extra_images]:
+                suffix = pp.get_suffix(used_suffixes)
 
-            shared.state.assign_current_image(pp.image)
+                if opts.use_original_name_batch and name is not None:
+                    basename = os.path.splitext(os.path.basename(name))[0]
+                    forced_filename = basename + suffix
+                else:
+                    basename = ''
+                    forced_filename = None
 
-            if save_output:
-                fullfn, _ = images.save_image(pp.image, path=outpath, basename=basename, extension=opts.samples_format, info=infotext, short_filename=True, no_prompt=True, grid=False, pnginfo_section_name="postprocessing", existing_info=existing_pnginfo, forced_filename=forced_filename, suffix=suffix)
+                infotext = ", ".join([k if k == v else f'{k}: {infotext_utils.quote(v)}' for k, v in pp.info.items() if v is not None])
 
-                if pp.caption:
-                    caption_filename = os.path.splitext(fullfn)[0] + ".txt"
-                    existing_caption = ""
-                    try:
-                        with open(caption_filename, encoding="utf8") as file:
-                            existing_caption = file.read().strip()
-                    except FileNotFoundError:
-                        pass
+                if opts.enable_pnginfo:
+                    pp.image.info = existing_pnginfo
 
-                    action = shared.opts.postprocessing_existing_caption_action
-                    if action == 'Prepend' and existing_caption:
-                        caption = f"{existing_caption} {pp.caption}"
-                    elif action == 'Append' and existing_caption:
-                        caption = f"{pp.caption} {existing_caption}"
-                    elif action == 'Keep' and existing_caption:
-                        caption = existing_caption
-                    else:
-                        caption = pp.caption
+                shared.state.assign_current_image(pp.image)
 
-                    caption = caption.strip()
-                    if caption:
-                        with open(caption_filename, "w", encoding="utf8") as file:
-                            file.write(caption)
+                if save_output:
+                    writer.save(pp, outpath, basename, infotext, dict(existing_pnginfo), forced_filename, suffix)
 
-            if extras_mode != 2 or show_extras_results:
-                outputs.append(pp.image)
+                if extras_mode != 2 or show_extras_results:
+                    outputs.append(pp.image)
+    finally:
+        inputs.close()
+        if reader is not None:
+            reader.shutdown(wait=True)
+        writer.finish()
 
     devices.torch_gc()
     shared.state.end()
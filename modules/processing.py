@@ -4,7 +4,10 @@ import logging
 import math
 import os
 import sys
+import copy
 import hashlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 
 import torch
@@ -16,7 +19,7 @@ from skimage import exposure
 from typing import Any
 
 import modules.sd_hijack
-from modules import devices, prompt_parser, masking, sd_samplers, lowvram, infotext_utils, extra_networks, sd_vae_approx, scripts, sd_samplers_common, sd_unet, errors, rng, profiling
+from modules import devices, prompt_parser, masking, sd_samplers, lowvram, infotext_utils, extra_networks, sd_vae_approx, scripts, sd_samplers_common, sd_unet, errors, rng, profiling, script_callbacks
 from modules.rng import slerp, get_noise_source_type  # noqa: F401
 from modules.sd_samplers_common import images_tensor_to_samples, decode_first_stage, approximation_indexes
 from modules.shared import opts, cmd_opts, state
@@ -35,6 +38,7 @@ from modules.sd_models import apply_token_merging, forge_model_reload
 from modules_forge.utils import apply_circular_forge
 from modules_forge import main_entry
 from backend import memory_management
+from backend.misc import memory_planner
 from backend.modules.k_prediction import rescale_zero_terminal_snr_sigmas
 from backend.diffusion_engine.txt2img import generate_txt2img
 
@@ -622,6 +626,10 @@ def create_random_tensors(shape, seeds, subseeds=None, subseed_strength=0.0, see
     return g.next()
 
 
+hires_latent_only_mode = "Latent (bicubic antialiased)"
+
+
+
 class DecodedSamples(list):
     already_decoded = True
 
@@ -843,6 +851,9 @@ def process_images(p: StableDiffusionProcessing) -> Processed:
             res = process_images_inner(p)
 
     finally:
+        # sampling_cleanup is skipped when sampling raises; do not keep that pass's batch split for later requests
+        memory_planner.current_plan = None
+
         # restore original options
         if p.override_settings_restore_afterwards:
             set_config(stored_opts, save_config=False)
@@ -850,6 +861,91 @@ def process_images(p: StableDiffusionProcessing) -> Processed:
     return res
 
 
+class BackgroundImageSaver:
+    """
+    Encodes and writes images of finished batches on a single worker thread, in submission order, so that this
+    overlaps with sampling of batch N+1. Filenames and `before_image_saved` callbacks are handled on the calling
+    thread when an image is submitted, `image_saved` callbacks when its write is collected, in the same order as
+    without the worker. At most `depth` finished batches wait for writing; each save gets a shallow copy of p, so
+    the callbacks see the batch/iteration it was submitted with.
+
+    The VAE decode and the postprocess of batch N are not overlapped with sampling of batch N+1: they share the device
+    and the memory manager with sampling, and the postprocess callbacks of batch N must run before the
+    `before_process_batch` callbacks of batch N+1.
+    """
+
+    def __init__(self, enabled, depth=1):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="image-saver") if enabled else None
+        self.depth = depth
+        self.current = []
+        self.batches = deque()
+        self.reserved_names = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.finish()
+            return
+
+        try:
+            self.finish()
+        except Exception as e:
+            errors.display(e, "saving images in background")
+
+    def save_image(self, *args, p=None, **kwargs):
+        if self.executor is None:
+            return images.save_image(*args, p=p, **kwargs)
+
+        images.save_image(*args, p=copy.copy(p), reserved_names=self.reserved_names, defer_write=self.submit, **kwargs)
+
+    def submit(self, write, params):
+        self.current.append((self.executor.submit(write), params))
+
+    def collect(self, batch):
+        for future, params in batch:
+            future.result()
+            script_callbacks.image_saved_callback(params)
+
+    def end_batch(self):
+        if self.executor is None:
+            return
+
+        self.batches.append(self.current)
+        self.current = []
+
+        while len(self.batches) > self.depth:
+            self.collect(self.batches.popleft())
+
+    def finish(self):
+        """Waits for all pending writes and runs their callbacks; later saves are written on the calling thread."""
+
+        if self.executor is None:
+            return
+
+        try:
+            for batch in [*self.batches, self.current]:
+                self.collect(batch)
+        finally:
+            self.batches.clear()
+            self.current = []
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+
+def plan_memory(p: StableDiffusionProcessing):
+    """Checks before encoding prompts that every sampling pass of the request fits the VRAM budget (see backend/misc/memory_planner.py)."""
+
+    sizes = [("first pass", (p.width, p.height))]
+    if getattr(p, 'enable_hr', False):
+        sizes.append(("hires pass", (p.hr_upscale_to_x, p.hr_upscale_to_y)))
+
+    forge_objects = p.sd_model.forge_objects
+    plans = memory_planner.plan_request(forge_objects.unet, forge_objects.vae, p.batch_size, sizes)
+    memory_planner.admit(plans, label=f"{p.width}x{p.height} x{p.batch_size}")
+
+
 def process_images_inner(p: StableDiffusionProcessing) -> Processed:
     """this is the main loop that both txt2img and img2img use; it calls func_init once inside all the scopes and func_sample once per batch"""
 
@@ -909,7 +1005,7 @@ def process_images_inner(p: StableDiffusionProcessing) -> Processed:
 
     infotexts = []
     output_images = []
-    with torch.inference_mode():
+    with torch.inference_mode(), BackgroundImageSaver(enabled=opts.save_images_in_background and p.n_iter > 1) as saver:
         with devices.autocast():
             p.init(p.all_prompts, p.all_seeds, p.all_subseeds)
 
@@ -960,6 +1056,9 @@ def process_images_inner(p: StableDiffusionProcessing) -> Processed:
             if p.scripts is not None:
                 p.scripts.process_batch(p, batch_number=n, prompts=p.prompts, seeds=p.seeds, subseeds=p.subseeds)
 
+            if n == 0 and memory_planner.enabled():
+                plan_memory(p)
+
             p.setup_conds()
 
             p.extra_generation_params.update(p.sd_model.extra_generation_params)
@@ -1034,6 +1133,9 @@ def process_images_inner(p: StableDiffusionProcessing) -> Processed:
 
             save_samples = p.save_samples()
 
+            if save_samples and opts.save_images_add_number and opts.save_images_sequence_file and not opts.save_to_dirs:
+                images.sequence_allocator.reserve(p.outpath_samples, "", len(x_samples_ddim))
+
             for i, x_sample in enumerate(x_samples_ddim):
                 p.batch_index = i
 
@@ -1042,7 +1144,7 @@ def process_images_inner(p: StableDiffusionProcessing) -> Processed:
 
                 if p.restore_faces:
                     if save_samples and opts.save_images_before_face_restoration:
-                        images.save_image(Image.fromarray(x_sample), p.outpath_samples, "", p.seeds[i], p.prompts[i], opts.samples_format, info=infotext(i), p=p, suffix="-before-face-restoration")
+                        saver.save_image(Image.fromarray(x_sample), p.outpath_samples, "", p.seeds[i], p.prompts[i], opts.samples_format, info=infotext(i), p=p, suffix="-before-face-restoration")
 
                     devices.torch_gc()
 
@@ -1073,7 +1175,7 @@ def process_images_inner(p: StableDiffusionProcessing) -> Processed:
                 if p.color_corrections is not None and i < len(p.color_corrections):
                     if save_samples and opts.save_images_before_color_correction:
                         image_without_cc, _ = apply_overlay(image, p.paste_to, overlay_image)
-                        images.save_image(image_without_cc, p.outpath_samples, "", p.seeds[i], p.prompts[i], opts.samples_format, info=infotext(i), p=p, suffix="-before-color-correction")
+                        saver.save_image(image_without_cc, p.outpath_samples, "", p.seeds[i], p.prompts[i], opts.samples_format, info=infotext(i), p=p, suffix="-before-color-correction")
                     image = apply_color_correction(p.color_corrections[i], image)
 
                 # If the intention is to show the output from the model
@@ -1090,7 +1192,7 @@ def process_images_inner(p: StableDiffusionProcessing) -> Processed:
                     image = pp.image
 
                 if save_samples:
-                    images.save_image(image, p.outpath_samples, "", p.seeds[i], p.prompts[i], opts.samples_format, info=infotext(i), p=p)
+                    saver.save_image(image, p.outpath_samples, "", p.seeds[i], p.prompts[i], opts.samples_format, info=infotext(i), p=p)
 
                 text = infotext(i)
                 infotexts.append(text)
@@ -1102,21 +1204,25 @@ def process_images_inner(p: StableDiffusionProcessing) -> Processed:
                     if opts.return_mask or opts.save_mask:
                         image_mask = mask_for_overlay.convert('RGB')
                         if save_samples and opts.save_mask:
-                            images.save_image(image_mask, p.outpath_samples, "", p.seeds[i], p.prompts[i], opts.samples_format, info=infotext(i), p=p, suffix="-mask")
+                            saver.save_image(image_mask, p.outpath_samples, "", p.seeds[i], p.prompts[i], opts.samples_format, info=infotext(i), p=p, suffix="-mask")
                         if opts.return_mask:
                             output_images.append(image_mask)
 
                     if opts.return_mask_composite or opts.save_mask_composite:
                         image_mask_composite = Image.composite(original_denoised_image.convert('RGBA').convert('RGBa'), Image.new('RGBa', image.size), images.resize_image(2, mask_for_overlay, image.width, image.height).convert('L')).convert('RGBA')
                         if save_samples and opts.save_mask_composite:
-                            images.save_image(image_mask_composite, p.outpath_samples, "", p.seeds[i], p.prompts[i], opts.samples_format, info=infotext(i), p=p, suffix="-mask-composite")
+                            saver.save_image(image_mask_composite, p.outpath_samples, "", p.seeds[i], p.prompts[i], opts.samples_format, info=infotext(i), p=p, suffix="-mask-composite")
                         if opts.return_mask_composite:
                             output_images.append(image_mask_composite)
 
             del x_samples_ddim
 
+            saver.end_batch()
+
             devices.torch_gc()
 
+        saver.finish()
+
         if not infotexts:
             infotexts.append(Processed(p, []).infotext(p, 0))
 
@@ -1214,6 +1320,7 @@ class StableDiffusionProcessingTxt2Img(StableDiffusionProcessing):
     truncate_y: int = field(default=0, init=False)
     applied_old_hires_behavior_to: tuple = field(default=None, init=False)
     latent_scale_mode: dict = field(default=None, init=False)
+    hr_pixel_upscaler: str = field(default=None, init=False)
     hr_c: tuple | None = field(default=None, init=False)
     hr_uc: tuple | None = field(default=None, init=False)
     all_hr_prompts: list = field(default=None, init=False)
@@ -1321,6 +1428,12 @@ class StableDiffusionProcessingTxt2Img(StableDiffusionProcessing):
                 if not any(x.name == self.hr_upscaler for x in shared.sd_upscalers):
                     raise Exception(f"could not find upscaler named {self.hr_upscaler}")
 
+            if self.latent_scale_mode is None and self.firstpass_image is None and opts.hires_fix_latent_only:
+                # keep the whole hires fix in latent space: no decode -> pixel upscale -> encode round trip
+                self.hr_pixel_upscaler = self.hr_upscaler
+                self.hr_upscaler = hires_latent_only_mode
+                self.latent_scale_mode = shared.latent_upscale_modes[hires_latent_only_mode]
+
             self.calculate_target_resolution()
 
             if not state.processing_has_refined_job_count:
@@ -1378,9 +1491,14 @@ class StableDiffusionProcessingTxt2Img(StableDiffusionProcessing):
 
         self.sampler = sd_samplers.create_sampler(img2img_sampler_name, self.sd_model)
 
+        deferred_lowres = None
+
         if self.latent_scale_mode is not None:
-            for i in range(samples.shape[0]):
-                save_intermediate(samples, i)
+            if self.hr_pixel_upscaler is not None:
+                deferred_lowres = samples
+            else:
+                for i in range(samples.shape[0]):
+                    save_intermediate(samples, i)
 
             samples = torch.nn.functional.interpolate(samples, size=(target_height // opt_f, target_width // opt_f), mode=self.latent_scale_mode["mode"], antialias=self.latent_scale_mode["antialias"])
 
@@ -1415,6 +1533,9 @@ class StableDiffusionProcessingTxt2Img(StableDiffusionProcessing):
 
             image_conditioning = self.img2img_image_conditioning(decoded_samples, samples)
 
+        if self.hr_pixel_upscaler is not None:
+            self.report_latent_only_savings(target_width, target_height)
+
         shared.state.nextjob()
 
         samples = samples[:, :, self.truncate_y//2:samples.shape[2]-(self.truncate_y+1)//2, self.truncate_x//2:samples.shape[3]-(self.truncate_x+1)//2]
@@ -1463,9 +1584,36 @@ class StableDiffusionProcessingTxt2Img(StableDiffusionProcessing):
 
         decoded_samples = decode_latent_batch(self.sd_model, samples, target_device=devices.cpu, check_for_nans=True)
 
+        if deferred_lowres is not None and self.save_samples() and opts.save_images_before_highres_fix:
+            lowres_samples = decode_latent_batch(self.sd_model, deferred_lowres, target_device=devices.cpu)
+            for i, x_sample in enumerate(lowres_samples):
+                x_sample = torch.clamp((x_sample.float() + 1.0) / 2.0, min=0.0, max=1.0)
+                x_sample = 255. * np.moveaxis(x_sample.numpy(), 0, 2)
+                save_intermediate(Image.fromarray(x_sample.astype(np.uint8)), i)
+
         self.is_hr_pass = False
         return decoded_samples
 
+    def report_latent_only_savings(self, target_width, target_height):
+        """Prints the VAE time per image that the latent-only hires fix skipped, estimated from the last measured VAE decode and encode."""
+
+        decode = sd_samplers_common.vae_timings.get("decode")
+        encode = sd_samplers_common.vae_timings.get("encode")
+
+        skipped = []
+        if decode is not None:
+            skipped.append((f"decode at {self.width}x{self.height}", decode * self.width * self.height / 1e6))
+        if encode is not None:
+            skipped.append((f"encode at {target_width}x{target_height}", encode * target_width * target_height / 1e6))
+
+        if not skipped:
+            print(f"Hires fix (latent only): skipped the VAE decode, {self.hr_pixel_upscaler} upscale and VAE encode; the VAE has not been timed in this session yet")
+            return
+
+        unmeasured = "" if len(skipped) == 2 else ", encode not timed yet"
+        parts = ", ".join(f"{name} ~{seconds:.2f}s" for name, seconds in skipped)
+        print(f"Hires fix (latent only): saved about {sum(seconds for _, seconds in skipped):.2f}s per image in the VAE ({parts}{unmeasured}) plus the {self.hr_pixel_upscaler} upscale")
+
     def close(self):
         super().close()
         self.hr_c = None
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import re
+import functools
 from collections import namedtuple
 import lark
 
@@ -25,6 +26,9 @@ plain: /([^\\\[\]():|]|\\.)+/
 %import common.SIGNED_NUMBER -> NUMBER
 """)
 
+# number of distinct prompts remembered by the schedule/attention parse caches
+prompt_cache_size = 1024
+
 def get_learned_conditioning_prompt_schedules(prompts, base_steps, hires_steps=None, use_old_scheduling=False):
     """
     >>> g = lambda p: get_learned_conditioning_prompt_schedules([p], 10)[0]
@@ -63,6 +67,18 @@ def get_learned_conditioning_prompt_schedules(prompts, base_steps, hires_steps=N
     [[5, 'a  c'], [10, 'a b c']]
     """
 
+    promptdict = {prompt: [list(entry) for entry in get_prompt_schedule(prompt, base_steps, hires_steps, use_old_scheduling)] for prompt in set(prompts)}
+    return [promptdict[prompt] for prompt in prompts]
+
+
+@functools.lru_cache(maxsize=prompt_cache_size)
+def get_prompt_schedule(prompt, base_steps, hires_steps=None, use_old_scheduling=False):
+    """
+    Returns the schedule of a single prompt as a tuple of (step, text) pairs.
+    Results are memoized per (prompt, steps, hires_steps, scheduling mode); API clients send the same prompts over
+    and over, and building/walking the lark tree dominates the cost of this function.
+    """
+
     if hires_steps is None or use_old_scheduling:
         int_offset = 0
         flt_offset = 0
@@ -72,6 +88,10 @@ def get_learned_conditioning_prompt_schedules(prompts, base_steps, hires_steps=N
         flt_offset = 1.0
         steps = hires_steps
 
+    # scheduled and alternate prompts both need a "[", anything else parses back into the prompt itself
+    if '[' not in prompt:
+        return ((steps, prompt),)
+
     def collect_steps(steps, tree):
         res = [steps]
 
@@ -119,18 +139,14 @@ def get_learned_conditioning_prompt_schedules(prompts, base_steps, hires_steps=N
                     yield child
         return AtStep().transform(tree)
 
-    def get_schedule(prompt):
-        try:
-            tree = schedule_parser.parse(prompt)
-        except lark.exceptions.LarkError:
-            if 0:
-                import traceback
-                traceback.print_exc()
-            return [[steps, prompt]]
-        return [[t, at_step(t, tree)] for t in collect_steps(steps, tree)]
-
-    promptdict = {prompt: get_schedule(prompt) for prompt in set(prompts)}
-    return [promptdict[prompt] for prompt in prompts]
+    try:
+        tree = schedule_parser.parse(prompt)
+    except lark.exceptions.LarkError:
+        if 0:
+            import traceback
+            traceback.print_exc()
+        return ((steps, prompt),)
+    return tuple((t, at_step(t, tree)) for t in collect_steps(steps, tree))
 
 
 ScheduledPromptConditioning = namedtuple("ScheduledPromptConditioning", ["end_at_step", "cond"])
@@ -173,6 +189,8 @@ def get_learned_conditioning(model, prompts: SdConditioning | list[str], steps,
         ]
     ]
     """
+    from modules import conditioning_cache
+
     res = []
 
     prompt_schedules = get_learned_conditioning_prompt_schedules(prompts, steps, hires_steps, use_old_scheduling)
@@ -186,7 +204,7 @@ def get_learned_conditioning(model, prompts: SdConditioning | list[str], steps,
             continue
 
         texts = SdConditioning([x[1] for x in prompt_schedule], copy_from=prompts)
-        conds = model.get_learned_conditioning(texts)
+        conds = conditioning_cache.get_learned_conditioning(model, texts)
 
         cond_schedule = []
         for i, (end_at_step, _) in enumerate(prompt_schedule):
@@ -419,6 +437,13 @@ def parse_prompt_attention(text):
      ['.', 1.1]]
     """
 
+    return [list(part) for part in parse_prompt_attention_cached(text)]
+
+
+@functools.lru_cache(maxsize=prompt_cache_size)
+def parse_prompt_attention_cached(text):
+    """same as parse_prompt_attention, but memoized and returning a tuple of (text, weight) pairs"""
+
     res = []
     round_brackets = []
     square_brackets = []
@@ -471,7 +496,8 @@ def parse_prompt_attention(text):
         else:
             i += 1
 
-    return res
+    # cached results are shared between callers, so they are frozen; parse_prompt_attention() returns lists
+    return tuple((part, weight) for part, weight in res)
 
 if __name__ == "__main__":
     import doctest
@@ -75,6 +75,24 @@ def randn_without_seed(shape, generator=None):
     return torch.randn(shape, device=devices.device, generator=generator)
 
 
+def randn_batch(shape, generators):
+    """Noise for each generator stacked into one (len(generators), *shape) tensor on devices.device.
+
+    Same values as stacking randn_without_seed(shape, generator) for each generator. Philox generators (NV source)
+    are computed in one vectorized call; torch generators fill slices of one preallocated tensor, which is moved to the
+    device once."""
+
+    if generators and isinstance(generators[0], rng_philox.Generator):
+        return torch.asarray(rng_philox.randn_batch(generators, shape), device=devices.device)
+
+    local_device = generators[0].device if generators else devices.device
+    x = torch.empty((len(generators), *shape), device=local_device)
+    for i, generator in enumerate(generators):
+        torch.randn(shape, generator=generator, out=x[i])
+
+    return x.to(devices.device)
+
+
 def manual_seed(seed):
     """Set up a global random number generator using the specified seed."""
 
@@ -110,6 +128,24 @@ def slerp(val, low, high):
     return res
 
 
+def slerp_batch(val, low, high):
+    """slerp for a batch: low and high are (N, *shape) and each item is interpolated as by slerp(val, low[i], high[i])."""
+
+    low_norm = low/torch.norm(low, dim=2, keepdim=True)
+    high_norm = high/torch.norm(high, dim=2, keepdim=True)
+    dot = (low_norm*high_norm).sum(2)
+
+    omega = torch.acos(dot)
+    so = torch.sin(omega)
+    res = (torch.sin((1.0-val)*omega)/so).unsqueeze(2)*low + (torch.sin(val*omega)/so).unsqueeze(2) * high
+
+    linear = dot.mean(dim=tuple(range(1, dot.dim()))) > 0.9995
+    if linear.any():
+        res[linear] = low[linear] * val + high[linear] * (1 - val)
+
+    return res
+
+
 class ImageRNG:
     def __init__(self, shape, seeds, subseeds=None, subseed_strength=0.0, seed_resize_from_h=0, seed_resize_from_w=0):
         self.shape = tuple(map(int, shape))
@@ -126,6 +162,9 @@ class ImageRNG:
     def first(self):
         noise_shape = self.shape if self.seed_resize_from_h <= 0 or self.seed_resize_from_w <= 0 else (self.shape[0], int(self.seed_resize_from_h) // 8, int(self.seed_resize_from_w // 8))
 
+        if noise_shape == self.shape:
+            return self.first_batched()
+
         xs = []
 
         for i, (seed, generator) in enumerate(zip(self.seeds, self.generators)):
@@ -164,17 +203,31 @@ class ImageRNG:
 
         return torch.stack(xs).to(shared.device)
 
+    def first_batched(self):
+        """first() without seed resize: the noise of all seeds in one randn_batch call and subseed variation in one slerp_batch."""
+
+        noise = randn_batch(self.shape, self.generators)
+
+        if self.subseeds is not None and self.subseed_strength != 0:
+            subnoise = torch.stack([randn(0 if i >= len(self.subseeds) else self.subseeds[i], self.shape) for i in range(len(self.seeds))])
+            noise = slerp_batch(self.subseed_strength, noise, subnoise)
+
+        # the per-seed path leaves the global generator seeded by randn(seed, shape, generator) of the last seed
+        if self.seeds:
+            manual_seed((self.seeds[-1] + 100000) % 65536)
+
+        eta_noise_seed_delta = shared.opts.eta_noise_seed_delta or 0
+        if eta_noise_seed_delta:
+            self.generators = [create_generator(seed + eta_noise_seed_delta) for seed in self.seeds]
+
+        return noise.to(shared.device)
+
     def next(self):
         if self.is_first:
             self.is_first = False
             return self.first()
 
-        xs = []
-        for generator in self.generators:
-            x = randn_without_seed(self.shape, generator=generator)
-            xs.append(x)
-
-        return torch.stack(xs).to(shared.device)
+        return randn_batch(self.shape, self.generators).to(shared.device)
 
 
 devices.randn = randn
@@ -84,19 +84,60 @@ class Generator:
     def randn(self, shape):
         """Generate a sequence of n standard normal random variables using the Philox 4x32 random number generator and the Box-Muller transform."""
 
-        n = 1
-        for x in shape:
-            n *= x
+        return randn_batch([self], shape)[0]
 
-        counter = np.zeros((4, n), dtype=np.uint32)
-        counter[0] = self.offset
-        counter[2] = np.arange(n, dtype=np.uint32)  # up to 2^32 numbers can be generated - if you want more you'd need to spill into counter[3]
-        self.offset += 1
 
-        key = np.empty(n, dtype=np.uint64)
-        key.fill(self.seed)
-        key = uint32(key)
 
-        g = philox4_32(counter, key)
+def philox4_32_grid(offset, counter, key0, key1, rounds=10):
+    """Philox 4x32 over broadcastable uint32 arrays, for counters (offset, 0, counter, 0) and keys (key0, key1).
 
-        return box_muller(g[0], g[1]).reshape(shape)  # discard g[2] and g[3]
+    Returns the first two output words, which is all box_muller uses. Same values as philox4_32, without
+    materializing the key schedule per element.
+    """
+
+    c0, c1, c2, c3 = offset, np.uint32(0), counter, np.uint32(0)
+
+    for _ in range(rounds):
+        v1 = c0.astype(np.uint64) * np.uint64(philox_m[0])
+        v2 = c2.astype(np.uint64) * np.uint64(philox_m[1])
+
+        c0, c1, c2, c3 = (v2 >> np.uint64(32)).astype(np.uint32) ^ c1 ^ key0, v2.astype(np.uint32), (v1 >> np.uint64(32)).astype(np.uint32) ^ c3 ^ key1, v1.astype(np.uint32)
+
+        key0 = key0 + np.uint32(philox_w[0])
+        key1 = key1 + np.uint32(philox_w[1])
+
+    return c0, c1
+
+
+def randn_batch(generators, shape, chunk=32768):
+    """Same as stacking `g.randn(shape)` for each generator, as one computation over the (generators x elements) counter grid.
+
+    The grid is processed in blocks of about `chunk` elements (several generators per block for small shapes) to keep
+    the temporaries in cache.
+    """
+
+    n = 1
+    for x in shape:
+        n *= x
+
+    seeds = np.array([g.seed for g in generators], dtype=np.uint64)
+    key0 = (seeds & np.uint64(0xFFFFFFFF)).astype(np.uint32)[:, None]
+    key1 = (seeds >> np.uint64(32)).astype(np.uint32)[:, None]
+    offsets = np.array([g.offset for g in generators], dtype=np.uint32)[:, None]
+
+    for g in generators:
+        g.offset += 1
+
+    res = np.empty((len(generators), n), dtype=np.float32)
+    rows = max(1, chunk // max(n, 1))
+    columns = min(n, chunk)
+
+    for row in range(0, len(generators), rows):
+        block = slice(row, row + rows)
+
+        for column in range(0, n, columns):
+            counter = np.arange(column, min(n, column + columns), dtype=np.uint32)[None, :]
+            x, y = philox4_32_grid(offsets[block], counter, key0[block], key1[block])
+            res[block, column:column + columns] = box_muller(x, y)
+
+    return res.reshape((len(generators), *shape))
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import time
+
+import torch
+
+from modules import errors, paths_internal, shared
+
+
+prune_interval = 600
+last_prune = 0
+
+
+def store_dir():
+    return shared.opts.sampling_checkpoint_dir or os.path.join(paths_internal.data_path, "sampling-checkpoints")
+
+
+def prune(keep=()):
+    """
+    Deletes snapshots of jobs that were abandoned rather than retried: files older than `sampling_checkpoint_max_age`
+    hours, then the oldest ones until the directory is within `sampling_checkpoint_max_mb`. Paths in `keep` are never
+    deleted.
+    """
+
+    max_age = float(shared.opts.sampling_checkpoint_max_age or 0) * 3600
+    max_size = float(shared.opts.sampling_checkpoint_max_mb or 0) * 1024 * 1024
+    if max_age <= 0 and max_size <= 0:
+        return
+
+    try:
+        files = []
+        for entry in os.scandir(store_dir()):
+            if entry.is_file() and entry.name.endswith((".pt", ".pt.tmp")) and entry.path not in keep:
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError:
+        return
+
+    files.sort()
+    now = time.time()
+    total = sum(size for _, size, _ in files)
+
+    for mtime, size, path in files:
+        too_old = max_age > 0 and now - mtime > max_age
+        too_big = max_size > 0 and total > max_size
+        if not too_old and not too_big:
+            break
+
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def job_key(p, sampler, x, sigmas) -> str:
+    """
+    Identity of a sampling pass: the starting latent (which covers seeds and the init image), the sigma schedule
+    (steps, scheduler, denoising strength), sampler, prompts, CFG and checkpoint. A retried request produces the same key.
+    """
+
+    hires = getattr(p, "is_hr_pass", False)
+    params = {
+        "sampler": sampler.config.name if sampler.config is not None else sampler.funcname,
+        "prompts": getattr(p, "hr_prompts", None) if hires else p.prompts,
+        "negative_prompts": getattr(p, "hr_negative_prompts", None) if hires else p.negative_prompts,
+        "cfg_scale": p.cfg_scale,
+        "image_cfg_scale": getattr(p, "image_cfg_scale", None),
+        "model": p.sd_model_hash or p.sd_model_name,
+        "hires": hires,
+    }
+
+    h = hashlib.sha256()
+    h.update(json.dumps(params, sort_keys=True, default=str).encode())
+    h.update(x.detach().float().cpu().numpy().tobytes())
+    h.update(sigmas.detach().float().cpu().numpy().tobytes())
+    return h.hexdigest()[:32]
+
+
+def rng_state(rng):
+    generators = getattr(rng, "generators", None) or []
+    return [g.get_state() if isinstance(g, torch.Generator) else (g.seed, g.offset) for g in generators]
+
+
+def restore_rng(rng, states):
+    for generator, saved in zip(getattr(rng, "generators", None) or [], states):
+        if isinstance(generator, torch.Generator):
+            generator.set_state(saved)
+        else:
+            generator.seed, generator.offset = saved
+
+
+class SamplingCheckpointer:
+    """
+    Step-level snapshots of one sampling pass: the latent at the start of a step, the step index, the state of the
+    noise generators (p.rng) and the denoiser's call counter, written to `<store>/<job key>.pt` every `every` steps
+    and when the pass is interrupted or skipped.
+
+    A pass with a snapshot restarts from it instead of from step 0. The first pass of a hires job keeps its final
+    latent until the hires pass completes, so a retry goes straight to the hires pass; completed jobs delete their files.
+    """
+
+    def __init__(self, key, every):
+        self.key = key
+        self.every = every
+        self.path = os.path.join(store_dir(), f"{key}.pt")
+        self.latest = None
+        self.saved_step = None
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+
+        try:
+            saved = torch.load(self.path, map_location="cpu", weights_only=True)
+        except Exception as e:
+            errors.display(e, f"loading sampling checkpoint {self.path}")
+            return None
+
+        if saved.get("key") != self.key:
+            return None
+
+        self.saved_step = saved["step"]
+        return saved
+
+    def record(self, step, x, rng, denoiser_step):
+        self.latest = {"step": step, "x": x, "rng": rng_state(rng), "denoiser_step": denoiser_step}
+
+        if self.every > 0 and step > 0 and step % self.every == 0:
+            self.save()
+
+    def save(self, done=False):
+        if self.latest is None or (not done and self.latest["step"] == self.saved_step):
+            return
+
+        data = {**self.latest, "x": self.latest["x"].detach().cpu(), "key": self.key, "done": done}
+
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            torch.save(data, temp_path)
+            os.replace(temp_path, self.path)
+            self.saved_step = self.latest["step"]
+        except Exception as e:
+            errors.display(e, f"saving sampling checkpoint {self.path}")
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def finish(self, p, samples, steps, completed):
+        """Called after the pass: keeps the latest snapshot if it did not complete, otherwise cleans up."""
+
+        if not completed:
+            self.save()
+            return
+
+        if getattr(p, "enable_hr", False) and not getattr(p, "is_hr_pass", False):
+            self.latest = {"step": steps, "x": samples, "rng": rng_state(p.rng), "denoiser_step": 0}
+            self.save(done=True)
+            p.sampling_checkpoint_keys = [*getattr(p, "sampling_checkpoint_keys", []), self.key]
+            return
+
+        self.remove()
+
+        for key in getattr(p, "sampling_checkpoint_keys", []):
+            SamplingCheckpointer(key, 0).remove()
+
+        p.sampling_checkpoint_keys = []
+
+
+def create(p, sampler, x, sigmas):
+    global last_prune
+
+    if not shared.opts.sampling_checkpoints:
+        return None
+
+    checkpointer = SamplingCheckpointer(job_key(p, sampler, x, sigmas), int(shared.opts.sampling_checkpoint_every))
+
+    if time.time() - last_prune > prune_interval:
+        last_prune = time.time()
+        keys = [checkpointer.key, *getattr(p, "sampling_checkpoint_keys", [])]
+        prune(keep={os.path.join(store_dir(), f"{key}.pt") for key in keys})
+
+    return checkpointer
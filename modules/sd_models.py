@@ -14,14 +14,14 @@ from urllib import request
 import gc
 import contextlib
 
-from modules import paths, shared, modelloader, devices, script_callbacks, sd_vae, sd_disable_initialization, errors, hashes, sd_models_config, sd_unet, sd_models_xl, cache, extra_networks, processing, lowvram, sd_hijack, patches
+from modules import paths, shared, modelloader, devices, script_callbacks, sd_vae, sd_disable_initialization, errors, hashes, sd_models_config, sd_unet, sd_models_xl, cache, conditioning_cache, extra_networks, processing, lowvram, sd_hijack, patches
 from modules.shared import opts, cmd_opts
 from modules.timer import Timer
 import numpy as np
-from backend.loader import forge_loader
+from backend.loader import forge_loader, describe_checkpoint
 from backend import memory_management
 from backend.args import dynamic_args
-from backend.utils import load_torch_file
+from backend.utils import load_torch_file, read_safetensors_header
 
 
 model_dir = "Stable-diffusion"
@@ -105,6 +105,28 @@ class CheckpointInfo:
         if self.shorthash:
             self.ids += [self.shorthash, self.sha256, f'{self.name} [{self.shorthash}]', f'{self.name_for_extra} [{self.shorthash}]']
 
+        try:
+            self.size = os.path.getsize(filename)
+        except OSError:
+            self.size = None
+
+        self.architecture = None
+
+    def read_architecture(self):
+        """Architecture, huggingface repo and parameter count guessed from the safetensors header alone; cached per file until it changes."""
+
+        if self.architecture is not None:
+            return self.architecture
+
+        self.architecture = {}
+        if self.is_safetensors:
+            try:
+                self.architecture = cache.cached_data_for_file('checkpoint-architecture', "checkpoint/" + self.name, self.filename, lambda: describe_checkpoint(self.filename) or {})
+            except Exception as e:
+                errors.display(e, f"detecting architecture of {self.filename}")
+
+        return self.architecture
+
     def register(self):
         checkpoints_list[self.title] = self
         for id in self.ids:
@@ -260,29 +282,23 @@ def get_state_dict_from_checkpoint(pl_sd):
 def read_metadata_from_safetensors(filename):
     import json
 
-    with open(filename, mode="rb") as file:
-        metadata_len = file.read(8)
-        metadata_len = int.from_bytes(metadata_len, "little")
-        json_start = file.read(2)
-
-        assert metadata_len > 2 and json_start in (b'{"', b"{'"), f"{filename} is not a safetensors file"
+    res = {}
 
-        res = {}
+    try:
+        _, metadata = read_safetensors_header(filename)
+    except json.JSONDecodeError:
+        errors.report(f"Error reading metadata from file: {filename}", exc_info=True)
+        return res
 
-        try:
-            json_data = json_start + file.read(metadata_len-2)
-            json_obj = json.loads(json_data)
-            for k, v in json_obj.get("__metadata__", {}).items():
-                res[k] = v
-                if isinstance(v, str) and v[0:1] == '{':
-                    try:
-                        res[k] = json.loads(v)
-                    except Exception:
-                        pass
-        except Exception:
-             errors.report(f"Error reading metadata from file: {filename}", exc_info=True)
+    for k, v in metadata.items():
+        res[k] = v
+        if isinstance(v, str) and v[0:1] == '{':
+            try:
+                res[k] = json.loads(v)
+            except Exception:
+                pass
 
-        return res
+    return res
 
 
 def read_state_dict(checkpoint_file, print_global_state=False, map_location=None):
@@ -459,10 +475,23 @@ def apply_token_merging(sd_model, token_merging_ratio):
 
     print(f'token_merging_ratio = {token_merging_ratio}')
 
-    from backend.misc.tomesd import TomePatcher
+    from backend.misc.tomesd import TomePatcher, TomeDiTPatcher
+    from backend.nn.flux import IntegratedFluxTransformer2DModel
+    from backend.nn.chroma import IntegratedChromaTransformer2DModel
+    from backend.nn.mmditx import MMDiTX
+
+    unet = sd_model.forge_objects.unet
+
+    if isinstance(unet.model.diffusion_model, (IntegratedFluxTransformer2DModel, IntegratedChromaTransformer2DModel, MMDiTX)):
+        sd_model.forge_objects.unet = TomeDiTPatcher().patch(
+            model=unet,
+            ratio=token_merging_ratio,
+            schedule=opts.token_merging_dit_schedule
+        )
+        return
 
     sd_model.forge_objects.unet = TomePatcher().patch(
-        model=sd_model.forge_objects.unet,
+        model=unet,
         ratio=token_merging_ratio
     )
 
@@ -535,6 +564,10 @@ def forge_model_reload():
 
     timer.record("scripts callbacks")
 
+    conditioning_cache.prewarm_styles(sd_model)
+
+    timer.record("prewarm text encoder cache")
+
     print(f"Model loaded in {timer.summary()}.")
 
     model_data.forge_hash = current_hash
@@ -1,4 +1,6 @@
+import contextlib
 import inspect
+import time
 from collections import namedtuple
 import numpy as np
 import torch
@@ -36,6 +38,44 @@ def setup_img2img_steps(p, steps=None):
 approximation_indexes = {"Full": 0, "Approx NN": 1, "Approx cheap": 2, "TAESD": 3}
 
 
+class VaeTimings:
+    """
+    Last measured cost of the full VAE in seconds per megapixel of image, for "decode" and "encode"; used to estimate
+    the time the latent-only hires fix saves. On CUDA the calls are timed with events that are only read once they
+    have completed, so measuring never waits for the device; elsewhere the host clock is used.
+    """
+
+    def __init__(self):
+        self.pending = {}
+        self.seconds_per_megapixel = {}
+
+    @contextlib.contextmanager
+    def measure(self, kind, megapixels):
+        if devices.device.type != "cuda":
+            started = time.perf_counter()
+            yield
+            self.seconds_per_megapixel[kind] = (time.perf_counter() - started) / megapixels
+            return
+
+        start = torch.cuda.Event(enable_timing=True)
+        end = torch.cuda.Event(enable_timing=True)
+        start.record()
+        yield
+        end.record()
+        self.pending[kind] = (start, end, megapixels)
+
+    def get(self, kind):
+        pending = self.pending.get(kind)
+        if pending is not None and pending[1].query():
+            start, end, megapixels = self.pending.pop(kind)
+            self.seconds_per_megapixel[kind] = start.elapsed_time(end) / 1000 / megapixels
+
+        return self.seconds_per_megapixel.get(kind)
+
+
+vae_timings = VaeTimings()
+
+
 def samples_to_images_tensor(sample, approximation=None, model=None):
     """Transforms 4-channel latent space images into 3-channel RGB image tensors, with values in range [-1, 1]."""
 
@@ -62,7 +102,8 @@ def samples_to_images_tensor(sample, approximation=None, model=None):
     else:
         if model is None:
             model = shared.sd_model
-        x_sample = model.decode_first_stage(sample)
+        with vae_timings.measure("decode", sample.shape[0] * sample.shape[2] * sample.shape[3] * 64 / 1e6):
+            x_sample = model.decode_first_stage(sample)
 
     return x_sample
 
@@ -107,15 +148,16 @@ def images_tensor_to_samples(image, approximation=None, model=None):
 
         image = image.to(shared.device, dtype=devices.dtype_vae)
         image = image * 2 - 1
-        if len(image) > 1:
-            x_latent = torch.stack([
-                model.get_first_stage_encoding(
-                    model.encode_first_stage(torch.unsqueeze(img, 0))
-                )[0]
-                for img in image
-            ])
-        else:
-            x_latent = model.get_first_stage_encoding(model.encode_first_stage(image))
+        with vae_timings.measure("encode", image.shape[0] * image.shape[2] * image.shape[3] / 1e6):
+            if len(image) > 1:
+                x_latent = torch.stack([
+                    model.get_first_stage_encoding(
+                        model.encode_first_stage(torch.unsqueeze(img, 0))
+                    )[0]
+                    for img in image
+                ])
+            else:
+                x_latent = model.get_first_stage_encoding(model.encode_first_stage(image))
 
     return x_latent
 
@@ -262,12 +304,18 @@ class Sampler:
         self.sampler_extra_args = None
         self.options = {}
 
+        self.checkpointer = None
+        self.checkpoint_offset = 0
+
     def callback_state(self, d):
-        step = d['i']
+        step = d['i'] + self.checkpoint_offset
 
         if self.stop_at is not None and step > self.stop_at:
             raise InterruptedException
 
+        if self.checkpointer is not None:
+            self.checkpointer.record(step, d['x'], self.p.rng, self.model_wrap_cfg.step - 1)
+
         state.sampling_step = step
         shared.total_tqdm.update()
 
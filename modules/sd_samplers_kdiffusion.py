@@ -2,7 +2,7 @@ import torch
 import inspect
 import k_diffusion.sampling
 import k_diffusion.external
-from modules import sd_samplers_common, sd_samplers_extra, sd_samplers_cfg_denoiser, sd_schedulers, devices
+from modules import sd_samplers_common, sd_samplers_extra, sd_samplers_cfg_denoiser, sd_schedulers, devices, sampling_checkpoints
 from modules.sd_samplers_cfg_denoiser import CFGDenoiser  # noqa: F401
 from modules.script_callbacks import ExtraNoiseParams, extra_noise_callback
 
@@ -133,6 +133,51 @@ class KDiffusionSampler(sd_samplers_common.Sampler):
 
         return sigmas.cpu()
 
+    def launch_sampling_checkpointed(self, p, x, sigmas, steps, extra_params_kwargs):
+        """
+        launch_sampling for samplers that take a `sigmas` schedule; with sampling_checkpoints enabled, resumes from the
+        pass's last snapshot (latent, step, noise generator state) and snapshots it while sampling.
+
+        Multistep samplers (DPM++ 2M, LMS, ...) restart their history at the resumed step, so the following step is
+        first order; single-step and ancestral samplers continue exactly.
+        """
+
+        self.checkpointer = None
+        self.checkpoint_offset = 0
+
+        parameters = inspect.signature(self.func).parameters
+        if 'sigmas' in parameters and 'n' not in parameters:
+            self.checkpointer = sampling_checkpoints.create(p, self, x, sigmas)
+
+        if self.checkpointer is not None:
+            saved = self.checkpointer.load()
+
+            if saved is not None and saved['done']:
+                p.sampling_checkpoint_keys = [*getattr(p, "sampling_checkpoint_keys", []), self.checkpointer.key]
+                self.checkpointer = None
+                return saved['x'].to(x)
+
+            if saved is not None and 0 < saved['step'] < len(sigmas) - 1:
+                print(f"Resuming sampling from step {saved['step']} of {len(sigmas) - 1}")
+                x = saved['x'].to(x)
+                sampling_checkpoints.restore_rng(p.rng, saved['rng'])
+                self.checkpoint_offset = saved['step']
+
+        extra_params_kwargs['sigmas'] = sigmas[self.checkpoint_offset:]
+
+        if self.checkpoint_offset:
+            self.model_wrap_cfg.step = saved['denoiser_step']
+
+        samples = self.launch_sampling(steps, lambda: self.func(self.model_wrap_cfg, x, extra_args=self.sampler_extra_args, disable=False, callback=self.callback_state, **extra_params_kwargs))
+
+        if self.checkpointer is not None:
+            completed = not (shared.state.interrupted or shared.state.skipped)
+            self.checkpointer.finish(p, samples, len(sigmas) - 1, completed)
+            self.checkpointer = None
+
+        self.checkpoint_offset = 0
+        return samples
+
     def sample_img2img(self, p, x, noise, conditioning, unconditional_conditioning, steps=None, image_conditioning=None):
         unet_patcher = self.model_wrap.inner_model.forge_objects.unet
         sampling_prepare(self.model_wrap.inner_model.forge_objects.unet, x=x)
@@ -185,7 +230,10 @@ class KDiffusionSampler(sd_samplers_common.Sampler):
             's_min_uncond': self.s_min_uncond
         }
 
-        samples = self.launch_sampling(t_enc + 1, lambda: self.func(self.model_wrap_cfg, xi, extra_args=self.sampler_extra_args, disable=False, callback=self.callback_state, **extra_params_kwargs))
+        if 'sigmas' in parameters:
+            samples = self.launch_sampling_checkpointed(p, xi, sigma_sched, t_enc + 1, extra_params_kwargs)
+        else:
+            samples = self.launch_sampling(t_enc + 1, lambda: self.func(self.model_wrap_cfg, xi, extra_args=self.sampler_extra_args, disable=False, callback=self.callback_state, **extra_params_kwargs))
 
         self.add_infotext(p)
 
@@ -235,7 +283,10 @@ class KDiffusionSampler(sd_samplers_common.Sampler):
             's_min_uncond': self.s_min_uncond
         }
 
-        samples = self.launch_sampling(steps, lambda: self.func(self.model_wrap_cfg, x, extra_args=self.sampler_extra_args, disable=False, callback=self.callback_state, **extra_params_kwargs))
+        if 'sigmas' in parameters:
+            samples = self.launch_sampling_checkpointed(p, x, sigmas, steps, extra_params_kwargs)
+        else:
+            samples = self.launch_sampling(steps, lambda: self.func(self.model_wrap_cfg, x, extra_args=self.sampler_extra_args, disable=False, callback=self.callback_state, **extra_params_kwargs))
 
         self.add_infotext(p)
 
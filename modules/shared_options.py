@@ -38,6 +38,8 @@ options_templates.update(options_section(('saving-images', "Saving images/grids"
     "samples_format": OptionInfo('png', 'File format for images'),
     "samples_filename_pattern": OptionInfo("", "Images filename pattern", component_args=hide_dirs).link("wiki", "https://github.com/AUTOMATIC1111/stable-diffusion-webui/wiki/Custom-Images-Filename-Name-and-Subdirectory"),
     "save_images_add_number": OptionInfo(True, "Add number to filename when saving", component_args=hide_dirs),
+    "save_images_sequence_file": OptionInfo(True, "Keep the next filename number in a .sequence.json file in the output directory", component_args=hide_dirs).info("avoids listing the whole directory for every saved image; safe with several processes saving to the same directory"),
+    "save_images_in_background": OptionInfo(False, "Save images in a background thread while the next batch is generated").info("only with batch count > 1; images are still saved in order"),
     "save_images_replace_action": OptionInfo("Replace", "Saving the image to an existing file", gr.Radio, {"choices": ["Replace", "Add number suffix"], **hide_dirs}),
     "grid_save": OptionInfo(True, "Always save all generated image grids"),
     "grid_format": OptionInfo('png', 'File format for grids'),
@@ -110,8 +112,10 @@ options_templates.update(options_section(('upscaling', "Upscaling", "postprocess
     "dat_enabled_models": OptionInfo(["DAT x2", "DAT x3", "DAT x4"], "Select which DAT models to show in the web UI.", gr.CheckboxGroup, lambda: {"choices": shared_items.dat_models_names()}),
     "DAT_tile": OptionInfo(192, "Tile size for DAT upscalers.", gr.Slider, {"minimum": 0, "maximum": 512, "step": 16}).info("0 = no tiling"),
     "DAT_tile_overlap": OptionInfo(8, "Tile overlap for DAT upscalers.", gr.Slider, {"minimum": 0, "maximum": 48, "step": 1}).info("Low values = visible seam"),
+    "upscaler_tile_batch_size": OptionInfo(0, "Tiles per batch for tiled upscalers", gr.Slider, {"minimum": 0, "maximum": 32, "step": 1}).info("0 = automatic, based on free memory"),
     "upscaler_for_img2img": OptionInfo(None, "Upscaler for img2img", gr.Dropdown, lambda: {"choices": [x.name for x in shared.sd_upscalers]}),
     "set_scale_by_when_changing_upscaler": OptionInfo(False, "Automatically set the Scale by factor based on the name of the selected Upscaler."),
+    "hires_fix_latent_only": OptionInfo(False, "Hires fix: keep upscaling in latent space").info("replaces a pixel-space hires upscaler with Latent (bicubic antialiased), skipping the VAE decode -> upscale -> encode round trip; images saved before hires fix are decoded in one batch at the end; time saved per image is printed to console"),
 }))
 
 options_templates.update(options_section(('face-restoration', "Face restoration", "postprocessing"), {
@@ -135,6 +139,14 @@ options_templates.update(options_section(('system', "System", "system"), {
     "disable_mmap_load_safetensors": OptionInfo(False, "Disable memmapping for loading .safetensors files.").info("fixes very slow loading speed in some cases"),
     "hide_ldm_prints": OptionInfo(True, "Prevent Stability-AI's ldm/sgm modules from printing noise to console."),
     "dump_stacks_on_signal": OptionInfo(False, "Print stack traces before exiting the program with ctrl+c."),
+    "model_merger_device": OptionInfo("CPU", "Checkpoint merger compute device", gr.Radio, {"choices": ["CPU", "GPU"]}).info("safetensors output is merged tensor by tensor; GPU only speeds up the arithmetic"),
+    "model_merger_threads": OptionInfo(4, "Checkpoint merger threads", gr.Slider, {"minimum": 1, "maximum": 32, "step": 1}).info("tensors merged in parallel; each thread holds a few chunks in RAM"),
+    "model_merger_chunk_size_mb": OptionInfo(256, "Checkpoint merger chunk size (MB)", gr.Slider, {"minimum": 16, "maximum": 4096, "step": 16}).info("larger tensors are merged in row chunks of this size"),
+    "sampling_checkpoints": OptionInfo(False, "Save sampling checkpoints so that interrupted generations resume where they stopped").info("k-diffusion samplers; an identical request (same seed, prompts, settings and checkpoint) continues from the last saved step, on this or another instance sharing the directory"),
+    "sampling_checkpoint_every": OptionInfo(5, "Sampling checkpoints: save every N steps", gr.Slider, {"minimum": 1, "maximum": 50, "step": 1}).info("a checkpoint is also saved on interrupt/skip"),
+    "sampling_checkpoint_dir": OptionInfo("", "Sampling checkpoints: directory", component_args=hide_dirs).info("empty = sampling-checkpoints in the data directory"),
+    "sampling_checkpoint_max_age": OptionInfo(24, "Sampling checkpoints: delete checkpoints older than (hours)", gr.Number).info("checkpoints of generations that were never retried; 0 = keep"),
+    "sampling_checkpoint_max_mb": OptionInfo(2048, "Sampling checkpoints: maximum total size (MB)", gr.Number).info("oldest checkpoints are deleted first; 0 = unlimited"),
 }))
 
 options_templates.update(options_section(('profiler', "Profiler", "system"), {
@@ -246,6 +258,22 @@ options_templates.update(options_section(('optimizations', "Optimizations", "sd"
     "token_merging_ratio": OptionInfo(0.0, "Token merging ratio", gr.Slider, {"minimum": 0.0, "maximum": 0.9, "step": 0.1}, infotext='Token merging ratio').link("PR", "https://github.com/AUTOMATIC1111/stable-diffusion-webui/pull/9256").info("0=disable, higher=faster"),
     "token_merging_ratio_img2img": OptionInfo(0.0, "Token merging ratio for img2img", gr.Slider, {"minimum": 0.0, "maximum": 0.9, "step": 0.1}).info("only applies if non-zero and overrides above"),
     "token_merging_ratio_hr": OptionInfo(0.0, "Token merging ratio for high-res pass", gr.Slider, {"minimum": 0.0, "maximum": 0.9, "step": 0.1}, infotext='Token merging ratio hr').info("only applies if non-zero and overrides above"),
+    "token_merging_dit_schedule": OptionInfo("", "Token merging block schedule for Flux/Chroma/SD3").info("comma-separated block ranges with optional ratio, e.g. 0-18,19-:0.3; empty=all blocks except first and last"),
+    "batch_prompt_chunks": OptionInfo(False, "Encode all prompt chunks in one text encoder forward").info("long prompts (more than 75 tokens for CLIP, several BREAKs for T5) are encoded in a single batch instead of one forward per chunk; emphasis is still applied per chunk"),
+    "image_embedding_cache_mb": OptionInfo(256, "Image embedding cache size (MB)", gr.Number).info("CLIP-Vision outputs and InsightFace embeddings of reference images (IP-Adapter, InstantID), keyed by image content and model hash; 0=disable"),
+    "image_embedding_cache_disk": OptionInfo(False, "Persist image embedding cache to disk").info("keeps cached embeddings across restarts"),
+    "torch_compile": OptionInfo(False, "Compile models with torch.compile").info("faster steady-state sampling after a compile on the first generation of every image size; compiled kernels are cached on disk; generations with ControlNet, transformer patches or online LoRA run uncompiled"),
+    "torch_compile_targets": OptionInfo(["UNet/DiT", "VAE"], "torch.compile: models to compile", gr.CheckboxGroup, {"choices": ["UNet/DiT", "VAE"]}),
+    "torch_compile_mode": OptionInfo("default", "torch.compile: mode", gr.Radio, {"choices": ["default", "reduce-overhead", "max-autotune"]}),
+    "torch_compile_backend": OptionInfo("inductor", "torch.compile: backend", gr.Radio, {"choices": ["inductor", "aot_eager", "cudagraphs"]}),
+    "torch_compile_max_shapes": OptionInfo(8, "torch.compile: max input shapes to compile per model", gr.Slider, {"minimum": 1, "maximum": 32, "step": 1}).info("other shapes run uncompiled instead of triggering another compile"),
+    "regional_attention": OptionInfo(False, "Regional prompts: run all regions in one UNet pass using cross-attention masks").info("SD1/SDXL; for area/mask conds of different sizes, which otherwise take one UNet call each per step; regions are blended inside cross-attention instead of averaging separate predictions, so results differ slightly"),
+    "text_encoder_cache": OptionInfo(False, "Cache text encoder outputs on disk").info("prompts and negative prompts encoded before, including in previous sessions, skip the text encoder; keyed by checkpoint, text encoder files, LoRAs, clip skip and emphasis"),
+    "text_encoder_cache_mb": OptionInfo(1024, "Text encoder cache: maximum size on disk (MB)", gr.Slider, {"minimum": 64, "maximum": 16384, "step": 64}).info("least recently used entries are removed"),
+    "text_encoder_cache_prewarm_styles": OptionInfo(True, "Text encoder cache: encode styles when a model is loaded").info("style prompts and negative prompts without {prompt}"),
+    "vram_planner": OptionInfo(False, "Plan VRAM use per request").info("estimates each sampling pass from resolution, batch size, model, LoRAs and ControlNets before it starts; splits the cond/uncond batch before swapping weights and tiles the VAE decode up front instead of after an out-of-memory error"),
+    "vram_planner_reserve_mb": OptionInfo(768, "VRAM plan: memory kept free (MB)", gr.Slider, {"minimum": 0, "maximum": 8192, "step": 64}).info("for the CUDA context, other processes and fragmentation"),
+    "vram_planner_admission": OptionInfo("Reject if it cannot fit", "VRAM plan: requests that exceed the budget", gr.Radio, {"choices": ["Allow", "Reject if it cannot fit", "Reject if weights would be swapped"]}).info("rejected requests fail before the text encoder runs; the API answers them with 503, which the worker pool retries on another GPU"),
     "pad_cond_uncond": OptionInfo(False, "Pad prompt/negative prompt", infotext='Pad conds').info("improves performance when prompt and negative prompt have different lengths; changes seeds"),
     "pad_cond_uncond_v0": OptionInfo(False, "Pad prompt/negative prompt (v0)", infotext='Pad conds v0').info("alternative implementation for the above; used prior to 1.6.0 for DDIM sampler; overrides the above if set; WARNING: truncates negative prompt if it's too long; changes seeds"),
     "persistent_cond_cache": OptionInfo(True, "Persistent cond cache").info("do not recalculate conds from prompts if prompts have not changed since previous calculation"),
@@ -274,6 +302,7 @@ options_templates.update(options_section(('interrogate', "Interrogate"), {
     "interrogate_clip_min_length": OptionInfo(24, "BLIP: minimum description length", gr.Slider, {"minimum": 1, "maximum": 128, "step": 1}),
     "interrogate_clip_max_length": OptionInfo(48, "BLIP: maximum description length", gr.Slider, {"minimum": 1, "maximum": 256, "step": 1}),
     "interrogate_clip_dict_limit": OptionInfo(1500, "CLIP: maximum number of lines in text file").info("0 = No limit"),
+    "interrogate_clip_batch_size": OptionInfo(8, "CLIP: batch size for batch interrogation", gr.Slider, {"minimum": 1, "maximum": 64, "step": 1}).info("images per BLIP/CLIP forward in /sdapi/v1/interrogate-batch"),
     "interrogate_clip_skip_categories": OptionInfo([], "CLIP: skip inquire categories", gr.CheckboxGroup, lambda: {"choices": interrogate.category_types()}, refresh=interrogate.category_types),
     "interrogate_deepbooru_score_threshold": OptionInfo(0.5, "deepbooru: score threshold", gr.Slider, {"minimum": 0, "maximum": 1, "step": 0.01}),
     "deepbooru_sort_alpha": OptionInfo(True, "deepbooru: sort tags alphabetically").info("if not: sort by score"),
@@ -429,6 +458,8 @@ options_templates.update(options_section(('postprocessing', "Postprocessing", "p
     'postprocessing_operation_order': OptionInfo([], "Postprocessing operation order", ui_components.DropdownMulti, lambda: {"choices": [x.name for x in shared_items.postprocessing_scripts()]}),
     'upscaling_max_images_in_cache': OptionInfo(5, "Maximum number of images in upscaling cache", gr.Slider, {"minimum": 0, "maximum": 10, "step": 1}),
     'postprocessing_existing_caption_action': OptionInfo("Ignore", "Action for existing captions", gr.Radio, {"choices": ["Ignore", "Keep", "Prepend", "Append"]}).info("when generating captions using postprocessing; Ignore = use generated; Keep = use original; Prepend/Append = combine both"),
+    'postprocessing_batch_read_threads': OptionInfo(2, "Threads decoding the next images ahead in extras batch modes", gr.Slider, {"minimum": 0, "maximum": 8, "step": 1}).info("0 = read each image when it is processed"),
+    'postprocessing_batch_write_threads': OptionInfo(2, "Threads encoding and saving results in extras batch modes", gr.Slider, {"minimum": 0, "maximum": 8, "step": 1}).info("0 = save on the processing thread; filenames and image saved callbacks stay in input order"),
 }))
 
 options_templates.update(options_section((None, "Hidden options"), {
@@ -1,9 +1,18 @@
 import gzip
+import struct
+
+import numpy as np
+from PIL import Image
 
 from modules.script_callbacks import ImageSaveParams
 from modules import shared
 
 
+signature_length = len('stealth_pnginfo')
+alpha_signatures = {b'stealth_pnginfo': False, b'stealth_pngcomp': True}
+rgb_signatures = {b'stealth_rgbinfo': False, b'stealth_rgbcomp': True}
+
+
 def add_stealth_pnginfo(params: ImageSaveParams):
     stealth_pnginfo_option = shared.opts.data.get('stealth_pnginfo_option', 'Alpha')
     if not stealth_pnginfo_option or stealth_pnginfo_option == 'None':
@@ -14,150 +23,128 @@ def add_stealth_pnginfo(params: ImageSaveParams):
         return
     add_data(params, str(stealth_pnginfo_option), True)
 
-def prepare_data(params, mode='Alpha', compressed=True):
+
+def prepare_bytes(params, mode='Alpha', compressed=True):
+    """Signature, 32-bit big-endian payload length in bits, payload; the bitstream is this, MSB first."""
+
     signature = f"stealth_{'png' if mode == 'Alpha' else 'rgb'}{'info' if not compressed else 'comp'}"
-    binary_signature = ''.join(format(byte, '08b') for byte in signature.encode('utf-8'))
     param = params.encode('utf-8') if not compressed else gzip.compress(bytes(params, 'utf-8'))
-    binary_param = ''.join(format(byte, '08b') for byte in param)
-    binary_param_len = format(len(binary_param), '032b')
-    return binary_signature + binary_param_len + binary_param
+    return signature.encode('utf-8') + struct.pack('>I', len(param) * 8) + param
+
+
+def prepare_data(params, mode='Alpha', compressed=True):
+    return ''.join(format(byte, '08b') for byte in prepare_bytes(params, mode, compressed))
+
+
+def column_major(arr):
+    """(H, W, C) -> (W * H, C), pixels ordered column by column (x outer, y inner) like the stealth format."""
+    return arr.transpose(1, 0, 2).reshape(-1, arr.shape[2])
+
 
 def add_data(params, mode='Alpha', compressed=True):
-    binary_data = prepare_data(params.pnginfo['parameters'], mode, compressed)
+    bits = np.unpackbits(np.frombuffer(prepare_bytes(params.pnginfo['parameters'], mode, compressed), dtype=np.uint8))
+
     if mode == 'Alpha':
         params.image.putalpha(255)
-    width, height = params.image.size
-    pixels = params.image.load()
-    index = 0
-    end_write = False
-    for x in range(width):
-        for y in range(height):
-            if index >= len(binary_data):
-                end_write = True
-                break
-            values = pixels[x, y]
-            if mode == 'Alpha':
-                r, g, b, a = values
-            else:
-                r, g, b = values
-            if mode == 'Alpha':
-                a = (a & ~1) | int(binary_data[index])
-                index += 1
-            else:
-                r = (r & ~1) | int(binary_data[index])
-                if index + 1 < len(binary_data):
-                    g = (g & ~1) | int(binary_data[index + 1])
-                if index + 2 < len(binary_data):
-                    b = (b & ~1) | int(binary_data[index + 2])
-                index += 3
-            pixels[x, y] = (r, g, b, a) if mode == 'Alpha' else (r, g, b)
-        if end_write:
-            break
+
+    image = params.image
+    width, height = image.size
+    channels = [3] if mode == 'Alpha' else [0, 1, 2]
+
+    bits = bits[:width * height * len(channels)]
+    pixel_count = -(-len(bits) // len(channels))
+    columns = -(-pixel_count // height)
+
+    arr = np.array(image.crop((0, 0, columns, height)))
+    pixels = column_major(arr)
+
+    values = pixels[:, channels].reshape(-1)
+    values[:len(bits)] = (values[:len(bits)] & 0xFE) | bits
+    pixels[:, channels] = values.reshape(-1, len(channels))
+
+    arr = pixels.reshape(columns, height, arr.shape[2]).transpose(1, 0, 2)
+    image.paste(Image.fromarray(np.ascontiguousarray(arr), image.mode), (0, 0))
+
+
+def read_lsb(image, channels, start, count):
+    """`count` bits from the LSB bitstream of `channels` (pixels in column-major order), starting at bit `start`."""
+
+    width, height = image.size
+    per_pixel = len(channels)
+
+    end_pixel = -(-(start + count) // per_pixel)
+    x0 = start // per_pixel // height
+    x1 = min(width, -(-end_pixel // height))
+
+    arr = np.asarray(image.crop((x0, 0, x1, height)))
+    bits = column_major(arr)[:, channels].reshape(-1) & 1
+
+    offset = start - x0 * height * per_pixel
+    return bits[offset:offset + count]
+
+
+def bits_to_bytes(bits):
+    full = len(bits) - len(bits) % 8
+    data = np.packbits(bits[:full]).tobytes()
+
+    if full < len(bits):
+        # a trailing partial byte is read as a plain binary number, same as int(bits, 2)
+        data += bytes([int(''.join(str(b) for b in bits[full:]), 2)])
+
+    return data
+
 
 def read_info_from_image_stealth(image):
-    geninfo = None
+    if image.mode not in ('RGB', 'RGBA'):
+        return None
+
     width, height = image.size
-    pixels = image.load()
+    total = width * height
+    signature_bits = signature_length * 8
 
-    has_alpha = True if image.mode == 'RGBA' else False
     mode = None
     compressed = False
-    binary_data = ''
-    buffer_a = ''
-    buffer_rgb = ''
-    index_a = 0
-    index_rgb = 0
-    sig_confirmed = False
-    confirming_signature = True
-    reading_param_len = False
-    reading_param = False
-    read_end = False
-    for x in range(width):
-        for y in range(height):
-            if has_alpha:
-                r, g, b, a = pixels[x, y]
-                buffer_a += str(a & 1)
-                index_a += 1
-            else:
-                r, g, b = pixels[x, y]
-            buffer_rgb += str(r & 1)
-            buffer_rgb += str(g & 1)
-            buffer_rgb += str(b & 1)
-            index_rgb += 3
-            if confirming_signature:
-                if index_a == len('stealth_pnginfo') * 8:
-                    decoded_sig = bytearray(int(buffer_a[i:i + 8], 2) for i in
-                                            range(0, len(buffer_a), 8)).decode('utf-8', errors='ignore')
-                    if decoded_sig in {'stealth_pnginfo', 'stealth_pngcomp'}:
-                        confirming_signature = False
-                        sig_confirmed = True
-                        reading_param_len = True
-                        mode = 'alpha'
-                        if decoded_sig == 'stealth_pngcomp':
-                            compressed = True
-                        buffer_a = ''
-                        index_a = 0
-                    else:
-                        read_end = True
-                        break
-                elif index_rgb == len('stealth_pnginfo') * 8:
-                    decoded_sig = bytearray(int(buffer_rgb[i:i + 8], 2) for i in
-                                            range(0, len(buffer_rgb), 8)).decode('utf-8', errors='ignore')
-                    if decoded_sig in {'stealth_rgbinfo', 'stealth_rgbcomp'}:
-                        confirming_signature = False
-                        sig_confirmed = True
-                        reading_param_len = True
-                        mode = 'rgb'
-                        if decoded_sig == 'stealth_rgbcomp':
-                            compressed = True
-                        buffer_rgb = ''
-                        index_rgb = 0
-            elif reading_param_len:
-                if mode == 'alpha':
-                    if index_a == 32:
-                        param_len = int(buffer_a, 2)
-                        reading_param_len = False
-                        reading_param = True
-                        buffer_a = ''
-                        index_a = 0
-                else:
-                    if index_rgb == 33:
-                        pop = buffer_rgb[-1]
-                        buffer_rgb = buffer_rgb[:-1]
-                        param_len = int(buffer_rgb, 2)
-                        reading_param_len = False
-                        reading_param = True
-                        buffer_rgb = pop
-                        index_rgb = 1
-            elif reading_param:
-                if mode == 'alpha':
-                    if index_a == param_len:
-                        binary_data = buffer_a
-                        read_end = True
-                        break
-                else:
-                    if index_rgb >= param_len:
-                        diff = param_len - index_rgb
-                        if diff < 0:
-                            buffer_rgb = buffer_rgb[:diff]
-                        binary_data = buffer_rgb
-                        read_end = True
-                        break
-            else:
-                # impossible
-                read_end = True
-                break
-        if read_end:
-            break
-    if sig_confirmed and binary_data != '':
-        # Convert binary string to UTF-8 encoded text
-        byte_data = bytearray(int(binary_data[i:i + 8], 2) for i in range(0, len(binary_data), 8))
-        try:
-            if compressed:
-                decoded_data = gzip.decompress(bytes(byte_data)).decode('utf-8')
-            else:
-                decoded_data = byte_data.decode('utf-8', errors='ignore')
-            geninfo = decoded_data
-        except:
-            pass
-    return geninfo
+
+    # the RGB signature ends at pixel 40 and is checked first, the alpha one ends at pixel 120
+    if total >= signature_bits // 3:
+        signature = bits_to_bytes(read_lsb(image, [0, 1, 2], 0, signature_bits))
+        if signature in rgb_signatures:
+            mode, compressed = 'rgb', rgb_signatures[signature]
+
+    if mode is None and image.mode == 'RGBA' and total >= signature_bits:
+        signature = bits_to_bytes(read_lsb(image, [3], 0, signature_bits))
+        if signature in alpha_signatures:
+            mode, compressed = 'alpha', alpha_signatures[signature]
+
+    if mode is None:
+        return None
+
+    channels = [3] if mode == 'alpha' else [0, 1, 2]
+    per_pixel = len(channels)
+    length_end = signature_bits + 32
+
+    if total * per_pixel < length_end:
+        return None
+
+    param_len = int.from_bytes(bits_to_bytes(read_lsb(image, channels, signature_bits, 32)), 'big')
+
+    if mode == 'alpha':
+        # the payload ends at a pixel boundary; an empty payload never completes
+        if param_len == 0 or total < length_end + param_len:
+            return None
+    else:
+        # the payload is complete at the first pixel after the length field with all of its bits read
+        length_pixel = (length_end - 1) // per_pixel
+        end_pixel = max(length_pixel + 1, -(-(length_end + param_len) // per_pixel) - 1)
+        if end_pixel >= total or param_len == 0:
+            return None
+
+    byte_data = bits_to_bytes(read_lsb(image, channels, length_end, param_len))
+
+    try:
+        if compressed:
+            return gzip.decompress(byte_data).decode('utf-8')
+
+        return byte_data.decode('utf-8', errors='ignore')
+    except Exception:
+        return None
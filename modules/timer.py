@@ -84,8 +84,31 @@ class Timer:
 
 parser = argparse.ArgumentParser(add_help=False)
 parser.add_argument("--log-startup", action='store_true', help="print a detailed log of what's happening at startup")
+parser.add_argument("--profile-imports", action='store_true', help="record the time spent importing each module at startup and print the slowest ones")
 args = parser.parse_known_args()[0]
 
 startup_timer = Timer(print_log=args.log_startup)
 
+import_profiler = None
+if args.profile_imports:
+    from modules.import_profiler import ImportProfiler
+
+    import_profiler = ImportProfiler()
+    import_profiler.install()
+
 startup_record = None
+
+
+def record_startup():
+    """Stores the startup timings (and the import profile with --profile-imports) for /internal/profile-startup and sysinfo."""
+
+    global startup_record
+
+    startup_record = startup_timer.dump()
+
+    if import_profiler is not None:
+        startup_record["imports"] = import_profiler.dump()
+        print(import_profiler.report())
+
+        # imports after startup (extensions loading models, lazy preprocessors) would keep paying for the wrapper
+        import_profiler.uninstall()
@@ -8,7 +8,8 @@ from pathlib import Path
 from typing import Any, Iterable, Optional, Sequence, Union
 from dataclasses import dataclass
 
-from modules import shared, ui_extra_networks_user_metadata, errors, extra_networks, util
+from modules import shared, ui_extra_networks_user_metadata, errors, extra_networks
+from modules.ui_extra_networks_index import IndexedFileLister, ItemIndex, filter_and_sort
 import os
 from modules.images import read_info_from_image, save_image_with_geninfo
 import gradio as gr
@@ -22,6 +23,7 @@ from modules.infotext_utils import image_from_url_text
 extra_pages = []
 allowed_dirs = set()
 default_allowed_preview_extensions = ["png", "jpg", "jpeg", "webp", "gif"]
+card_options = ("extra_networks_card_height", "extra_networks_card_width", "extra_networks_card_text_scale", "extra_networks_hidden_models", "extra_networks_card_show_desc", "extra_networks_card_description_is_html")
 
 # Feature flag: enable native Gradio Gallery for specific Extra Networks pages
 _dataset_mode = os.getenv('GRADIO_EXTRA_NETWORKS_DATASET', '').strip().lower() in ('1', 'true', 'yes', 'on')
@@ -179,11 +181,25 @@ def get_single_card(page: str = "", tabname: str = "", name: str = ""):
     return JSONResponse({"html": item_html})
 
 
+def get_items(page: str = "", search: str = "", sort: str = "default", sort_dir: str = "", offset: int = 0, limit: int = 100):
+    from starlette.responses import JSONResponse
+
+    page = next(iter([x for x in extra_pages if x.name == page]), None)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Page not found")
+
+    total, items = page.query_items(search, sort, sort_dir, offset, min(limit, 1000))
+    fields = ("name", "filename", "mtime", "size", "preview", "description", "shorthash", "sha256", "search_terms", "sort_keys", "sd_version_str")
+
+    return JSONResponse({"total": total, "offset": offset, "items": [{k: item.get(k) for k in fields} for item in items]})
+
+
 def add_pages_to_demo(app):
     app.add_api_route("/sd_extra_networks/thumb", fetch_file, methods=["GET"])
     app.add_api_route("/sd_extra_networks/cover-images", fetch_cover_images, methods=["GET"])
     app.add_api_route("/sd_extra_networks/metadata", get_metadata, methods=["GET"])
     app.add_api_route("/sd_extra_networks/get-single-card", get_single_card, methods=["GET"])
+    app.add_api_route("/sd_extra_networks/items", get_items, methods=["GET"])
 
 
 def quote_js(s):
@@ -202,7 +218,9 @@ class ExtraNetworksPage:
         self.allow_negative_prompt = False
         self.metadata = {}
         self.items = {}
-        self.lister = util.MassFileLister()
+        self.lister = IndexedFileLister()
+        self.item_index = ItemIndex(self.name)
+        self.cards = {}
         # HTML Templates
         self.pane_tpl = shared.html("extra-networks-pane.html")
         self.pane_content_tree_tpl = shared.html("extra-networks-pane-tree.html")
@@ -587,25 +605,10 @@ class ExtraNetworksPage:
             HTML formatted string.
         """
         # Optional server-side filter/sort for Gradio 5 (reduces fragile DOM ops)
-        items = list(self.items.values())
-
-        q = (search or "").strip().lower()
-        if q:
-            def _match(it: dict) -> bool:
-                name = str(it.get("name", "")).lower()
-                desc = str(it.get("description", "") or "").lower()
-                terms = [str(t).lower() for t in it.get("search_terms", [])]
-                return (q in name) or (q in desc) or any(q in t for t in terms)
-            items = [it for it in items if _match(it)]
-
-        field = (sort_field or "default").strip().lower()
         reverse = (str(sort_dir or shared.opts.extra_networks_card_order).lower() == 'descending')
-        try:
-            items.sort(key=lambda it: it.get('sort_keys', {}).get(field, it.get('sort_keys', {}).get('default', 0)), reverse=reverse)
-        except Exception:
-            pass
+        items = filter_and_sort(self.items.values(), search, sort_field, reverse)
 
-        res = [self.create_item_html(tabname, it, self.card_tpl) for it in items]
+        res = [self.create_card_html(tabname, it) for it in items]
 
         if not res:
             dirs = "".join([f"<li>{x}</li>" for x in self.allowed_directories_for_previews()])
@@ -663,6 +666,57 @@ class ExtraNetworksPage:
 
         return self.pane_tpl.format(**page_params, pane_content=pane_content)
 
+    def create_card_html(self, tabname, item):
+        """Card HTML for an item; reused until the item's index record, its position or the card options change."""
+
+        key = (item.get("record"), item.get("sort_keys", {}).get("default"), *[getattr(shared.opts, x) for x in card_options])
+        cached = self.cards.get((tabname, item["name"]))
+        if key[0] is not None and cached is not None and cached[0] == key:
+            return cached[1]
+
+        card = self.create_item_html(tabname, item, self.card_tpl)
+        self.cards[(tabname, item["name"])] = (key, card)
+        return card
+
+    def item_signature(self, name, filename, extra=()):
+        """Stats of the model file and of its sidecar files and previews, plus whatever else create_item depends on."""
+
+        path = os.path.splitext(filename)[0]
+        files = [filename, f"{path}.json", f"{path}.txt", f"{path}.description.txt"]
+        files += sum([[f"{path}.{ext}", f"{path}.preview.{ext}"] for ext in allowed_preview_extensions()], [])
+
+        res = [name, shared.opts.samples_format, *extra]
+        for file in files:
+            if self.lister.exists(file):
+                res.append([os.path.basename(file), *self.lister.stat(file)])
+
+        return res
+
+    def create_item_indexed(self, name, filename, index=None, extra=()):
+        """
+        create_item through the item index: the stored item is returned while the model file, its sidecars and
+        previews are unchanged, and create_item runs only for new or changed items.
+        """
+
+        try:
+            signature = self.item_signature(name, filename, extra)
+        except OSError:
+            return self.create_item(name, index)
+
+        item = self.item_index.get(filename, signature)
+        if item is None:
+            item = self.create_item(name, index)
+            if item is None:
+                return None
+
+            mtime, _, size = self.lister.stat(filename) if self.lister.exists(filename) else (0, 0, 0)
+            item["mtime"] = mtime
+            item["size"] = size
+            item["record"] = self.item_index.put(filename, signature, item)
+
+        item["sort_keys"]["default"] = index
+        return item
+
     def create_item(self, name, index=None):
         raise NotImplementedError()
 
@@ -719,16 +773,29 @@ class ExtraNetworksPage:
         Find and read a description file for a given path (without extension).
         """
         for file in [f"{path}.txt", f"{path}.description.txt"]:
-            if not self.lister.exists(file):
-                continue
+            description = self.lister.read_text(file)
+            if description is not None:
+                return description
 
-            try:
-                with open(file, "r", encoding="utf-8", errors="replace") as f:
-                    return f.read()
-            except OSError:
-                pass
         return None
 
+    def query_items(self, search=None, sort_field=None, sort_dir=None, offset=0, limit=100):
+        """
+        Server-side search, sort and pagination over the page's items; the item list is built on first use, from the
+        item index for pages that list their items with create_item_indexed.
+
+        Returns:
+            tuple: (number of matching items, list of items in the requested page)
+        """
+        if not self.items:
+            self.lister.reset()
+            self.items = {x["name"]: x for x in self.list_items()}
+
+        reverse = (str(sort_dir or shared.opts.extra_networks_card_order).lower() == 'descending')
+        items = filter_and_sort(self.items.values(), search, sort_field, reverse)
+
+        return len(items), items[max(0, offset):max(0, offset) + max(0, limit)]
+
     def create_user_metadata_editor(self, ui, tabname):
         return ui_extra_networks_user_metadata.UserMetadataEditor(ui, tabname, self)
 
@@ -5,6 +5,14 @@ from modules import shared, ui_extra_networks, sd_models
 from modules.ui_extra_networks_checkpoints_user_metadata import CheckpointUserMetadataEditor
 
 
+def checkpoint_summary(architecture, size):
+    parts = [architecture] if architecture else []
+    if size:
+        parts.append(f"{size / 1024 ** 3:.2f} GB")
+
+    return ", ".join(parts) or None
+
+
 class ExtraNetworksPageCheckpoints(ui_extra_networks.ExtraNetworksPage):
     def __init__(self):
         super().__init__('Checkpoints')
@@ -23,12 +31,17 @@ class ExtraNetworksPageCheckpoints(ui_extra_networks.ExtraNetworksPage):
         search_terms = [self.search_terms_from_path(checkpoint.filename)]
         if checkpoint.sha256:
             search_terms.append(checkpoint.sha256)
+
+        architecture = checkpoint.read_architecture().get("architecture")
+        if architecture:
+            search_terms.append(architecture)
         return {
             "name": checkpoint.name_for_extra,
             "filename": checkpoint.filename,
             "shorthash": checkpoint.shorthash,
+            "sha256": checkpoint.sha256,
             "preview": self.find_preview(path),
-            "description": self.find_description(path),
+            "description": self.find_description(path) or checkpoint_summary(architecture, checkpoint.size),
             "search_terms": search_terms,
             "onclick": html.escape(f"return selectCheckpoint({ui_extra_networks.quote_js(name)})"),
             "local_preview": f"{path}.{shared.opts.samples_format}",
@@ -40,7 +53,11 @@ class ExtraNetworksPageCheckpoints(ui_extra_networks.ExtraNetworksPage):
         # instantiate a list to protect against concurrent modification
         names = list(sd_models.checkpoints_list)
         for index, name in enumerate(names):
-            item = self.create_item(name, index)
+            checkpoint = sd_models.checkpoint_aliases.get(name)
+            if checkpoint is None:
+                continue
+
+            item = self.create_item_indexed(name, checkpoint.filename, index, extra=[checkpoint.sha256])
             if item is not None:
                 yield item
 
@@ -27,6 +27,7 @@ class ExtraNetworksPageHypernetworks(ui_extra_networks.ExtraNetworksPage):
             "name": name,
             "filename": full_path,
             "shorthash": shorthash,
+            "sha256": sha256,
             "preview": self.find_preview(path),
             "description": self.find_description(path),
             "search_terms": search_terms,
@@ -39,7 +40,11 @@ class ExtraNetworksPageHypernetworks(ui_extra_networks.ExtraNetworksPage):
         # instantiate a list to protect against concurrent modification
         names = list(shared.hypernetworks)
         for index, name in enumerate(names):
-            item = self.create_item(name, index)
+            full_path = shared.hypernetworks.get(name)
+            if full_path is None:
+                continue
+
+            item = self.create_item_indexed(name, full_path, index, extra=[sha256_from_cache(full_path, f'hypernet/{name}')])
             if item is not None:
                 yield item
 
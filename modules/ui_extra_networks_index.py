@@ -0,0 +1,244 @@
+import hashlib
+import json
+import os
+
+from modules import cache, errors, shared, util
+
+index_subsection = "extra-networks-index"
+
+
+def dir_mtime(dirname):
+    try:
+        return os.stat(dirname).st_mtime
+    except OSError:
+        return None
+
+
+def scan_dir(dirname):
+    files = []
+    dirs = []
+    for x in os.scandir(dirname):
+        stat = x.stat(follow_symlinks=False)
+        files.append((x.name, stat.st_mtime, stat.st_ctime))
+
+        try:
+            if x.is_dir():
+                dirs.append(x.name)
+        except OSError:
+            pass
+
+    return files, dirs
+
+
+class IndexedCachedDir(util.MassFileListerCachedDir):
+    """Directory listing restored from the index; changes made through update_entry are written back to it."""
+
+    def __init__(self, dirname, files, dirs, mtime):
+        self.dirname = dirname
+        self.mtime = mtime
+        self.files = {x[0].lower(): x for x in files}
+        self.files_cased = {x[0]: x for x in files}
+        self.dirs = dirs
+
+    def update_entry(self, filename):
+        super().update_entry(filename)
+        store_dir(self.dirname, self.mtime, list(self.files_cased.values()), self.dirs)
+
+
+def store_dir(dirname, mtime, files, dirs):
+    cache.cache(index_subsection).set(f"dir:{dirname}", {"mtime": mtime, "files": files, "dirs": dirs})
+
+
+class IndexedFileLister(util.MassFileLister):
+    """
+    MassFileLister whose directory listings (file name, mtime, ctime, subdirectories) persist in the
+    `extra-networks-index` disk cache.
+
+    When a page is rebuilt a directory costs one stat: it is listed again only if its mtime changed, i.e. a file was
+    added, removed or renamed in it. Editing a file in place does not change the directory mtime, so the times of
+    files the listing says exist are read with `stat`, once per file until the next `reset`; sidecar files
+    (descriptions, user metadata) are read through `read_text`/`read_json`, which cache their content by path and
+    that mtime.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.scanned = 0
+        self.reused = 0
+        self.stats = {}
+
+    def reset(self):
+        super().reset()
+        self.stats.clear()
+
+    def load_dir(self, dirname):
+        mtime = dir_mtime(dirname)
+        if mtime is None:
+            return util.MassFileListerCachedDir(dirname)
+
+        entry = cache.cache(index_subsection).get(f"dir:{dirname}", None)
+        if entry is not None and entry["mtime"] == mtime and entry.get("dirs") is not None:
+            self.reused += 1
+            return IndexedCachedDir(dirname, entry["files"], entry["dirs"], mtime)
+
+        self.scanned += 1
+        files, dirs = scan_dir(dirname)
+        store_dir(dirname, mtime, files, dirs)
+        return IndexedCachedDir(dirname, files, dirs, mtime)
+
+    def find(self, path):
+        dirname = os.path.dirname(path)
+        if dirname not in self.cached_dirs:
+            self.cached_dirs[dirname] = self.load_dir(dirname)
+
+        return super().find(path)
+
+    def stat(self, path):
+        """(mtime, ctime, size) of an existing file, from the file itself rather than the directory listing."""
+
+        res = self.stats.get(path)
+        if res is None:
+            stat = os.stat(path)
+            res = self.stats[path] = (stat.st_mtime, stat.st_ctime, stat.st_size)
+
+        return res
+
+    def mctime(self, path):
+        if self.find(path) is None:
+            return 0, 0
+
+        try:
+            return self.stat(path)[:2]
+        except OSError:
+            return 0, 0
+
+    def walk_files(self, path, allowed_extensions=None):
+        """Same files in the same order as util.walk_files, but an unchanged directory is not listed again."""
+
+        if allowed_extensions is not None:
+            allowed_extensions = set(allowed_extensions)
+
+        dirs = {}
+        pending = [path]
+        while pending:
+            dirname = pending.pop()
+            if dirname in dirs:
+                continue
+
+            cached = self.cached_dirs.get(dirname)
+            if cached is None:
+                try:
+                    cached = self.cached_dirs[dirname] = self.load_dir(dirname)
+                except OSError:
+                    continue
+
+            if not isinstance(cached, IndexedCachedDir):
+                continue
+
+            dirs[dirname] = cached
+            pending += [os.path.join(dirname, x) for x in cached.dirs]
+
+        for root in sorted(dirs, key=util.natural_sort_key):
+            if not shared.opts.list_hidden_files and ("/." in root or "\\." in root):
+                continue
+
+            cached = dirs[root]
+            subdirs = set(cached.dirs)
+            for filename in sorted(cached.files_cased, key=util.natural_sort_key):
+                if filename in subdirs:
+                    continue
+
+                if allowed_extensions is not None:
+                    _, ext = os.path.splitext(filename)
+                    if ext.lower() not in allowed_extensions:
+                        continue
+
+                yield os.path.join(root, filename)
+
+    def read_cached(self, path, read):
+        if self.find(path) is None:
+            return None
+
+        mtime = self.stat(path)[0]
+
+        storage = cache.cache(index_subsection)
+        key = f"file:{path}"
+
+        entry = storage.get(key, None)
+        if entry is not None and entry["mtime"] == mtime:
+            return entry["value"]
+
+        value = read(path)
+        storage.set(key, {"mtime": mtime, "value": value})
+        return value
+
+    def read_text(self, path):
+        def read(filename):
+            with open(filename, "r", encoding="utf-8", errors="replace") as f:
+                return f.read()
+
+        try:
+            return self.read_cached(path, read)
+        except OSError:
+            return None
+
+    def read_json(self, path):
+        def read(filename):
+            with open(filename, "r", encoding="utf8") as file:
+                return json.load(file)
+
+        try:
+            return self.read_cached(path, read)
+        except Exception as e:
+            errors.display(e, f"reading extra network user metadata from {path}")
+            return None
+
+
+class ItemIndex:
+    """
+    Per-item records of an extra networks page, persisted in the `extra-networks-index` disk cache by model file:
+    the item built by create_item (path, preview, metadata, hashes, sort keys, plus the file's mtime and size) and
+    the signature it was built for.
+    """
+
+    def __init__(self, page):
+        self.page = page
+
+    def get(self, filename, signature):
+        entry = cache.cache(index_subsection).get(f"item:{self.page}:{filename}", None)
+        if entry is None or entry["signature"] != signature:
+            return None
+
+        return entry["item"]
+
+    def put(self, filename, signature, item):
+        """Stores the item and returns its record id, which changes whenever the signature does."""
+
+        record = hashlib.sha256(json.dumps(signature, default=str).encode("utf8")).hexdigest()[:16]
+        cache.cache(index_subsection).set(f"item:{self.page}:{filename}", {"signature": signature, "item": {**item, "record": record}})
+        return record
+
+
+def item_matches(item: dict, query: str) -> bool:
+    name = str(item.get("name", "")).lower()
+    desc = str(item.get("description", "") or "").lower()
+    terms = [str(t).lower() for t in item.get("search_terms", [])]
+    return (query in name) or (query in desc) or any(query in t for t in terms)
+
+
+def filter_and_sort(items, search=None, sort_field=None, reverse=False):
+    """Items matching `search` (case-insensitive substring of name, description or search terms), sorted by `sort_field`."""
+
+    query = (search or "").strip().lower()
+    if query:
+        items = [it for it in items if item_matches(it, query)]
+    else:
+        items = list(items)
+
+    field = (sort_field or "default").strip().lower().replace(" ", "_")
+    try:
+        items.sort(key=lambda it: it.get('sort_keys', {}).get(field, it.get('sort_keys', {}).get('default', 0)), reverse=reverse)
+    except Exception:
+        pass
+
+    return items
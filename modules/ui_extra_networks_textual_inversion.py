@@ -32,6 +32,7 @@ class ExtraNetworksPageTextualInversion(ui_extra_networks.ExtraNetworksPage):
             "name": name,
             "filename": embedding.filename,
             "shorthash": embedding.shorthash,
+            "sha256": embedding.hash,
             "preview": self.find_preview(path),
             "description": self.find_description(path),
             "search_terms": search_terms,
@@ -44,7 +45,11 @@ class ExtraNetworksPageTextualInversion(ui_extra_networks.ExtraNetworksPage):
         # instantiate a list to protect against concurrent modification
         names = list(embedding_db.word_embeddings)
         for index, name in enumerate(names):
-            item = self.create_item(name, index)
+            embedding = embedding_db.word_embeddings.get(name)
+            if embedding is None:
+                continue
+
+            item = self.create_item_indexed(name, embedding.filename, index, extra=[embedding.name, embedding.hash])
             if item is not None:
                 yield item
 
@@ -48,6 +48,117 @@ def upscale_pil_patch(model, img: Image.Image) -> Image.Image:
             return torch_bgr_to_pil_image(model(tensor))
 
 
+def tile_positions(size: int, tile_size: int, tile_overlap: int) -> list[int]:
+    stride = tile_size - tile_overlap
+    return list(range(0, size - tile_size, stride)) + [size - tile_size]
+
+
+def tile_weight_map(tile_size: int, overlap: int, *, feather: bool, device, dtype) -> torch.Tensor:
+    """
+    Blending weights for one output tile, shape (1, 1, tile_size, tile_size).
+
+    With `feather`, weights ramp linearly over `overlap` pixels at every edge (never reaching zero, so pixels
+    covered by a single tile keep their value after normalization); otherwise all weights are 1.
+    """
+    ramp = torch.ones(tile_size, dtype=torch.float32)
+    overlap = min(overlap, tile_size // 2)
+
+    if feather and overlap > 0:
+        edge = torch.arange(1, overlap + 1, dtype=torch.float32) / (overlap + 1)
+        ramp[:overlap] = edge
+        ramp[-overlap:] = edge.flip(0)
+
+    return (ramp[:, None] * ramp[None, :]).to(device=device, dtype=dtype)[None, None]
+
+
+def auto_tile_batch_size(tile_size: int, tile_count: int, device, element_size: int) -> int:
+    """Number of tiles per forward that fits in free memory, assuming ~1024 activation values per input pixel (RRDB/DAT at 4x)."""
+
+    from backend import memory_management
+
+    per_tile = tile_size * tile_size * 1024 * element_size * 2
+    free = memory_management.get_free_memory(device)
+    return max(1, min(tile_count, 16, int(free * 0.5) // per_tile))
+
+
+def tiled_upscale_batched(
+    img: torch.Tensor,
+    model,
+    *,
+    tile_size: int,
+    tile_overlap: int,
+    device: torch.device,
+    scale: int = None,
+    feather: bool = True,
+    batch_size: int = 0,
+    output_device: torch.device = None,
+    output_dtype: torch.dtype = None,
+    desc="Tiled upscale",
+):
+    """
+    Tiled upscale of a BCHW tensor that stays in tensor space.
+
+    Tiles are cut with the same layout as `tiled_upscale_2`, run through the model `batch_size` tiles per forward
+    (0 = pick from free memory; halved on out-of-memory errors), and accumulated into the output with a weight map
+    that is computed once. `scale` is taken from the first model output if not given. Returns None if interrupted.
+    """
+    from backend import memory_management
+
+    b, c, h, w = img.size()
+    tile_size = min(tile_size, h, w)
+    output_device = output_device or device
+    output_dtype = output_dtype or img.dtype
+
+    positions = [(y, x) for y in tile_positions(h, tile_size, tile_overlap) for x in tile_positions(w, tile_size, tile_overlap)]
+
+    if batch_size <= 0:
+        batch_size = auto_tile_batch_size(tile_size, len(positions), device, img.element_size())
+
+    result = None
+    weights = None
+    weight_map = None
+
+    logger.debug("Upscaling %s with %d tiles of %d, %d per batch", img.shape, len(positions), tile_size, batch_size)
+    with tqdm.tqdm(total=len(positions), desc=desc, disable=not shared.opts.enable_upscale_progressbar) as pbar:
+        index = 0
+        while index < len(positions):
+            if shared.state.interrupted or shared.state.skipped:
+                return None
+
+            batch = positions[index:index + batch_size]
+            in_patch = torch.cat([img[..., y:y + tile_size, x:x + tile_size] for y, x in batch]).to(device=device)
+
+            try:
+                out_patch = model(in_patch)
+            except memory_management.OOM_EXCEPTION:
+                if batch_size == 1:
+                    raise
+                del in_patch
+                batch_size = max(1, batch_size // 2)
+                devices.torch_gc()
+                logger.debug("Out of memory, retrying with %d tiles per batch", batch_size)
+                continue
+
+            if result is None:
+                scale = scale or out_patch.shape[-1] // tile_size
+                result = torch.zeros(b, out_patch.shape[1], h * scale, w * scale, device=output_device, dtype=output_dtype)
+                weights = torch.zeros(1, 1, h * scale, w * scale, device=output_device, dtype=output_dtype)
+                weight_map = tile_weight_map(tile_size * scale, tile_overlap * scale, feather=feather, device=output_device, dtype=output_dtype)
+
+            out_patch = out_patch.to(device=output_device, dtype=output_dtype)
+            out_tile = tile_size * scale
+
+            for i, (y, x) in enumerate(batch):
+                ys, xs = y * scale, x * scale
+                result[..., ys:ys + out_tile, xs:xs + out_tile].addcmul_(out_patch[i * b:(i + 1) * b], weight_map)
+                weights[..., ys:ys + out_tile, xs:xs + out_tile].add_(weight_map)
+
+            index += len(batch)
+            pbar.update(len(batch))
+
+    return result.div_(weights)
+
+
 def upscale_with_model(
     model: Callable[[torch.Tensor], torch.Tensor],
     img: Image.Image,
@@ -62,30 +173,27 @@ def upscale_with_model(
         logger.debug("=> %s", output)
         return output
 
-    grid = images.split_grid(img, tile_size, tile_size, tile_overlap)
-    newtiles = []
-
-    with tqdm.tqdm(total=grid.tile_count, desc=desc, disable=not shared.opts.enable_upscale_progressbar) as p:
-        for y, h, row in grid.tiles:
-            newrow = []
-            for x, w, tile in row:
-                if shared.state.interrupted:
-                    return img
-                output = upscale_pil_patch(model, tile)
-                scale_factor = output.width // tile.width
-                newrow.append([x * scale_factor, w * scale_factor, output])
-                p.update(1)
-            newtiles.append([y * scale_factor, h * scale_factor, newrow])
-
-    newgrid = images.Grid(
-        newtiles,
-        tile_w=grid.tile_w * scale_factor,
-        tile_h=grid.tile_h * scale_factor,
-        image_w=grid.image_w * scale_factor,
-        image_h=grid.image_h * scale_factor,
-        overlap=grid.overlap * scale_factor,
-    )
-    return images.combine_grid(newgrid)
+    param = torch_utils.get_param(model)
+
+    with torch.inference_mode():
+        tensor = pil_image_to_torch_bgr(img).unsqueeze(0).to(dtype=param.dtype)
+        with devices.without_autocast():
+            output = tiled_upscale_batched(
+                tensor,
+                model,
+                tile_size=tile_size,
+                tile_overlap=tile_overlap,
+                device=param.device,
+                batch_size=shared.opts.upscaler_tile_batch_size,
+                output_device=devices.cpu,
+                output_dtype=torch.float32,
+                desc=desc,
+            )
+
+    if output is None:
+        return img
+
+    return torch_bgr_to_pil_image(output)
 
 
 def tiled_upscale_2(
@@ -99,9 +207,8 @@ def tiled_upscale_2(
     desc="Tiled upscale",
 ):
     # Alternative implementation of `upscale_with_model` originally used by
-    # SwinIR and ScuNET.  It differs from `upscale_with_model` in that tiling and
-    # weighting is done in PyTorch space, as opposed to `images.Grid` doing it in
-    # Pillow space without weighting.
+    # SwinIR and ScuNET.  Overlapping tiles are averaged with equal weights
+    # (no feathering), matching its original output.
 
     b, c, h, w = img.size()
     tile_size = min(tile_size, h, w)
@@ -110,54 +217,20 @@ def tiled_upscale_2(
         logger.debug("Upscaling %s without tiling", img.shape)
         return model(img)
 
-    stride = tile_size - tile_overlap
-    h_idx_list = list(range(0, h - tile_size, stride)) + [h - tile_size]
-    w_idx_list = list(range(0, w - tile_size, stride)) + [w - tile_size]
-    result = torch.zeros(
-        b,
-        c,
-        h * scale,
-        w * scale,
+    output = tiled_upscale_batched(
+        img,
+        model,
+        tile_size=tile_size,
+        tile_overlap=tile_overlap,
         device=device,
-        dtype=img.dtype,
+        scale=scale,
+        feather=False,
+        batch_size=shared.opts.upscaler_tile_batch_size,
+        desc=desc,
     )
-    weights = torch.zeros_like(result)
-    logger.debug("Upscaling %s to %s with tiles", img.shape, result.shape)
-    with tqdm.tqdm(total=len(h_idx_list) * len(w_idx_list), desc=desc, disable=not shared.opts.enable_upscale_progressbar) as pbar:
-        for h_idx in h_idx_list:
-            if shared.state.interrupted or shared.state.skipped:
-                break
-
-            for w_idx in w_idx_list:
-                if shared.state.interrupted or shared.state.skipped:
-                    break
-
-                # Only move this patch to the device if it's not already there.
-                in_patch = img[
-                    ...,
-                    h_idx : h_idx + tile_size,
-                    w_idx : w_idx + tile_size,
-                ].to(device=device)
-
-                out_patch = model(in_patch)
-
-                result[
-                    ...,
-                    h_idx * scale : (h_idx + tile_size) * scale,
-                    w_idx * scale : (w_idx + tile_size) * scale,
-                ].add_(out_patch)
-
-                out_patch_mask = torch.ones_like(out_patch)
-
-                weights[
-                    ...,
-                    h_idx * scale : (h_idx + tile_size) * scale,
-                    w_idx * scale : (w_idx + tile_size) * scale,
-                ].add_(out_patch_mask)
-
-                pbar.update(1)
 
-    output = result.div_(weights)
+    if output is None:
+        return torch.zeros(b, c, h * scale, w * scale, device=device, dtype=img.dtype)
 
     return output
 
@@ -0,0 +1,316 @@
+import json
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+re_lora = re.compile(r"<(?:lora|lyco):([^:>]+)", re.IGNORECASE)
+re_checkpoint_hash = re.compile(r"\s*\[[0-9a-fA-F]+\]$")
+
+routed_paths = ("/sdapi/v1/txt2img", "/sdapi/v1/img2img")
+broadcast_paths = ("/sdapi/v1/options", "/sdapi/v1/refresh-checkpoints", "/sdapi/v1/refresh-loras", "/sdapi/v1/refresh-vae", "/sdapi/v1/reload-checkpoint", "/sdapi/v1/unload-checkpoint")
+
+
+def checkpoint_name(title):
+    """'sub/model.safetensors [abcdef1234]' -> 'model.safetensors'; the hash is left out so titles and names match."""
+
+    if not title:
+        return None
+
+    return os.path.basename(re_checkpoint_hash.sub("", str(title)).replace("\\", "/")).lower()
+
+
+def request_affinity(payload):
+    """Checkpoint (None when the request does not override it) and the set of LoRAs a txt2img/img2img payload needs."""
+
+    override_settings = payload.get("override_settings") or {}
+    checkpoint = checkpoint_name(override_settings.get("sd_model_checkpoint"))
+
+    texts = [payload.get(key) or "" for key in ("prompt", "negative_prompt", "hr_prompt", "hr_negative_prompt")]
+    loras = frozenset(name.strip().lower() for text in texts for name in re_lora.findall(str(text)))
+
+    return checkpoint, loras
+
+
+class Worker:
+    """One device of the pool: the API address of its process, what it has loaded and how many requests it is running."""
+
+    def __init__(self, device, url=None):
+        self.device = device
+        self.url = url
+        self.process = None
+        self.checkpoint = None
+        self.loras = frozenset()
+        self.active = 0
+        self.completed = 0
+        self.healthy = True
+
+    def status(self):
+        return {
+            "device": self.device,
+            "url": self.url,
+            "checkpoint": self.checkpoint,
+            "loras": sorted(self.loras),
+            "active": self.active,
+            "completed": self.completed,
+            "healthy": self.healthy,
+        }
+
+
+class Router:
+    """
+    Picks the worker for a request by model affinity: a worker that already has the requested checkpoint loaded,
+    then the one with the most of the requested LoRAs and the fewest others, then the least loaded one.
+
+    Affinity only counts among workers within `max_queue_gap` requests of the least loaded worker, so a popular
+    checkpoint spreads to other devices instead of queueing behind one. The router tracks what each worker has
+    loaded from the requests it sent there; it does not touch devices, so it works with any device names. A request
+    that does not override the checkpoint runs with the pool's default one (`sd_model_checkpoint` from the workers'
+    options), so it is routed and tracked as a request for that checkpoint.
+    """
+
+    def __init__(self, workers, max_queue_gap=1):
+        self.workers = list(workers)
+        self.max_queue_gap = max_queue_gap
+        self.default_checkpoint = None
+        self.lock = threading.Lock()
+
+    def score(self, worker, checkpoint, loras):
+        same_checkpoint = checkpoint is None or worker.checkpoint == checkpoint
+        return same_checkpoint, len(loras & worker.loras), -len(worker.loras - loras), -worker.active
+
+    def choose(self, checkpoint, loras, exclude=()):
+        candidates = [x for x in self.workers if x.healthy and x not in exclude]
+        if not candidates:
+            raise RuntimeError("no healthy workers in the pool")
+
+        least_active = min(x.active for x in candidates)
+        candidates = [x for x in candidates if x.active <= least_active + self.max_queue_gap]
+
+        return max(candidates, key=lambda x: self.score(x, checkpoint, loras))
+
+    def acquire(self, checkpoint, loras, exclude=()):
+        with self.lock:
+            checkpoint = checkpoint or self.default_checkpoint
+            worker = self.choose(checkpoint, loras, exclude)
+            worker.active += 1
+
+            if checkpoint is not None:
+                worker.checkpoint = checkpoint
+            worker.loras = loras
+
+            return worker
+
+    def release(self, worker, ok=True):
+        with self.lock:
+            worker.active -= 1
+            if ok:
+                worker.completed += 1
+
+    def least_loaded(self):
+        with self.lock:
+            return self.choose(None, frozenset())
+
+    def set_checkpoint(self, checkpoint, workers=None):
+        """Records a change of the default checkpoint in the workers' options; those workers load it."""
+
+        with self.lock:
+            self.default_checkpoint = checkpoint_name(checkpoint)
+            for worker in workers or self.workers:
+                worker.checkpoint = self.default_checkpoint
+
+    def status(self):
+        with self.lock:
+            return [x.status() for x in self.workers]
+
+
+def worker_arguments(argv):
+    """Command line for the worker processes: the pool's own, minus the options the pool sets per worker."""
+
+    dropped_with_value = {"--worker-pool", "--port", "--gpu-device-id", "--device-id"}
+    dropped = {"--nowebui", "--api", "--autolaunch"}
+
+    res = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+
+        name = arg.split("=", 1)[0]
+        if name in dropped_with_value:
+            skip = "=" not in arg
+            continue
+
+        if name in dropped:
+            continue
+
+        res.append(arg)
+
+    return res
+
+
+class WorkerPool:
+    """
+    One API-only webui process per device (`--nowebui --gpu-device-id N`, on consecutive ports after the pool's),
+    behind a `Router`. Each process keeps the single-device model management of a normal instance.
+    """
+
+    def __init__(self, devices, port, argv, max_queue_gap=1):
+        self.port = port
+        self.argv = argv
+        self.router = Router([Worker(device, f"http://127.0.0.1:{port + 1 + i}") for i, device in enumerate(devices)], max_queue_gap=max_queue_gap)
+        self.stopping = False
+
+    def start(self):
+        launch_script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "launch.py")
+
+        for i, worker in enumerate(self.router.workers):
+            command = [sys.executable, launch_script, "--nowebui", "--port", str(self.port + 1 + i), "--gpu-device-id", str(worker.device), *self.argv]
+            print(f"Worker pool: starting worker for device {worker.device} on {worker.url}")
+            worker.process = subprocess.Popen(command)
+
+        threading.Thread(target=self.monitor, daemon=True).start()
+
+    def wait_ready(self, timeout=1800):
+        import requests
+
+        deadline = time.time() + timeout
+        pending = list(self.router.workers)
+
+        while pending and time.time() < deadline:
+            for worker in list(pending):
+                if worker.process is not None and worker.process.poll() is not None:
+                    print(f"Worker pool: worker for device {worker.device} exited with code {worker.process.returncode}")
+                    worker.healthy = False
+                    pending.remove(worker)
+                    continue
+
+                try:
+                    options = requests.get(f"{worker.url}/sdapi/v1/options", timeout=5).json()
+                except (requests.RequestException, ValueError):
+                    continue
+
+                self.router.set_checkpoint(options.get("sd_model_checkpoint"), [worker])
+                print(f"Worker pool: device {worker.device} ready with {worker.checkpoint}")
+                pending.remove(worker)
+
+            time.sleep(1)
+
+        for worker in pending:
+            print(f"Worker pool: device {worker.device} did not start in time")
+            worker.healthy = False
+
+    def monitor(self):
+        while not self.stopping:
+            for worker in self.router.workers:
+                if worker.healthy and worker.process is not None and worker.process.poll() is not None:
+                    print(f"Worker pool: worker for device {worker.device} exited with code {worker.process.returncode}")
+                    worker.healthy = False
+
+            time.sleep(5)
+
+    def stop(self):
+        self.stopping = True
+
+        for worker in self.router.workers:
+            if worker.process is not None and worker.process.poll() is None:
+                worker.process.terminate()
+
+        for worker in self.router.workers:
+            if worker.process is not None:
+                try:
+                    worker.process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    worker.process.kill()
+
+
+def create_app(router):
+    import requests
+    from fastapi import FastAPI, Request
+    from fastapi.responses import Response
+    from starlette.concurrency import run_in_threadpool
+
+    app = FastAPI()
+    session = requests.Session()
+
+    def forward_headers(request):
+        return {k: v for k, v in request.headers.items() if k.lower() in ("authorization", "content-type")}
+
+    def send(worker, method, path, request, body):
+        return session.request(method, f"{worker.url}{path}", params=request.query_params, data=body, headers=forward_headers(request), timeout=None)
+
+    def to_response(response):
+        return Response(content=response.content, status_code=response.status_code, media_type=response.headers.get("content-type"))
+
+    def run_routed(path, request, body, checkpoint, loras):
+        tried = []
+
+        while True:
+            worker = router.acquire(checkpoint, loras, exclude=tried)
+
+            try:
+                response = send(worker, "POST", path, request, body)
+            except requests.ConnectionError:
+                router.release(worker, ok=False)
+                worker.healthy = False
+                tried.append(worker)
+                continue
+
+            router.release(worker, ok=response.ok)
+
+            # 503: the worker's VRAM plan rejected the request; another device may have more free memory
+            tried.append(worker)
+            if response.status_code == 503 and any(x.healthy and x not in tried for x in router.workers):
+                continue
+
+            return response
+
+    @app.get("/sdapi/v1/pool")
+    def pool_status():
+        return router.status()
+
+    @app.api_route("/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+    async def proxy(path: str, request: Request):
+        path = f"/{path}"
+        body = await request.body()
+
+        if request.method == "POST" and path in routed_paths:
+            checkpoint, loras = request_affinity(json.loads(body or b"{}"))
+            return to_response(await run_in_threadpool(run_routed, path, request, body, checkpoint, loras))
+
+        if request.method != "GET" and path in broadcast_paths:
+            workers = [x for x in router.workers if x.healthy]
+            responses = [await run_in_threadpool(send, worker, request.method, path, request, body) for worker in workers]
+
+            if path == "/sdapi/v1/options":
+                checkpoint = json.loads(body or b"{}").get("sd_model_checkpoint")
+                if checkpoint:
+                    router.set_checkpoint(checkpoint, workers)
+
+            return to_response(next((x for x in responses if not x.ok), responses[0]))
+
+        worker = router.least_loaded()
+        return to_response(await run_in_threadpool(send, worker, request.method, path, request, body))
+
+    return app
+
+
+def main():
+    import uvicorn
+    from modules.launch_utils import args
+
+    devices = [x.strip() for x in args.worker_pool.split(",") if x.strip()]
+    port = args.port or 7860
+
+    pool = WorkerPool(devices, port, worker_arguments(sys.argv[1:]))
+    pool.start()
+
+    try:
+        pool.wait_ready()
+        print(f"Worker pool: routing requests on port {port} to {len([x for x in pool.router.workers if x.healthy])} workers")
+        uvicorn.run(create_app(pool.router), host=args.server_name or ("0.0.0.0" if args.listen else "127.0.0.1"), port=port, timeout_keep_alive=args.timeout_keep_alive)
+    finally:
+        pool.stop()
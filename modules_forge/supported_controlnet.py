@@ -25,6 +25,7 @@ class ControlModelPatcher:
         self.advanced_frame_weighting = None
         self.advanced_sigma_weighting = None
         self.advanced_mask_weighting = None
+        self.control_cache_options = None
 
     def process_after_running_preprocessors(self, process, params, *args, **kwargs):
         return
@@ -159,7 +160,8 @@ class ControlNetPatcher(ControlModelPatcher):
             negative_advanced_weighting=self.negative_advanced_weighting,
             advanced_frame_weighting=self.advanced_frame_weighting,
             advanced_sigma_weighting=self.advanced_sigma_weighting,
-            advanced_mask_weighting=self.advanced_mask_weighting
+            advanced_mask_weighting=self.advanced_mask_weighting,
+            control_cache_options=self.control_cache_options
         )
 
         process.sd_model.forge_objects.unet = unet
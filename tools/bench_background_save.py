@@ -0,0 +1,177 @@
+"""
+CPU benchmark for saving images in the background (`save_images_in_background`), with a tiny model.
+
+Runs the per-batch work of `process_images_inner` on the CPU with small torch stand-ins for the real models: sampling
+is `--steps` evaluations of a convolutional denoiser on the latent, decoding is a convolutional decoder that upsamples
+the latent 8x to pixels like the VAE, followed by the float -> uint8 -> PIL postprocess and PNG encoding with infotext
+plus the write. Sampling and decoding compete with saving for the same cores, as they would for the host side of a GPU
+run. Modes, each timed end to end:
+
+- inline: everything on the main thread, as with the option off;
+- background-save: encode/write on one worker thread, as `BackgroundImageSaver` does;
+- background-decode: decode, postprocess and saving of batch N on the worker while batch N+1 samples; the upper bound
+  of also overlapping the VAE decode, without the callback ordering and memory manager constraints of the real loop.
+
+    python tools/bench_background_save.py --batches 4 --batch-size 2 --size 512 --steps 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from PIL import Image, PngImagePlugin
+
+modes = ("inline", "background-save", "background-decode")
+
+
+class TinyDenoiser(torch.nn.Module):
+    def __init__(self, channels=4, width=64):
+        super().__init__()
+        self.net = torch.nn.Sequential(
+            torch.nn.Conv2d(channels, width, 3, padding=1), torch.nn.SiLU(),
+            torch.nn.Conv2d(width, width, 3, padding=1), torch.nn.SiLU(),
+            torch.nn.Conv2d(width, channels, 3, padding=1),
+        )
+
+    def forward(self, x):
+        return self.net(x)
+
+
+class TinyDecoder(torch.nn.Module):
+    def __init__(self, channels=4, width=32):
+        super().__init__()
+        layers = [torch.nn.Conv2d(channels, width, 3, padding=1), torch.nn.SiLU()]
+        for _ in range(3):
+            layers += [torch.nn.Upsample(scale_factor=2, mode="nearest"), torch.nn.Conv2d(width, width, 3, padding=1), torch.nn.SiLU()]
+        layers += [torch.nn.Conv2d(width, 3, 3, padding=1)]
+        self.net = torch.nn.Sequential(*layers)
+
+    def forward(self, x):
+        return torch.tanh(self.net(x))
+
+
+def sample(denoiser, generator, batch_size, size, steps):
+    x = torch.randn((batch_size, 4, size // 8, size // 8), generator=generator)
+    for _ in range(steps):
+        x = x - 0.05 * denoiser(x)
+
+    return x
+
+
+def decode(decoder, latent):
+    x_samples = decoder(latent).float()
+    return torch.clamp((x_samples + 1.0) / 2.0, min=0.0, max=1.0)
+
+
+def postprocess(x_sample):
+    x_sample = 255. * np.moveaxis(x_sample.cpu().numpy(), 0, 2)
+    return Image.fromarray(x_sample.astype(np.uint8))
+
+
+def write(image, filename, info):
+    pnginfo = PngImagePlugin.PngInfo()
+    pnginfo.add_text("parameters", info)
+    image.save(f"{filename}.tmp", format="PNG", pnginfo=pnginfo)
+    os.replace(f"{filename}.tmp", filename)
+
+
+class Timings:
+    def __init__(self):
+        self.sampling = 0.0
+        self.decode = 0.0
+        self.postprocess = 0.0
+        self.save = 0.0
+
+
+def run(args, outdir, mode):
+    torch.manual_seed(0)
+    denoiser = TinyDenoiser().eval()
+    decoder = TinyDecoder().eval()
+    generator = torch.Generator().manual_seed(0)
+    executor = ThreadPoolExecutor(max_workers=1) if mode != "inline" else None
+    pending = deque()
+    timings = Timings()
+
+    def decode_and_save(latent, n):
+        with torch.inference_mode():
+            for i, x_sample in enumerate(decode(decoder, latent)):
+                write(postprocess(x_sample), os.path.join(outdir, f"{mode}-{n:03}-{i:02}.png"), "benchmark")
+
+    def wait(limit):
+        while len(pending) > limit:
+            t = time.perf_counter()
+            for future in pending.popleft():
+                future.result()
+            timings.save += time.perf_counter() - t
+
+    start = time.perf_counter()
+    with torch.inference_mode():
+        for n in range(args.batches):
+            t = time.perf_counter()
+            latent = sample(denoiser, generator, args.batch_size, args.size, args.steps)
+            timings.sampling += time.perf_counter() - t
+
+            if mode == "background-decode":
+                pending.append([executor.submit(decode_and_save, latent, n)])
+                wait(1)
+                continue
+
+            t = time.perf_counter()
+            x_samples = decode(decoder, latent)
+            timings.decode += time.perf_counter() - t
+
+            current = []
+            for i, x_sample in enumerate(x_samples):
+                t = time.perf_counter()
+                image = postprocess(x_sample)
+                timings.postprocess += time.perf_counter() - t
+
+                filename = os.path.join(outdir, f"{mode}-{n:03}-{i:02}.png")
+                t = time.perf_counter()
+                if executor is None:
+                    write(image, filename, "benchmark")
+                else:
+                    current.append(executor.submit(write, image, filename, "benchmark"))
+                timings.save += time.perf_counter() - t
+
+            if executor is not None:
+                pending.append(current)
+                wait(1)
+
+    if executor is not None:
+        wait(0)
+        executor.shutdown(wait=True)
+
+    return time.perf_counter() - start, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--batches", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=2)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--steps", type=int, default=20, help="denoiser evaluations per batch")
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 = torch default)")
+    args = parser.parse_args()
+
+    if args.threads > 0:
+        torch.set_num_threads(args.threads)
+
+    images_count = args.batches * args.batch_size
+
+    with tempfile.TemporaryDirectory() as outdir:
+        for mode in modes:
+            total, t = run(args, outdir, mode)
+            per_image = [f"{name} {value / images_count * 1000:6.1f} ms" for name, value in (("decode", t.decode), ("postprocess", t.postprocess), ("saving", t.save))]
+            print(f"{mode:>17}: {total:6.2f}s total, {t.sampling:6.2f}s sampling; main thread per image: {', '.join(per_image)}")
+
+
+if __name__ == "__main__":
+    main()
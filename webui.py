@@ -58,6 +58,7 @@ def api_only_worker():
     script_callbacks.before_ui_callback()
     script_callbacks.app_started_callback(None, app)
 
+    timer.record_startup()
     print(f"Startup time: {startup_timer.summary()}.")
     api.launch(
         server_name=initialize_util.gradio_server_name(),
@@ -156,7 +157,7 @@ def webui_worker():
         with startup_timer.subcategory("app_started_callback"):
             script_callbacks.app_started_callback(shared.demo, app)
 
-        timer.startup_record = startup_timer.dump()
+        timer.record_startup()
         print(f"Startup time: {startup_timer.summary()}.")
 
         try: